@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+#
+#      bench_igslog.py
+#
+##BRIEF
+# bench_igslog.py measures the throughput of IGSLog.parse on a corpus of IGS log files
+#
+##AUTHOR
+# Ronni Grapenthin
+#
+##DATE
+# 2026-10-17
+#
+##DETAILS
+# Parses every log given on the command line (files or directories containing
+# *.log files) a number of times and reports logs/sec and lines/sec. If a
+# reference implementation of IGSLog.py is given (e.g., an older version pulled
+# out with `git show <rev>:classes/IGSLog.py > /tmp/IGSLog_ref.py'), the same
+# corpus is parsed with it too and the XML output of both is compared.
+#
+##CHANGELOG
+#
+###########################################################################
+
+import sys, getopt, os, glob, imp, time, tempfile
+from classes.IGSLog import IGSLog
+
+def usage():
+    print "Usage: bench_igslog.py [-h | --help] [-n | --repeat <N>] [-p | --per-log] [-r | --reference <IGSLog.py>] <log file | log dir> ...\n\
+bench_igslog.py, GPStools\n\n\
+Author: rn grapenthin, New Mexico Tech\n\n\
+OPTIONS:\n\
+   -h, --help\t\tprint this help\n\
+   -n, --repeat\t\tnumber of times each log is parsed (default: 10)\n\
+   -p, --per-log\t\treport parse time for each log\n\
+   -r, --reference\tIGSLog.py implementation to compare against\n\n\
+Report bugs to rg@nmt.edu\n\
+"
+
+def collect_logs(args):
+    logs = []
+    for a in args:
+        if os.path.isdir(a):
+            logs.extend(sorted(glob.glob(os.path.join(a, '*.log'))))
+        else:
+            logs.append(a)
+    return logs
+
+def site_of(log_file):
+    return os.path.basename(log_file)[:4].lower()
+
+def run(parser_class, logs, repeat):
+    '''
+        parses all logs `repeat' times, returns elapsed seconds
+    '''
+    start = time.time()
+    for i in range(repeat):
+        for l in logs:
+            log = parser_class(l, site_of(l))
+            log.parse()
+    return time.time() - start
+
+def run_per_log(parser_class, logs, repeat):
+    '''
+        parses each log `repeat' times, returns list of milliseconds per parse
+    '''
+    times = []
+    for l in logs:
+        times.append(1000.0*run(parser_class, [l], repeat)/repeat)
+    return times
+
+def to_xml(parser_class, log_file):
+    log = parser_class(log_file, site_of(log_file))
+    log.parse()
+
+    (fd, xml_file) = tempfile.mkstemp(suffix='.xml')
+    os.close(fd)
+    log.write(xml_file)
+
+    with open(xml_file, 'r') as f:
+        xml = f.read()
+    os.remove(xml_file)
+
+    return xml
+
+def report(name, elapsed, n_logs, n_lines):
+    print "%-12s %8.3f s %10.1f logs/s %12.1f lines/s" % (name, elapsed, n_logs/elapsed, n_lines/elapsed)
+
+############# ############# #############
+############# MAIN STUFF
+############# ############# #############
+
+if __name__ == '__main__':
+    try:
+        #":" and "=" indicate that these parameters take arguments! Do not simply delete these!
+        opts, args = getopt.getopt(sys.argv[1:], "hn:pr:",["help", "repeat=", "per-log", "reference="])
+    except getopt.GetoptError as e:
+        sys.stderr.write("Error: {0} \n\n".format(e.msg))
+        usage()
+        sys.exit(2)
+
+    repeat      = 10
+    reference   = None
+    per_log     = False
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage()
+            sys.exit(2)
+        elif opt in ("-n", "--repeat"):
+            repeat = int(arg)
+        elif opt in ("-p", "--per-log"):
+            per_log = True
+        elif opt in ("-r", "--reference"):
+            reference = arg
+        else:
+            assert False, "unhandled option: `%s'" % opt
+
+    logs = collect_logs(args)
+
+    if not logs:
+        sys.stderr.write("\nError: no IGS logs given.\n\n")
+        usage()
+        sys.exit(2)
+
+    n_lines = 0
+    for l in logs:
+        with open(l, 'r') as f:
+            n_lines += len(f.readlines())
+
+    print "Parsing %d logs (%d lines) %d times" % (len(logs), n_lines, repeat)
+
+    elapsed = run(IGSLog, logs, repeat)
+    report("current", elapsed, len(logs)*repeat, n_lines*repeat)
+
+    if reference:
+        ref_class = imp.load_source('IGSLog_reference', reference).IGSLog
+
+        ref_elapsed = run(ref_class, logs, repeat)
+        report("reference", ref_elapsed, len(logs)*repeat, n_lines*repeat)
+        print "speedup: %.2fx" % (ref_elapsed/elapsed)
+
+        #the output must not change
+        differ = [l for l in logs if to_xml(IGSLog, l) != to_xml(ref_class, l)]
+
+        for l in differ:
+            print "XML output differs for `%s'" % l
+
+        if differ:
+            sys.exit(1)
+
+        print "XML output identical for all %d logs" % len(logs)
+
+    if per_log:
+        times     = run_per_log(IGSLog, logs, repeat)
+        ref_times = run_per_log(ref_class, logs, repeat) if reference else [None]*len(logs)
+
+        print "\n%-40s %12s %12s" % ("log", "current/ms", "reference/ms" if reference else "")
+        for (l, t, r) in zip(logs, times, ref_times):
+            print "%-40s %12.3f %12s" % (os.path.basename(l), t, "%.3f" % r if r is not None else "")
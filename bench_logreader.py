@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+#
+#      bench_logreader.py
+#
+##BRIEF
+# bench_logreader.py compares XML_LogReader load times for XML logs and their JSON sidecars
+#
+##AUTHOR
+# Ronni Grapenthin
+#
+##DATE
+# 2026-10-17
+#
+##DETAILS
+# Copies one XML site log N times into a scratch directory (one file per
+# `station'), then loads all of them with XML_LogReader, first from the XML
+# and then with JSON sidecars in place. Run for several network sizes with,
+# e.g., -n 1000,10000.
+#
+##CHANGELOG
+#
+###########################################################################
+
+import sys, getopt, os, shutil, tempfile, time
+import xml.etree.ElementTree as ET
+from classes.XML_LogReader import XML_LogReader
+from classes.SiteLog import json_name, write_sidecar
+
+def usage():
+    print "Usage: bench_logreader.py [-h | --help] [-n | --stations <N[,N...]>] <site.xml>\n\
+bench_logreader.py, GPStools\n\n\
+Author: rn grapenthin, New Mexico Tech\n\n\
+OPTIONS:\n\
+   -h, --help\t\tprint this help\n\
+   -n, --stations\tcomma separated list of network sizes (default: 1000,10000)\n\n\
+Report bugs to rg@nmt.edu\n\
+"
+
+def load_all(xml_files, site):
+    start = time.time()
+    for x in xml_files:
+        log = XML_LogReader(x, site)
+        log.antennas()
+    return time.time() - start
+
+def report(name, n, elapsed):
+    print "%-6s %7d stations %9.3f s %10.3f ms/station" % (name, n, elapsed, 1000.0*elapsed/n)
+
+############# ############# #############
+############# MAIN STUFF
+############# ############# #############
+
+if __name__ == '__main__':
+    try:
+        #":" and "=" indicate that these parameters take arguments! Do not simply delete these!
+        opts, args = getopt.getopt(sys.argv[1:], "hn:",["help", "stations="])
+    except getopt.GetoptError as e:
+        sys.stderr.write("Error: {0} \n\n".format(e.msg))
+        usage()
+        sys.exit(2)
+
+    sizes = [1000, 10000]
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage()
+            sys.exit(2)
+        elif opt in ("-n", "--stations"):
+            sizes = [int(n) for n in arg.split(',')]
+        else:
+            assert False, "unhandled option: `%s'" % opt
+
+    if len(args) != 1 or not os.path.isfile(args[0]):
+        sys.stderr.write("\nError: need exactly one XML site log.\n\n")
+        usage()
+        sys.exit(2)
+
+    xml_log = args[0]
+    root    = ET.parse(xml_log).getroot()
+    site    = root.find('site-identification/site-id').text.lower()
+    scratch = tempfile.mkdtemp(prefix='bench_logreader_')
+
+    try:
+        for n in sizes:
+            xml_files = []
+            for i in range(n):
+                x = os.path.join(scratch, "s%06d.xml" % i)
+                shutil.copyfile(xml_log, x)
+                xml_files.append(x)
+
+            report("xml", n, load_all(xml_files, site))
+
+            for x in xml_files:
+                write_sidecar(x, root)
+
+            report("json", n, load_all(xml_files, site))
+
+            for x in xml_files:
+                os.remove(x)
+                os.remove(json_name(x))
+    finally:
+        shutil.rmtree(scratch)
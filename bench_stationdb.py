@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+#
+#      bench_stationdb.py
+#
+##BRIEF
+# bench_stationdb.py compares StationDB lookup latency against the old grep-per-lookup path
+#
+##AUTHOR
+# Ronni Grapenthin
+#
+##DATE
+# 2026-10-17
+#
+##DETAILS
+# Draws N (site, session) pairs from the given station.info, looks each of them
+# up the way StationDB.get_record used to (grep subprocess, parse all matching
+# lines, linear scan), with the in-memory index, and with the memory-mapped
+# offset index, one at a time and as a batch (get_records), and checks that
+# all of them find the same record.
+#
+##CHANGELOG
+#
+###########################################################################
+
+import sys, getopt, os, random, subprocess, time
+import datetime as DT
+from classes.StationDB import StationDB, MappedStationDB, StationRecord
+
+def usage():
+    print "Usage: bench_stationdb.py [-h | --help] [-n | --lookups <N>] <station.info>\n\
+bench_stationdb.py, GPStools\n\n\
+Author: rn grapenthin, New Mexico Tech\n\n\
+OPTIONS:\n\
+   -h, --help\t\tprint this help\n\
+   -n, --lookups\tnumber of lookups (default: 1000)\n\n\
+Report bugs to rg@nmt.edu\n\
+"
+
+def grep_record(sta_db, site_id, start_time, end_time):
+    '''
+        StationDB.get_record before the index
+    '''
+    p1          = subprocess.Popen(["grep", "^ "+site_id, sta_db], stdout=subprocess.PIPE)
+    output,err  = p1.communicate()
+
+    for l in output.splitlines():
+        rec  = StationRecord(l)
+
+        if start_time >= rec.sess_start and end_time <= rec.sess_end:
+            return rec
+
+def report(name, n, elapsed):
+    print "%-6s %7d lookups %9.3f s %10.3f ms/lookup" % (name, n, elapsed, 1000.0*elapsed/n)
+
+############# ############# #############
+############# MAIN STUFF
+############# ############# #############
+
+if __name__ == '__main__':
+    try:
+        #":" and "=" indicate that these parameters take arguments! Do not simply delete these!
+        opts, args = getopt.getopt(sys.argv[1:], "hn:",["help", "lookups="])
+    except getopt.GetoptError as e:
+        sys.stderr.write("Error: {0} \n\n".format(e.msg))
+        usage()
+        sys.exit(2)
+
+    lookups = 1000
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage()
+            sys.exit(2)
+        elif opt in ("-n", "--lookups"):
+            lookups = int(arg)
+        else:
+            assert False, "unhandled option: `%s'" % opt
+
+    if len(args) != 1 or not os.path.isfile(args[0]):
+        sys.stderr.write("\nError: need exactly one station.info.\n\n")
+        usage()
+        sys.exit(2)
+
+    #StationDB looks for station.info in GIPSY_STA_INFO
+    os.environ['GIPSY_STA_INFO'] = os.path.dirname(os.path.abspath(args[0]))
+    sta_db = os.environ['GIPSY_STA_INFO']+'/station.info'
+
+    start = time.time()
+    db    = StationDB()
+    print "load   %d sites, %d records in %.3f s" % \
+            (len(db.lines), sum(len(l) for l in db.lines.values()), time.time()-start)
+
+    #a day in the middle of random sessions
+    sessions = [StationRecord(l) for lines in db.lines.values() for l in lines]
+    queries  = []
+    for rec in (random.choice(sessions) for i in range(lookups)):
+        t = rec.sess_start + (min(rec.sess_end, DT.datetime.utcnow()) - rec.sess_start) / 2
+        queries.append((rec.site_id, t, t + DT.timedelta(hours=23, minutes=59)))
+
+    start  = time.time()
+    ref    = [grep_record(sta_db, *q) for q in queries]
+    report("grep", lookups, time.time()-start)
+
+    start  = time.time()
+    found  = [db.get_record(*q) for q in queries]
+    report("index", lookups, time.time()-start)
+
+    start  = time.time()
+    batch  = db.get_records(queries)
+    report("batch", lookups, time.time()-start)
+
+    start  = time.time()
+    mdb    = MappedStationDB()
+    print "load   %d sites mapped in %.3f s" % (len(mdb.offsets), time.time()-start)
+
+    start  = time.time()
+    mapped = [mdb.get_record(*q) for q in queries]
+    report("mmap", lookups, time.time()-start)
+
+    start  = time.time()
+    mbatch = mdb.get_records(queries)
+    report("mbatch", lookups, time.time()-start)
+    mdb.close()
+
+    for (name, recs) in (("index", found), ("batch", batch), ("mmap", mapped), ("mbatch", mbatch)):
+        differ = sum(1 for (a, b) in zip(ref, recs) if (a.line if a else None) != (b.line if b else None))
+        print "%-6s %d of %d lookups differ from grep" % (name, differ, lookups)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+#
+#      bench_stationrecord.py
+#
+##BRIEF
+# bench_stationrecord.py measures construction time and memory of StationRecords
+#
+##AUTHOR
+# Ronni Grapenthin
+#
+##DATE
+# 2026-10-17
+#
+##DETAILS
+# Builds StationRecords for N record lines of a station.info (lines are repeated
+# if the file has fewer), once touching only the session dates and once all
+# fields, and reports the size of a record including what it references. If a
+# reference implementation of StationDB.py is given (e.g., an older version
+# pulled out with `git show <rev>:classes/StationDB.py > /tmp/StationDB_ref.py'),
+# its StationRecord is measured too.
+#
+##CHANGELOG
+#
+###########################################################################
+
+import sys, getopt, os, imp, time
+from classes.StationDB import StationRecord
+
+def usage():
+    print "Usage: bench_stationrecord.py [-h | --help] [-n | --lines <N>] [-r | --reference <StationDB.py>] <station.info>\n\
+bench_stationrecord.py, GPStools\n\n\
+Author: rn grapenthin, New Mexico Tech\n\n\
+OPTIONS:\n\
+   -h, --help\t\tprint this help\n\
+   -n, --lines\t\tnumber of records (default: 100000)\n\
+   -r, --reference\tStationDB.py implementation to compare against\n\n\
+Report bugs to rg@nmt.edu\n\
+"
+
+fields = ('site_id', 'site_name', 'ant_ht', 'ht_code', 'ant_north', 'ant_east', 'rcx_type', 'rcx_sn',
+          'ant_type', 'ant_dome', 'ant_sn', 'operator', 'agency')
+
+def build(record_class, lines, touch_all):
+    start = time.time()
+    recs  = []
+    for l in lines:
+        rec = record_class(l)
+        if touch_all:
+            for f in fields:
+                getattr(rec, f)
+        recs.append(rec)
+    return (time.time() - start, recs)
+
+def size_of(rec, seen):
+    '''
+        bytes of the record, its __dict__ and the values it holds that haven't
+        been counted yet (the line is shared by both implementations, not counted)
+    '''
+    size    = sys.getsizeof(rec)
+    values  = []
+
+    if hasattr(rec, '__dict__'):
+        size   += sys.getsizeof(rec.__dict__)
+        values += [v for (k, v) in rec.__dict__.items() if k != 'line']
+
+    for slot in getattr(type(rec), '__slots__', ()):
+        if slot != 'line' and hasattr(rec, slot):
+            values.append(getattr(rec, slot))
+
+    for v in values:
+        if id(v) not in seen:
+            seen.add(id(v))
+            size += sys.getsizeof(v)
+
+    return size
+
+def measure(name, record_class, lines):
+    for touch_all in (False, True):
+        (elapsed, recs) = build(record_class, lines, touch_all)
+        seen = set()
+        size = sum(size_of(r, seen) for r in recs)
+
+        print "%-9s %-6s %7d records %8.3f s %8.2f us/record %7.1f bytes/record" % \
+                (name, "all" if touch_all else "dates", len(recs), elapsed, 1e6*elapsed/len(recs), float(size)/len(recs))
+
+############# ############# #############
+############# MAIN STUFF
+############# ############# #############
+
+if __name__ == '__main__':
+    try:
+        #":" and "=" indicate that these parameters take arguments! Do not simply delete these!
+        opts, args = getopt.getopt(sys.argv[1:], "hn:r:",["help", "lines=", "reference="])
+    except getopt.GetoptError as e:
+        sys.stderr.write("Error: {0} \n\n".format(e.msg))
+        usage()
+        sys.exit(2)
+
+    n_lines     = 100000
+    reference   = None
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage()
+            sys.exit(2)
+        elif opt in ("-n", "--lines"):
+            n_lines = int(arg)
+        elif opt in ("-r", "--reference"):
+            reference = arg
+        else:
+            assert False, "unhandled option: `%s'" % opt
+
+    if len(args) != 1 or not os.path.isfile(args[0]):
+        sys.stderr.write("\nError: need exactly one station.info.\n\n")
+        usage()
+        sys.exit(2)
+
+    with open(args[0], 'r') as f:
+        records = [l.rstrip('\r\n') for l in f if l.startswith(' ') and l.strip()]
+
+    if not records:
+        sys.stderr.write("\nError: no records in `"+args[0]+"'.\n\n")
+        sys.exit(2)
+
+    lines = (records * (n_lines/len(records) + 1))[:n_lines]
+
+    measure("current", StationRecord, lines)
+
+    if reference:
+        measure("reference", imp.load_source('StationDB_ref', reference).StationRecord, lines)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+#
+#      bench_teqc.py
+#
+##BRIEF
+# bench_teqc.py measures wall time and bytes written of Teqc.translate
+#
+##AUTHOR
+# Ronni Grapenthin
+#
+##DATE
+# 2026-10-17
+#
+##DETAILS
+# Translates a raw file into a scratch directory a number of times and reports
+# wall time and the bytes written to disk by this process and its children
+# (write_bytes in /proc/self/io, Linux only). If a reference implementation of
+# Teqc.py is given (e.g., an older version pulled out with
+# `git show <rev>:classes/Teqc.py > /tmp/Teqc_ref.py'), it is measured too.
+# The station record comes from station.info in GIPSY_STA_INFO.
+#
+##CHANGELOG
+#
+###########################################################################
+
+import sys, getopt, os, imp, shutil, tempfile, time
+import util.constants as const
+from classes.Teqc import Teqc
+from classes.StationDB import StationDB
+
+def usage():
+    print "Usage: bench_teqc.py [-h | --help] [-n | --repeat <N>] [-r | --reference <Teqc.py>] -s <site-id> <raw file>\n\
+bench_teqc.py, GPStools\n\n\
+Author: rn grapenthin, New Mexico Tech\n\n\
+OPTIONS:\n\
+   -h, --help\t\tprint this help\n\
+   -n, --repeat\t\tnumber of translations (default: 3)\n\
+   -s, --site\t\t4-char site id\n\
+   -r, --reference\tTeqc.py implementation to compare against\n\n\
+Report bugs to rg@nmt.edu\n\
+"
+
+def bytes_written():
+    with open('/proc/self/io', 'r') as f:
+        for l in f:
+            if l.startswith('write_bytes'):
+                return int(l.split()[1])
+    return 0
+
+def measure(name, teqc_class, raw_file, rec, repeat):
+    scratch = tempfile.mkdtemp(prefix='bench_teqc_')
+    cwd     = os.getcwd()
+    raw     = os.path.abspath(raw_file)
+    elapsed = 0.0
+    written = 0
+
+    try:
+        os.chdir(scratch)
+
+        for i in range(repeat):
+            teqc = teqc_class(raw)
+            teqc.meta()
+
+            start   = time.time()
+            before  = bytes_written()
+
+            teqc.translate(rec)
+
+            #make sure everything has hit the page cache
+            os.system('sync')
+
+            written += bytes_written() - before
+            elapsed += time.time() - start
+
+            for f in os.listdir(scratch):
+                os.remove(f)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(scratch)
+
+    print "%-9s %3d translations %8.3f s/file %12d bytes written/file" % (name, repeat, elapsed/repeat, written/repeat)
+
+############# ############# #############
+############# MAIN STUFF
+############# ############# #############
+
+if __name__ == '__main__':
+    try:
+        #":" and "=" indicate that these parameters take arguments! Do not simply delete these!
+        opts, args = getopt.getopt(sys.argv[1:], "hn:s:r:",["help", "repeat=", "site=", "reference="])
+    except getopt.GetoptError as e:
+        sys.stderr.write("Error: {0} \n\n".format(e.msg))
+        usage()
+        sys.exit(2)
+
+    repeat      = 3
+    site_id     = None
+    reference   = None
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage()
+            sys.exit(2)
+        elif opt in ("-n", "--repeat"):
+            repeat = int(arg)
+        elif opt in ("-s", "--site"):
+            site_id = arg.upper()
+        elif opt in ("-r", "--reference"):
+            reference = arg
+        else:
+            assert False, "unhandled option: `%s'" % opt
+
+    if len(args) != 1 or not os.path.isfile(args[0]) or not site_id:
+        sys.stderr.write("\nError: need a site id and exactly one raw file.\n\n")
+        usage()
+        sys.exit(2)
+
+    meta = Teqc(args[0]).meta()
+    rec  = StationDB().get_record(site_id, meta[const.TEQC_f_start], meta[const.TEQC_f_end])
+    rec.calculate_vertical_antenna_height()
+
+    measure("current", Teqc, args[0], rec, repeat)
+
+    if reference:
+        measure("reference", imp.load_source('Teqc_ref', reference).Teqc, args[0], rec, repeat)
@@ -0,0 +1,170 @@
+#####################################################################################
+# AntennaHeight.py part of GPStools
+#
+# Converts measured antenna heights (slant or to some point of the antenna other
+# than the ARP) to vertical heights to the antenna reference point, in process,
+# instead of running slant2vert_height.sh for each record.
+#
+# author:   Ronni Grapenthin
+#           Dept. Earth and Environmental Science
+#           New Mexico Tech
+#           801 Leroy Place
+#           Socorro, NM-87801
+#
+# email:    rg@nmt.edu
+#
+#####################################################################################
+
+import os
+import math
+import subprocess
+
+def script_vertical_height(ant_ht, ant_type, ht_code):
+    '''
+        vertical height from slant2vert_height.sh, ValueError if it gives none
+    '''
+    p1 = subprocess.Popen(["slant2vert_height.sh", "%s" % ant_ht, ant_type, ht_code], stdout=subprocess.PIPE)
+    (output, err) = p1.communicate()
+
+    try:
+        return float(output)
+    except ValueError:
+        raise ValueError("slant2vert_height.sh gave no height for %s %s %s" % (ant_ht, ant_type, ht_code))
+
+class AntennaHeights(object):
+    '''
+        Conversion table, one line per antenna type and height code:
+
+* Antenna Type    HtCod   Radius   Offset
+ TRM29659.00      SLBCR   0.1905  -0.0350
+ TRM29659.00      DHBCR   0.0000   0.0000
+
+        Lines starting with `*' are comments. For a measured height h the
+        vertical height to the ARP is
+
+            sqrt(h^2 - radius^2) + offset
+
+        i.e., radius is the horizontal distance from the point the slant is
+        measured to (e.g., the edge of the ground plane) to the antenna axis, and
+        offset the vertical distance from that point to the ARP. Vertical height
+        codes have radius 0. DHARP heights are vertical to the ARP already and
+        need no entry.
+
+        The table is read from antenna_heights.dat in GIPSY_STA_INFO unless a file
+        is given. Results are memoized on (height, antenna type, height code).
+    '''
+
+    table_file  = None
+    table       = {}                #(antenna type, height code) -> (radius, offset)
+    memo        = {}                #(height, antenna type, height code) -> vertical height
+
+    #one instance (or the error reading it) per table file, see default()
+    loaded      = {}
+
+    def __init__(self, table_file=None):
+        if table_file is None:
+            table_file = os.environ.get('GIPSY_STA_INFO', '.')+'/antenna_heights.dat'
+
+        self.table_file = table_file
+        self.table      = self.load(table_file)
+        self.memo       = {}
+
+    @classmethod
+    def default(cls, table_file=None):
+        '''
+            shared instance for table_file (default table if None), so that the
+            table is read and the memo filled once per process. A missing or
+            malformed table raises IOError or ValueError, every time, but is
+            only read once.
+        '''
+        if table_file not in cls.loaded:
+            try:
+                cls.loaded[table_file] = cls(table_file)
+            except (IOError, ValueError) as e:
+                cls.loaded[table_file] = e
+
+        if isinstance(cls.loaded[table_file], Exception):
+            raise cls.loaded[table_file]
+
+        return cls.loaded[table_file]
+
+    def load(self, table_file):
+        table = {}
+
+        with open(table_file, 'r') as f:
+            for l in f:
+                if l.startswith('*') or not l.strip():
+                    continue
+
+                try:
+                    (ant_type, ht_code, radius, offset) = l.split()[:4]
+                    table[(ant_type, ht_code)] = (float(radius), float(offset))
+                except ValueError:
+                    raise ValueError("Malformed line in `%s': `%s'" % (table_file, l.rstrip()))
+
+        return table
+
+    def covers(self, ant_type, ht_code):
+        '''
+            True if vertical() can convert heights of ant_type and ht_code
+        '''
+        return ht_code == "DHARP" or (ant_type, ht_code) in self.table
+
+    def parameters(self, ant_type, ht_code):
+        try:
+            return self.table[(ant_type, ht_code)]
+        except KeyError:
+            raise ValueError("No conversion for antenna type `%s' with height code `%s' in `%s'" %
+                                (ant_type, ht_code, self.table_file))
+
+    def vertical(self, ant_ht, ant_type, ht_code):
+        '''
+            vertical height to the ARP for a measured height, ValueError if the
+            table has no entry for ant_type and ht_code
+        '''
+        if ht_code == "DHARP":
+            return ant_ht
+
+        key = (ant_ht, ant_type, ht_code)
+
+        try:
+            return self.memo[key]
+        except KeyError:
+            pass
+
+        (radius, offset) = self.parameters(ant_type, ht_code)
+
+        if ant_ht < radius:
+            raise ValueError("Height %.4f shorter than radius %.4f of `%s' (%s)" % (ant_ht, radius, ant_type, ht_code))
+
+        vert = self.memo[key] = math.sqrt(ant_ht*ant_ht - radius*radius) + offset
+
+        return vert
+
+    def vertical_array(self, ant_ht, ant_type, ht_code):
+        '''
+            vertical heights for arrays of heights, antenna types and height codes
+            (e.g., columns of StationTable.sessions), as float64 array. Each
+            distinct (type, code) pair is looked up once.
+        '''
+        #numpy is only needed here, not for single records
+        import numpy as np
+
+        ant_ht      = np.asarray(ant_ht, dtype=np.float64)
+        pairs       = np.rec.fromarrays([np.asarray(ant_type), np.asarray(ht_code)])
+        (keys, inv) = np.unique(pairs, return_inverse=True)
+
+        radius = np.zeros(len(keys))
+        offset = np.zeros(len(keys))
+
+        for (i, (t, c)) in enumerate(keys):
+            if c != "DHARP":
+                (radius[i], offset[i]) = self.parameters(t, c)
+
+        radius = radius[inv]
+        offset = offset[inv]
+
+        if np.any(ant_ht < radius):
+            raise ValueError("Heights shorter than antenna radius in %d records" % np.sum(ant_ht < radius))
+
+        return np.sqrt(ant_ht*ant_ht - radius*radius) + offset
@@ -0,0 +1,139 @@
+#####################################################################################
+# FileCache.py part of GPStools
+#
+# On-disk least recently used cache, one file per entry. Base of MetaCache and
+# LogCache, which say what the entries are.
+#
+# author:   Ronni Grapenthin
+#           Dept. Earth and Environmental Science
+#           New Mexico Tech
+#           801 Leroy Place
+#           Socorro, NM-87801
+#
+# email:    rg@nmt.edu
+#
+#####################################################################################
+
+import os
+import tempfile
+import time
+
+class FileCache(object):
+    '''
+        Entries are files in cache_dir, touched when used. evict() removes
+        entries that haven't been used for max_age_days and then the least
+        recently used ones until the cache is smaller than max_size_mb. Without
+        cache_dir the cache is disabled and never hits.
+
+        Several processes may use the same directory at once: entries are
+        written to temporary files (*.tmp, left alone by evict()) that are
+        renamed into place, so that readers never see a partial entry, and an
+        entry another process evicts in the meantime is simply a miss.
+    '''
+
+    name        = 'Cache'           #for summary()
+    cache_dir   = None
+    max_bytes   = 0
+    max_age     = 0
+    hits        = 0
+    misses      = 0
+
+    def __init__(self, cache_dir, max_size_mb, max_age_days):
+        self.cache_dir  = cache_dir
+        self.max_bytes  = max_size_mb*1024*1024
+        self.max_age    = max_age_days*86400
+        self.hits       = 0
+        self.misses     = 0
+
+        if self.cache_dir and not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def enabled(self):
+        return bool(self.cache_dir)
+
+    def touch(self, path):
+        '''
+            marks the entry at path as recently used, False if there is none
+        '''
+        try:
+            os.utime(path, None)
+        except OSError:
+            return False
+
+        return True
+
+    def write(self, path, write):
+        '''
+            stores the entry at path, write(f) writes its content to the open
+            (binary) file f
+        '''
+        (fd, tmp_file) = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+
+            os.rename(tmp_file, path)
+        except:
+            os.remove(tmp_file)
+            raise
+
+    def record(self, hit):
+        '''
+            counts a lookup. Pool workers count into their own copy of the cache,
+            so batches count the hits their jobs report here instead.
+        '''
+        if hit:
+            self.hits   += 1
+        else:
+            self.misses += 1
+
+    def evict(self):
+        '''
+            removes stale entries and then the least recently used ones until
+            the cache fits into max_size_mb, returns number of removed entries
+        '''
+        if not self.enabled():
+            return 0
+
+        now     = time.time()
+        entries = []
+        removed = 0
+
+        for f in os.listdir(self.cache_dir):
+            if f.endswith('.tmp'):
+                continue
+
+            path = os.path.join(self.cache_dir, f)
+
+            try:
+                st = os.stat(path)
+
+                if now - st.st_mtime > self.max_age:
+                    os.remove(path)
+                    removed += 1
+                else:
+                    entries.append((st.st_mtime, st.st_size, path))
+            except OSError:
+                continue
+
+        size = sum(e[1] for e in entries)
+
+        for (mtime, fsize, path) in sorted(entries):
+            if size <= self.max_bytes:
+                break
+
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+
+            size    -= fsize
+
+        return removed
+
+    def summary(self):
+        total = self.hits + self.misses
+        return "%s: %d hits, %d misses (%.1f%% hit rate)" % \
+                    (self.name, self.hits, self.misses, 100.0*self.hits/total if total else 0.0)
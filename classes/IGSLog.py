@@ -15,10 +15,17 @@
 #####################################################################################
 
 import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
 from datetime import datetime
+import itertools
+
+from classes.SiteLog import SiteLog
 
 class IGSLog(object):
 
+    #bump when the XML written for a log changes, invalidates LogCache entries
+    format_version  = 1
+
     #XML sub-section (and some sub-subsection) tags
     form            = "form"
     siteid          = "site-identification"
@@ -177,12 +184,48 @@ class IGSLog(object):
 
     #list containing tags that allow for multi-line input
     multiple_lines = ['distance-activity', 'add-info', 'notes', 'other-instrumentation', 'mailing-address', 'antenna-graphics']
-    
+
+    #This maps the section numbers at the beginning of a line to
+    #   (section tag, subsection tag, useless indents, field of the section info)
+    #a subsection of None keeps the current subsection. The field gives the
+    #number of '.' to skip to get to the info string (8.1.x has one more).
+    section_headers = { "0. "   : (form,       None,           False, 1),
+                        "1. "   : (siteid,     None,           False, 1),
+                        "2. "   : (location,   None,           False, 1),
+                        "3."    : (receivers,  receiver,       False, 1),
+                        "4."    : (antennas,   antenna,        False, 1),
+                        "5."    : (ties,       tie,            False, 1),
+                        "6."    : (freq,       standard,       True,  1),
+                        "7."    : (colocs,     coloc,          True,  1),
+                        "8. "   : (mets,       None,           True,  1),
+                        "8.1"   : (mets,       met_humid,      True,  2),
+                        "8.2"   : (mets,       met_press,      True,  2),
+                        "8.3"   : (mets,       met_temp,       True,  2),
+                        "8.4"   : (mets,       met_vapor,      True,  2),
+                        "8.5"   : (mets,       met_other,      True,  2),
+                        "9. "   : (conds,      None,           True,  1),
+                        "9.1"   : (conds,      cond_interfere, True,  2),
+                        "9.2"   : (conds,      cond_multipath, True,  2),
+                        "9.3"   : (conds,      cond_signal,    True,  2),
+                        "10."   : (ep_effects, ep_effect,      False, 1),
+                        "11. "  : (poc,        None,           False, 1),
+                        "12. "  : (agency,     None,           False, 1),
+                        "13. "  : (more,       None,           False, 1),
+                      }
+
+    #lengths of the keys above, none of the keys is a prefix of another one
+    #so the order in which we try them doesn't matter
+    section_header_lengths = (3, 2, 4)
+
     #class variables
-    lines           = None              #contains the full IGS log in ASCII format
+    lines           = None              #contains the full IGS log in ASCII format (or a file object)
+    site_id         = None              #4-char id of this log, siteid is the section tag
+    remaining       = None              #lines after this log in a multi-site stream
     root            = None              #root node of XML-DOM
     section         = ''                #tag name for current section
     subsection      = ''                #... and subsection
+    section_node    = None              #DOM node of current section
+    subsection_node = None              #... and the last subsection added to it
     indent_level    = 1                 #current level of indentations
     addtosubnode    = False             
     skip_section    = False
@@ -191,10 +234,19 @@ class IGSLog(object):
                                         #need a flag for that.
     
     def __init__(self, file_name, siteid):
-        with open(file_name, 'r') as f: 
-            self.lines  = f.readlines()
-            
-        self.root   = ET.Element('igs-log', attrib={'site-id':siteid})
+        #file objects (gzip streams, pipes, ...) or any other iterable
+        #over the lines are read lazily while parsing
+        if isinstance(file_name, basestring):
+            with open(file_name, 'r') as f: 
+                self.lines  = f.readlines()
+        else:
+            self.lines  = file_name
+
+        self.site_id    = siteid
+        self.root       = ET.Element('igs-log', attrib={'site-id':siteid})
+
+        #section tag -> section node in DOM, saves searching the tree for each line
+        self.section_nodes = {}
 
     def reset_section_vars(self):
         self.skip_section = False
@@ -213,161 +265,117 @@ class IGSLog(object):
         u.text = url
         d.text = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
         l.text = local_log
-        
+
+    def section_header(self, line):
+        '''
+            returns the entry of section_headers if line starts a
+            (sub)section, None otherwise
+        '''
+        #section numbers are never indented
+        if not line[:1].isdigit():
+            return None
+
+        for n in self.section_header_lengths:
+            header = self.section_headers.get(line[:n])
+            if header is not None:
+                return header
+
+        return None
+
            
+    def starts_log(self, line, header):
+        '''
+            True if line is the title or form section of a log, i.e., 
+            the beginning of the next log in a multi-site stream
+        '''
+        return (header is not None and header[0] == self.form) or "Site Information Form" in line
+
+    def flush_section(self, on_section):
+        '''
+            hands the current (complete) section to on_section and drops it from the DOM
+        '''
+        if self.section_node is None:
+            return
+
+        self.root.remove(self.section_node)
+        del self.section_nodes[self.section]
+        on_section(self.section_node)
+
+        self.section_node    = None
+        self.subsection_node = None
+        self.current_node    = None
+
     #this is still in the long form and can probably be shortened, for now
     #we'll keep it in a running version
-    def parse(self):
+    def parse(self, on_section=None):
+        '''
+            builds the DOM from the lines of the log. If on_section is given, each 
+            top-level section is passed to it as soon as it is complete and dropped 
+            from the DOM afterwards. In that mode parsing stops at the start of the 
+            next log; the lines left over are in self.remaining.
+        '''
         self.section        = ''
         self.indent         = 1
         self.parent         = self.root
-        
-        for line in (l for l in self.lines if len(l.strip()) > 1):
-            
+        self.section_node   = None
+        self.remaining      = iter([])
+
+        lines = iter(self.lines)
+
+        for line in lines:
+            if len(line.strip()) <= 1:
+                continue
+
             #decide on which section / subsection we're in for this line
             #(re)set the section variables accordingly
             #
             # NOTE: PAY ATTENTION TO THE FACT THAT SUBSECTIONS OPERATE ON
             #       SHIFTED FIELD NUMBERS. THAT'S IMPORTANT!
-            if   line.startswith("0. "):
-                self.reset_section_vars()
-                self.section = self.form
-                info    = ".".join(line.split('.')[1:]).strip()
-            elif line.startswith("1. "):
-                self.reset_section_vars()
-                self.section      = self.siteid
-                info    = ".".join(line.split('.')[1:]).strip()
-            elif line.startswith("2. "):
-                self.reset_section_vars()
-                self.section      = self.location
-                info    = ".".join(line.split('.')[1:]).strip()
-            elif line.startswith("3."):
-                self.reset_section_vars()
-                self.section      = self.receivers
-                self.subsection   = self.receiver
-                info    = ".".join(line.split('.')[1:]).strip()
-            elif line.startswith("4."):
-                self.reset_section_vars()
-                self.section      = self.antennas
-                self.subsection   = self.antenna
-                info    = ".".join(line.split('.')[1:]).strip()
-            elif line.startswith("5."):
-                self.reset_section_vars()
-                self.section      = self.ties
-                self.subsection   = self.tie
-                info    = ".".join(line.split('.')[1:]).strip()
-            elif line.startswith("6."):
-                self.reset_section_vars()
-                self.section = self.freq
-                self.subsection = self.standard
-                self.useless_indents = True
-                info    = ".".join(line.split('.')[1:]).strip()
-            elif line.startswith("7."):
-                self.reset_section_vars()
-                self.section = self.colocs
-                self.subsection = self.coloc
-                self.useless_indents = True
-                info    = ".".join(line.split('.')[1:]).strip()
-            elif line.startswith("8. "):
-                self.reset_section_vars()
-                self.section = self.mets
-                self.useless_indents = True                
-                info    = ".".join(line.split('.')[1:]).strip()
-            elif line.startswith("8.1"):
-                self.reset_section_vars()
-                self.section = self.mets
-                self.subsection = self.met_humid
-                self.useless_indents = True         
-                info    = ".".join(line.split('.')[2:]).strip()
-            elif line.startswith("8.2"):
-                self.reset_section_vars()
-                self.section = self.mets
-                self.subsection = self.met_press
-                self.useless_indents = True                
-                info    = ".".join(line.split('.')[2:]).strip()
-            elif line.startswith("8.3"):
-                self.reset_section_vars()
-                self.section = self.mets
-                self.subsection = self.met_temp
-                self.useless_indents = True                
-                info    = ".".join(line.split('.')[2:]).strip()
-            elif line.startswith("8.4"):
-                self.reset_section_vars()
-                self.section = self.mets
-                self.subsection = self.met_vapor
-                self.useless_indents = True                
-                info    = ".".join(line.split('.')[2:]).strip()
-            elif line.startswith("8.5"):
-                self.reset_section_vars()
-                self.section = self.mets
-                self.subsection = self.met_other
-                self.useless_indents = True                
-                info    = line.split('.')[2].strip()
-                info    = ".".join(line.split('.')[2:]).strip()
-            elif line.startswith("9. "):
-                self.reset_section_vars()
-                self.section = self.conds
-                self.useless_indents = True                
-                info    = ".".join(line.split('.')[1:]).strip()
-            elif line.startswith("9.1"):
-                self.reset_section_vars()
-                self.section = self.conds
-                self.subsection = self.cond_interfere
-                self.useless_indents = True                
-                info    = ".".join(line.split('.')[2:]).strip()
-            elif line.startswith("9.2"):
-                self.reset_section_vars()
-                self.section = self.conds
-                self.subsection = self.cond_multipath
-                self.useless_indents = True                
-                info    = ".".join(line.split('.')[2:]).strip()
-            elif line.startswith("9.3"):
-                self.reset_section_vars()
-                self.section = self.conds
-                self.subsection = self.cond_signal
-                self.useless_indents = True                
-                info    = ".".join(line.split('.')[2:]).strip()
-            elif line.startswith("10."):
-                self.reset_section_vars()
-                self.section = self.ep_effects
-                self.subsection = self.ep_effect
-                info    = ".".join(line.split('.')[1:]).strip()
-            elif line.startswith("11. "):
-                self.reset_section_vars()
-                self.section = self.poc
-                info    = ".".join(line.split('.')[1:]).strip()
-            elif line.startswith("12. "):
-                self.reset_section_vars()
-                self.section = self.agency
-                info    = ".".join(line.split('.')[1:]).strip()
-            elif line.startswith("13. "):
+            header = self.section_header(line)
+
+            if on_section is not None:
+                #this line belongs to the next log in the stream
+                if self.section and self.starts_log(line, header):
+                    self.remaining = itertools.chain([line], lines)
+                    break
+
+                #a new section means the current one is complete
+                if header is not None and header[0] != self.section:
+                    self.flush_section(on_section)
+
+            if header is not None:
+                (section, subsection, useless_indents, field) = header
+
                 self.reset_section_vars()
-                self.section = self.more
-                info    = ".".join(line.split('.')[1:]).strip()
+                self.section         = section
+                self.useless_indents = useless_indents
+
+                #sections without subsections keep the previous one around
+                if subsection is not None:
+                    self.subsection  = subsection
+
+                #everything after the section number, e.g., '3.1' or '8.1.1'
+                info = line.split('.', field)[field].strip() if line.count('.') >= field else ''
 
             #if we are in any kind of section add this current line
             #accordingly
             if self.section:
-                self.current_node = self.root.findall(self.section)
+                self.section_node = self.section_nodes.get(self.section)
 
-                if not self.current_node:
+                if self.section_node is None:
                     #if the section does not exist in current DOM, add it. 'info' parameter contains the
                     #actual IGS log information
-                    self.current_node = ET.SubElement(self.parent, self.section, {'info' : info})
+                    self.section_node = ET.SubElement(self.parent, self.section, {'info' : info})
+                    self.section_nodes[self.section] = self.section_node
+                    self.current_node = self.section_node
                     continue
                 else:
-                    #If the section exists in DOM, there will be only 1 entry in the list
-                    #coming from the findall() function, instead of working on a list below, 
-                    #extract the first (and only!) item to operate on below.
-                    self.current_node = self.current_node[0]
-                    
                     #If there is a subsection we currently work on, then make the last child of
-                    #this section the current node and keep working on this.
+                    #this section (we keep a pointer to it) the current node and keep working on this.
                     if self.addtosubnode:
-                        try:
-                            self.current_node = list(self.current_node)[-1]
-                        except:
-                            pass
+                        self.current_node = self.subsection_node
+                    else:
+                        self.current_node = self.section_node
 
                 #treat the case of 3.1, 4.2, etc. subsection stuff - but only when
                 #when we're not in multiline mode! 
@@ -375,15 +383,19 @@ class IGSLog(object):
                     if info.startswith("X") or info.startswith("x"):
                         self.skip_section = True
                     else:
-                        self.current_node = ET.SubElement(self.current_node, self.subsection)
+                        node = ET.SubElement(self.current_node, self.subsection)
+
+                        #only a subsection added to the section itself becomes its last child
+                        if not self.addtosubnode:
+                            self.subsection_node = node
+
+                        self.current_node = node
                         self.addtosubnode = True
-                        li = list(line)
-                        for i in range(len(li)):
-                            if li[i] is not ' ':
-                                li[i] = ' ' 
-                            else:
-                                break
-                        line = "".join(li)
+                        #blank out the section number, e.g., '3.1'
+                        n = line.find(' ')
+                        if n < 0:
+                            n = len(line)
+                        line = " "*n + line[n:]
 
                 #There's no need to add sections that start with *.X because they don't contain
                 #any information. Skip these. Add all other information to the Node in the DOM    
@@ -392,6 +404,9 @@ class IGSLog(object):
                     #will be split too and we have to work with more than 2 fields!
                     self.addToSection(line.split(':'))
 
+        if on_section is not None:
+            self.flush_section(on_section)
+
     def addToSection(self, fields):
         #Treat multi-line case right at the beginning.
         #if there is no tag in the map for the field, 
@@ -406,9 +421,9 @@ class IGSLog(object):
         except KeyError:
             if self.multiline:
                 try:                     
-                    le = list(list(self.current_node)[-1])[-1]
+                    le = self.current_node[-1][-1]
                 except:
-                    le = list(self.current_node)[-1]
+                    le = self.current_node[-1]
                 
                 joinat = 0
                 
@@ -435,7 +450,7 @@ class IGSLog(object):
             if not self.useless_indents and fields[0].startswith(self.indents[3]):
                 if self.indent_level == 2:
                     self.indent_level += 1
-                    le = list(list(self.current_node)[-1])[-1]
+                    le = self.current_node[-1][-1]
                     try:
                         #if tag has text, add "-description" tag with that text as subnode
                         if le.text.strip():
@@ -451,7 +466,7 @@ class IGSLog(object):
                     return 
                 if self.indent_level == 3:
                     try:
-                        le = list(list(self.current_node)[-1])[-1]
+                        le = self.current_node[-1][-1]
                         el      = ET.SubElement(le, tag)
                         el.text = fields[1].strip().decode('utf8', 'ignore')
                     except:
@@ -462,7 +477,7 @@ class IGSLog(object):
                 if self.indent_level == 1:
                     self.indent_level += 1
                     try:
-                        le = list(self.current_node)[-1]
+                        le = self.current_node[-1]
                         #if tag has text, add "-description" tag with that text as subnode
                         if le.text.strip():
                             self.current_node = ET.SubElement(le, le.tag+"-description")
@@ -478,7 +493,7 @@ class IGSLog(object):
                     return 
                 if self.indent_level == 2:
                     try:
-                        le = list(self.current_node)[-1]
+                        le = self.current_node[-1]
                         el      = ET.SubElement(le, tag)
                         el.text = ":".join(fields[1:]).strip().decode('utf8', 'ignore')
                     except:
@@ -513,12 +528,94 @@ class IGSLog(object):
             if level and (not elem.tail or not elem.tail.strip()):
                 elem.tail = i
 
+    def site_log(self):
+        '''
+            returns the typed model (see SiteLog) of the parsed log
+        '''
+        return SiteLog.from_xml(self.root)
+
+    def load(self, xml_file):
+        '''
+            uses the DOM of a previously parsed version of this log (e.g., 
+            from LogCache) instead of parse()
+        '''
+        self.root           = ET.parse(xml_file).getroot()
+        self.section_nodes  = dict((node.tag, node) for node in self.root)
+
     def write(self, filename):
         self.indent_tree(self.root)
         ET.ElementTree(self.root).write(filename, encoding="utf8", method="xml")
 
+    def stream(self, out):
+        '''
+            parses the log and writes the XML to the file object `out' one
+            top-level section at a time, so that only the section currently
+            being parsed is held in memory. The output is the same as that
+            of parse() followed by write(). Nodes added to the root before 
+            (e.g., with retrieved_from()) are written after the sections.
+        '''
+        out.write("<?xml version='1.0' encoding='utf8'?>\n")
+
+        start_tag = '<igs-log site-id="%s"' % escape(self.site_id, {'"': '&quot;', '\n': '&#10;'})
+        written   = []
+
+        def write_node(node):
+            if not written:
+                out.write(start_tag+">")
+
+            #same indentation as indent_tree() on the full DOM; the tail
+            #depends on whether another node follows, so we write it here
+            self.indent_tree(node, 1)
+            node.tail = None
+            out.write("\n  "+ET.tostring(node, encoding="utf-8"))
+            written.append(node.tag)
+
+        self.parse(on_section=write_node)
+
+        for node in list(self.root):
+            self.root.remove(node)
+            write_node(node)
+
+        if written:
+            out.write("\n</igs-log>\n")
+        else:
+            out.write(start_tag+" />\n")
+
     def dump(self):
         self.indent_tree(self.root)
         self.indent_tree(self.root)
         ET.dump(self.root)
-        
+
+def split_logs(f):
+    '''
+        generator over the logs in a stream of concatenated IGS logs (e.g., 
+        a multi-site dump or a gzip stream). Yields IGSLog objects that read
+        their lines lazily from f; each one must be streamed with stream()
+        before the next one is requested. The site id is taken from the 
+        `Four Character ID' field, or the title line if there is none.
+    '''
+    lines = iter(f)
+
+    while True:
+        head    = []
+        siteid  = None
+
+        #buffer lines until we know which site this is
+        for line in lines:
+            head.append(line)
+
+            if "Site Information Form" in line and siteid is None:
+                siteid = line.split()[0][:4].lower()
+            elif line.strip().startswith("Four Character ID"):
+                siteid = line.split(':', 1)[-1].strip()[:4].lower() or siteid
+                break
+            elif line.startswith("2. "):
+                break
+
+        if not head:
+            return
+
+        log = IGSLog(itertools.chain(head, lines), siteid or 'xxxx')
+        yield log
+
+        lines = log.remaining if log.remaining is not None else iter([])
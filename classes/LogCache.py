@@ -0,0 +1,84 @@
+#####################################################################################
+# LogCache.py part of GPStools
+#
+# Cache of parsed IGS logs. XML output of IGSLog.parse() is stored under the SHA-1
+# of the raw log, so that unchanged logs don't have to be parsed again.
+#
+# author:   Ronni Grapenthin
+#           Dept. Earth and Environmental Science
+#           New Mexico Tech
+#           801 Leroy Place
+#           Socorro, NM-87801
+#
+# email:    rg@nmt.edu
+#
+#####################################################################################
+
+import os
+import hashlib
+import shutil
+
+from classes.IGSLog import IGSLog
+from classes.FileCache import FileCache
+
+class LogCache(FileCache):
+    '''
+        The cache lives in the directory `.igslog_cache' in GPS_SITE_DOC (unless
+        another directory is given). Each entry is the XML written by IGSLog for
+        one site and one version of its log, named <site>-<key>.xml, where the
+        key is the SHA-1 of the log and IGSLog.format_version, so that entries
+        written by an older parser aren't used.
+        The XML does not contain the log-source node; that is added by whoever
+        uses the entry.
+
+        See FileCache for eviction. If GPS_SITE_DOC is not set and no directory
+        is given, the cache is disabled and never hits.
+    '''
+
+    name        = 'Parse cache'
+
+    def __init__(self, cache_dir=None, max_size_mb=200, max_age_days=365):
+        if cache_dir is None and os.environ.get('GPS_SITE_DOC'):
+            cache_dir = os.environ.get('GPS_SITE_DOC')+'/.igslog_cache'
+
+        FileCache.__init__(self, cache_dir, max_size_mb, max_age_days)
+
+    def key(self, log_file):
+        '''
+            SHA-1 of the parser version and the raw bytes of the log
+        '''
+        sha = hashlib.sha1()
+        sha.update("IGSLog %d\0" % IGSLog.format_version)
+
+        with open(log_file, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                sha.update(chunk)
+
+        return sha.hexdigest()
+
+    def entry(self, site, key):
+        return os.path.join(self.cache_dir, "%s-%s.xml" % (site.lower(), key))
+
+    def lookup(self, site, key):
+        '''
+            returns the cached XML file for this site and log, None if there is none
+        '''
+        if not self.enabled():
+            return None
+
+        xml_file = self.entry(site, key)
+
+        if not self.touch(xml_file):
+            return None
+
+        return xml_file
+
+    def store(self, site, key, xml_file):
+        '''
+            copies xml_file into the cache
+        '''
+        if not self.enabled():
+            return
+
+        with open(xml_file, 'rb') as src:
+            self.write(self.entry(site, key), lambda f: shutil.copyfileobj(src, f))
@@ -0,0 +1,76 @@
+#####################################################################################
+# MetaCache.py part of GPStools
+#
+# Cache of teqc +meta output. The parsed meta information of a raw file (see
+# Teqc.meta()) is stored under the identity of the file, so that unchanged raw
+# files don't have to go through teqc again when they are reprocessed.
+#
+# author:   Ronni Grapenthin
+#           Dept. Earth and Environmental Science
+#           New Mexico Tech
+#           801 Leroy Place
+#           Socorro, NM-87801
+#
+# email:    rg@nmt.edu
+#
+#####################################################################################
+
+import os
+import hashlib
+import cPickle as pickle
+
+from classes.FileCache import FileCache
+
+class MetaCache(FileCache):
+    '''
+        The cache lives in the directory given by the environment variable
+        TEQC_META_CACHE, ~/.teqc_meta_cache if that isn't set (unless another
+        directory is given). A raw file is identified by its absolute path, size
+        and mtime, or by the SHA-1 of its content if content_hash is set (slower,
+        but survives copies and touches). Each entry is the pickled meta_info
+        dict, so dates stay datetimes. See FileCache for eviction.
+    '''
+
+    name            = 'Meta cache'
+    content_hash    = False
+
+    def __init__(self, cache_dir=None, content_hash=False, max_size_mb=50, max_age_days=365):
+        if cache_dir is None:
+            cache_dir = os.environ.get('TEQC_META_CACHE') or os.path.expanduser('~/.teqc_meta_cache')
+
+        FileCache.__init__(self, cache_dir, max_size_mb, max_age_days)
+        self.content_hash   = content_hash
+
+    def key(self, raw_file):
+        sha = hashlib.sha1()
+
+        if self.content_hash:
+            with open(raw_file, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024*1024), b''):
+                    sha.update(chunk)
+        else:
+            st = os.stat(raw_file)
+            sha.update("%s\0%d\0%r" % (os.path.abspath(raw_file), st.st_size, st.st_mtime))
+
+        return sha.hexdigest()
+
+    def entry(self, key):
+        return os.path.join(self.cache_dir, key+'.meta')
+
+    def lookup(self, key):
+        '''
+            returns the cached meta_info for this key, None if there is none
+        '''
+        meta_file = self.entry(key)
+
+        if not self.touch(meta_file):
+            return None
+
+        try:
+            with open(meta_file, 'rb') as f:
+                return pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def store(self, key, meta_info):
+        self.write(self.entry(key), lambda f: pickle.dump(meta_info, f, pickle.HIGHEST_PROTOCOL))
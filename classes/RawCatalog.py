@@ -0,0 +1,201 @@
+#####################################################################################
+# RawCatalog.py part of GPStools
+#
+# SQLite catalog of the teqc +meta information of all raw files in a data tree,
+# so that finding the files that cover a site and time window doesn't require
+# running teqc on each of them.
+#
+# author:   Ronni Grapenthin
+#           Dept. Earth and Environmental Science
+#           New Mexico Tech
+#           801 Leroy Place
+#           Socorro, NM-87801
+#
+# email:    rg@nmt.edu
+#
+#####################################################################################
+
+import os
+import fnmatch
+import sqlite3
+import datetime as DT
+import multiprocessing
+
+import util.constants as const
+from plog.plog import CleanShutdownRequest
+from classes.Teqc import Teqc
+from util.util import job_error
+
+#dates are stored as text in this format, which sorts like the dates themselves
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def date_to_db(value):
+    return value.strftime(DATE_FORMAT) if value is not None else None
+
+def date_from_db(value):
+    return DT.datetime.strptime(value, DATE_FORMAT) if value is not None else None
+
+def meta_job(job):
+    '''
+        teqc +meta of one raw file in a worker process, errors are returned 
+        (see job_error())
+    '''
+    (path, size, mtime, cache) = job
+
+    try:
+        teqc = Teqc(path)
+        meta = teqc.meta(cache)
+    except (Exception, CleanShutdownRequest) as e:
+        return (path, size, mtime, None, False, job_error(e))
+
+    return (path, size, mtime, meta, teqc.meta_cached, None)
+
+class RawCatalog(object):
+    '''
+        One row per raw file with its size and mtime at the time of the scan
+        and what teqc +meta says about it. Files teqc can't read are kept with
+        their error, so that rescans skip them until they change. refresh()
+        only runs teqc on files that are new or whose size or mtime changed,
+        and drops files that are gone.
+    '''
+
+    db_file     = None
+    db          = None
+
+    schema = '''
+        CREATE TABLE IF NOT EXISTS raw_files (
+            path            TEXT PRIMARY KEY,
+            size            INTEGER,
+            mtime           REAL,
+            station         TEXT,
+            format          TEXT,
+            f_start         TEXT,
+            f_end           TEXT,
+            sample_int      REAL,
+            missing_epochs  INTEGER,
+            rcx_type        TEXT,
+            rcx_sn          TEXT,
+            error           TEXT
+        );
+        CREATE INDEX IF NOT EXISTS raw_files_station ON raw_files (station, f_start, f_end);
+        CREATE INDEX IF NOT EXISTS raw_files_dates   ON raw_files (f_start, f_end);
+    '''
+
+    def __init__(self, db_file='raw_catalog.sqlite'):
+        self.db_file    = db_file
+        self.db         = sqlite3.connect(self.db_file)
+        self.db.executescript(self.schema)
+
+    def close(self):
+        self.db.close()
+
+    def scan(self, root, pattern='*'):
+        '''
+            (path, size, mtime) of all files under root matching pattern
+        '''
+        files = []
+
+        for (dirpath, dirnames, filenames) in os.walk(root):
+            for f in fnmatch.filter(filenames, pattern):
+                path = os.path.abspath(os.path.join(dirpath, f))
+                st   = os.stat(path)
+                files.append((path, st.st_size, st.st_mtime))
+
+        return files
+
+    def refresh(self, root, pattern='*', workers=1, cache=None):
+        '''
+            catalogs new and changed files under root on a pool of workers,
+            removes files under root that are gone. cache is a MetaCache or None.
+            Returns (updated, removed, unchanged, failed).
+        '''
+        root    = os.path.abspath(root)
+        files   = self.scan(root, pattern)
+        prefix  = os.path.join(root, '')
+
+        #not LIKE, `_' and `%' in root would match other directories
+        known   = dict((path, (size, mtime)) for (path, size, mtime) in
+                        self.db.execute('SELECT path, size, mtime FROM raw_files WHERE substr(path, 1, ?) = ?', 
+                                        (len(prefix), prefix)))
+        jobs    = [(path, size, mtime, cache) for (path, size, mtime) in files if known.get(path) != (size, mtime)]
+        failed  = 0
+
+        pool    = multiprocessing.Pool(workers)
+
+        try:
+            with self.db:
+                for (path, size, mtime, meta, hit, error) in pool.imap_unordered(meta_job, jobs):
+                    if error:
+                        failed += 1
+                    elif cache is not None:
+                        cache.record(hit)
+
+                    self.store(path, size, mtime, meta, error)
+
+                present = set(path for (path, size, mtime) in files)
+                gone    = [path for path in known if path not in present]
+                self.db.executemany('DELETE FROM raw_files WHERE path = ?', [(path,) for path in gone])
+        finally:
+            pool.close()
+            pool.join()
+
+        return (len(jobs), len(gone), len(files)-len(jobs), failed)
+
+    def store(self, path, size, mtime, meta, error=None):
+        meta = meta or {}
+
+        self.db.execute('INSERT OR REPLACE INTO raw_files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        (path, size, mtime,
+                         meta.get(const.TEQC_sta_id, '').upper() or None,
+                         meta.get(const.TEQC_f_format),
+                         date_to_db(meta.get(const.TEQC_f_start)),
+                         date_to_db(meta.get(const.TEQC_f_end)),
+                         meta.get(const.TEQC_sample_int),
+                         meta.get(const.TEQC_miss_epochs),
+                         meta.get(const.TEQC_rcx_type),
+                         meta.get(const.TEQC_rcx_sn),
+                         error))
+
+    def files(self, station=None, start=None, end=None, max_interval=None):
+        '''
+            (path, station, start, end, sample interval, format, missing epochs)
+            of files of a station (4-char code), covering part of [start, end],
+            sampled at max_interval seconds or faster, all optional
+        '''
+        where   = ['error IS NULL']
+        args    = []
+
+        if station is not None:
+            where.append('station = ?')
+            args.append(station.upper())
+        if end is not None:
+            where.append('f_start <= ?')
+            args.append(date_to_db(end))
+        if start is not None:
+            where.append('f_end >= ?')
+            args.append(date_to_db(start))
+        if max_interval is not None:
+            where.append('sample_int <= ?')
+            args.append(max_interval)
+
+        sql = '''SELECT path, station, f_start, f_end, sample_int, format, missing_epochs FROM raw_files
+                 WHERE '''+' AND '.join(where)+' ORDER BY station, f_start'
+
+        return [(path, station, date_from_db(f_start), date_from_db(f_end), sample_int, fmt, missing)
+                    for (path, station, f_start, f_end, sample_int, fmt, missing) in self.db.execute(sql, args)]
+
+    def mismatches(self, sta_db, station=None, start=None, end=None):
+        '''
+            files (see files()) whose 4-char code has no record in station.info
+            (a StationDB) for the time they cover
+        '''
+        files   = self.files(station, start, end)
+        records = sta_db.get_records([(f[1], f[2], f[3]) for f in files])
+
+        return [f for (f, rec) in zip(files, records) if rec is None]
+
+    def failures(self):
+        '''
+            (path, error) of files teqc couldn't read
+        '''
+        return list(self.db.execute('SELECT path, error FROM raw_files WHERE error IS NOT NULL ORDER BY path'))
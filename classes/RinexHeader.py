@@ -0,0 +1,168 @@
+#####################################################################################
+# RinexHeader.py part of GPStools
+#
+# Reads what teqc +meta reports about a RINEX 2 or 3 observation file straight
+# from the file: the header plus the first and last epoch, the latter found by
+# reading backwards from the end of the file.
+#
+# author:   Ronni Grapenthin
+#           Dept. Earth and Environmental Science
+#           New Mexico Tech
+#           801 Leroy Place
+#           Socorro, NM-87801
+#
+# email:    rg@nmt.edu
+#
+#####################################################################################
+
+import os
+import re
+import math
+import datetime
+
+import util.constants as const
+
+#epoch lines of observation (flags 0, 1) and other records (2 - 6)
+rinex2_epoch = re.compile(r'^ ([ \d]\d) ([ \d]\d) ([ \d]\d) ([ \d]\d) ([ \d]\d) ([ \d]\d\.\d+) +([0-6])', re.M)
+rinex3_epoch = re.compile(r'^> (\d{4}) ([ \d]\d) ([ \d]\d) ([ \d]\d) ([ \d]\d) ([ \d]\d\.\d+) +([0-6])', re.M)
+
+#WGS84
+a_wgs84     = 6378137.0
+f_wgs84     = 1.0/298.257223563
+
+#bytes read from the end of the file at first when looking for the last epoch
+tail_chunk  = 64*1024
+
+def is_rinex(path):
+    '''
+        True for (uncompressed) RINEX observation files
+    '''
+    try:
+        with open(path, 'r') as f:
+            l = f.readline(81)
+    except IOError:
+        return False
+
+    return l[60:80].strip() == 'RINEX VERSION / TYPE' and l[20:21] == 'O'
+
+def xyz2llh(x, y, z):
+    '''
+        geodetic latitude, longitude (deg) and ellipsoidal height (m) of cartesian
+        coordinates on WGS84
+    '''
+    e2  = f_wgs84*(2.0 - f_wgs84)
+    lon = math.atan2(y, x)
+    p   = math.hypot(x, y)
+    lat = math.atan2(z, p*(1.0 - e2))
+    h   = 0.0
+
+    for i in range(10):
+        n       = a_wgs84/math.sqrt(1.0 - e2*math.sin(lat)**2)
+        h       = p/math.cos(lat) - n
+        lat     = math.atan2(z, p*(1.0 - e2*n/(n + h)))
+
+    return (math.degrees(lat), math.degrees(lon), h)
+
+def epoch_time(match, version):
+    (year, month, day, hour, minute) = [int(v) for v in match.groups()[:5]]
+    seconds = float(match.group(6))
+
+    if version < 3:
+        year += 2000 if year < 80 else 1900
+
+    return datetime.datetime(year, month, day, hour, minute) + datetime.timedelta(seconds=seconds)
+
+def observation_epochs(text, version):
+    '''
+        times of the observation epochs (flags 0, 1) in a piece of the data section
+    '''
+    pattern = rinex2_epoch if version < 3 else rinex3_epoch
+
+    #header records following event flags may look like epochs, but are labeled
+    return [epoch_time(m, version) for m in pattern.finditer(text) if m.group(7) in '01' and 
+                text[m.start()+60:m.start()+80].rstrip('\n').strip() != 'COMMENT']
+
+def read_meta(path):
+    '''
+        meta information of a RINEX observation file, keys as in util.constants.
+        The number of missing epochs isn't included, it would take reading all
+        epochs. The sample interval is None for files with a single epoch and
+        no INTERVAL record. Raises ValueError for files without observation 
+        epochs.
+    '''
+    meta = { const.TEQC_f_name      : os.path.basename(path),
+             const.TEQC_f_size      : os.path.getsize(path),
+             const.TEQC_sample_int  : None }
+
+    with open(path, 'r') as f:
+        version = 2.0
+
+        #readline() rather than iterating, which reads ahead and breaks tell()
+        for l in iter(f.readline, ''):
+            label = l[60:80].strip()
+
+            if label == 'RINEX VERSION / TYPE':
+                version = float(l[0:9])
+                meta[const.TEQC_f_format] = 'RINEX' if version < 3 else 'RINEX 3'
+            elif label == 'MARKER NAME':
+                meta[const.TEQC_sta_name]   = l[0:60].strip()
+                meta[const.TEQC_sta_id]     = l[0:4].strip()
+            elif label == 'MARKER NUMBER':
+                meta[const.TEQC_sta_sn]     = l[0:20].strip()
+            elif label == 'REC # / TYPE / VERS':
+                meta[const.TEQC_rcx_sn]     = l[0:20].strip()
+                meta[const.TEQC_rcx_type]   = l[20:40].strip()
+                meta[const.TEQC_rcx_firm]   = l[40:60].strip()
+            elif label == 'ANT # / TYPE':
+                meta[const.TEQC_ant_sn]     = l[0:20].strip()
+                meta[const.TEQC_ant_type]   = l[20:40].strip()
+            elif label == 'APPROX POSITION XYZ':
+                (lat, lon, elev) = xyz2llh(float(l[0:14]), float(l[14:28]), float(l[28:42]))
+                meta[const.TEQC_lat]        = lat
+                meta[const.TEQC_lon]        = lon
+                meta[const.TEQC_elev]       = elev
+            elif label == 'ANTENNA: DELTA H/E/N':
+                meta[const.TEQC_ant_height] = float(l[0:14])
+            elif label == 'INTERVAL':
+                meta[const.TEQC_sample_int] = float(l[0:10])
+            elif label == 'END OF HEADER':
+                break
+
+        header_end = f.tell()
+
+        #first two epochs, the second one for files without INTERVAL
+        head    = f.read(tail_chunk)
+        epochs  = observation_epochs(head, version)
+
+        if not epochs:
+            raise ValueError("No observation epochs in `%s'" % path)
+
+        meta[const.TEQC_f_start] = epochs[0]
+
+        if meta[const.TEQC_sample_int] is None and len(epochs) > 1:
+            meta[const.TEQC_sample_int] = (epochs[1] - epochs[0]).total_seconds()
+
+        #last epoch, reading more of the end until there is one
+        size    = meta[const.TEQC_f_size]
+        chunk   = tail_chunk
+        last    = []
+
+        while not last:
+            start = max(header_end, size - chunk)
+            f.seek(start)
+            tail  = f.read(size - start)
+
+            #the first line may be cut off
+            if start > header_end:
+                tail = tail[tail.find('\n')+1:]
+
+            last  = observation_epochs(tail, version)
+
+            if start == header_end:
+                break
+
+            chunk *= 4
+
+        meta[const.TEQC_f_end] = last[-1]
+
+    return meta
@@ -0,0 +1,249 @@
+#####################################################################################
+# SiteCatalog.py part of GPStools
+#
+# SQLite catalog of all XML site logs in GPS_SITE_DOC. Sites, positions, antennas
+# and receivers of the whole network go into one database file, so that questions
+# like "which stations had antenna X installed during 2014" don't require opening
+# every log.
+#
+# author:   Ronni Grapenthin
+#           Dept. Earth and Environmental Science
+#           New Mexico Tech
+#           801 Leroy Place
+#           Socorro, NM-87801
+#
+# email:    rg@nmt.edu
+#
+#####################################################################################
+
+import os
+import glob
+import sqlite3
+import datetime as DT
+
+from plog.plog import Logger
+from classes.XML_LogReader import XML_LogReader
+from util.util import job_error
+
+#dates are stored as text in this format, which sorts like the dates themselves
+DATE_FORMAT = '%Y-%m-%d %H:%M'
+
+def date_to_db(value):
+    return value.strftime(DATE_FORMAT) if value is not None else None
+
+def date_from_db(value):
+    return DT.datetime.strptime(value, DATE_FORMAT) if value is not None else None
+
+class SiteCatalog(object):
+    '''
+        The catalog lives in `site_catalog.sqlite' in GPS_SITE_DOC (unless another
+        file is given). refresh() (re-)indexes the <site>.xml logs that are new or
+        have changed since they were last indexed (by mtime) and drops sites whose
+        logs are gone.
+
+        Equipment records have their installation period [installed, removed];
+        removed is NULL for equipment that is still in place. Queries take a
+        time window and return records whose period overlaps it.
+
+        Logs that can't be read are kept in `failures' with their error, so
+        that refreshes skip them until they change.
+    '''
+
+    db_file     = None
+    db          = None
+
+    schema = '''
+        CREATE TABLE IF NOT EXISTS sites (
+            site_id     TEXT PRIMARY KEY,
+            site_name   TEXT,
+            city        TEXT,
+            state       TEXT,
+            country     TEXT,
+            agency      TEXT,
+            prepared    TEXT,
+            xml_file    TEXT,
+            mtime       REAL
+        );
+        CREATE TABLE IF NOT EXISTS positions (
+            site_id     TEXT PRIMARY KEY REFERENCES sites(site_id),
+            x           REAL,
+            y           REAL,
+            z           REAL
+        );
+        CREATE TABLE IF NOT EXISTS antennas (
+            site_id     TEXT REFERENCES sites(site_id),
+            seq         INTEGER,
+            type        TEXT,
+            serial      TEXT,
+            radome_type TEXT,
+            arp_up      REAL,
+            arp_north   REAL,
+            arp_east    REAL,
+            installed   TEXT,
+            removed     TEXT,
+            PRIMARY KEY (site_id, seq)
+        );
+        CREATE TABLE IF NOT EXISTS receivers (
+            site_id     TEXT REFERENCES sites(site_id),
+            seq         INTEGER,
+            type        TEXT,
+            serial      TEXT,
+            firmware    TEXT,
+            installed   TEXT,
+            removed     TEXT,
+            PRIMARY KEY (site_id, seq)
+        );
+        CREATE TABLE IF NOT EXISTS failures (
+            site_id     TEXT PRIMARY KEY,
+            xml_file    TEXT,
+            mtime       REAL,
+            error       TEXT
+        );
+        CREATE INDEX IF NOT EXISTS antennas_type  ON antennas (type, installed, removed);
+        CREATE INDEX IF NOT EXISTS antennas_dates ON antennas (installed, removed);
+        CREATE INDEX IF NOT EXISTS receivers_type  ON receivers (type, installed, removed);
+        CREATE INDEX IF NOT EXISTS receivers_dates ON receivers (installed, removed);
+    '''
+
+    def __init__(self, db_file=None):
+        if db_file is None:
+            gps_site_doc = os.environ.get('GPS_SITE_DOC')
+            if not gps_site_doc:
+                raise Exception("No catalog file given and environment variable 'GPS_SITE_DOC' not set.")
+            db_file = gps_site_doc+'/site_catalog.sqlite'
+
+        self.db_file    = db_file
+        self.db         = sqlite3.connect(self.db_file)
+        self.db.executescript(self.schema)
+
+    def close(self):
+        self.db.close()
+
+    def refresh(self, log_dir=None):
+        '''
+            indexes new and changed logs in log_dir (default: GPS_SITE_DOC),
+            removes sites without log. A log that can't be read doesn't stop the
+            refresh, its site is dropped and the error recorded (see failures()).
+            Returns (updated, removed, unchanged, failed).
+        '''
+        if log_dir is None:
+            log_dir = os.environ.get('GPS_SITE_DOC') or os.path.dirname(os.path.abspath(self.db_file))
+
+        indexed = dict(self.db.execute('SELECT site_id, mtime FROM sites'))
+        indexed.update(self.db.execute('SELECT site_id, mtime FROM failures'))
+        updated = 0
+        failed  = 0
+        seen    = set()
+
+        with self.db:
+            for xml_file in sorted(glob.glob(os.path.join(log_dir, '*.xml'))):
+                site  = os.path.basename(xml_file)[:-4].lower()
+                mtime = os.path.getmtime(xml_file)
+                seen.add(site)
+
+                if indexed.get(site) == mtime:
+                    continue
+
+                updated += 1
+
+                try:
+                    self.index_log(site, xml_file, mtime)
+                except Exception as e:
+                    error = job_error(e)
+                    Logger.warning("Couldn't index `%s': %s" % (xml_file, error))
+
+                    self.drop_site(site)
+                    self.db.execute('INSERT INTO failures VALUES (?, ?, ?, ?)', (site, xml_file, mtime, error))
+                    failed += 1
+
+            gone = [site for site in indexed if site not in seen]
+            for site in gone:
+                self.drop_site(site)
+
+        return (updated, len(gone), len(seen)-updated, failed)
+
+    def drop_site(self, site):
+        for table in ('receivers', 'antennas', 'positions', 'sites', 'failures'):
+            self.db.execute('DELETE FROM %s WHERE site_id = ?' % table, (site,))
+
+    def index_log(self, site, xml_file, mtime):
+        #XML_LogReader picks up the JSON sidecar if there is one
+        log = XML_LogReader(xml_file, site).site_log()
+
+        self.drop_site(site)
+
+        self.db.execute('INSERT INTO sites VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        (site, log.site_name, log.city, log.state, log.country, log.agency,
+                         date_to_db(log.prepared), xml_file, mtime))
+        self.db.execute('INSERT INTO positions VALUES (?, ?, ?, ?)', (site, log.x, log.y, log.z))
+
+        self.db.executemany('INSERT INTO antennas VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                            [(site, seq, a.type, a.serial, a.radome_type, a.arp_vec_up, a.arp_vec_north,
+                              a.arp_vec_east, date_to_db(a.installed), date_to_db(a.removed))
+                             for (seq, a) in enumerate(log.antennas)])
+
+        self.db.executemany('INSERT INTO receivers VALUES (?, ?, ?, ?, ?, ?, ?)',
+                            [(site, seq, r.type, r.serial, r.firmware,
+                              date_to_db(r.installed), date_to_db(r.removed))
+                             for (seq, r) in enumerate(log.receivers)])
+
+    def equipment(self, table, columns, type=None, site=None, start=None, end=None):
+        '''
+            rows of antennas or receivers, optionally of given type (SQL LIKE
+            pattern, e.g., `TRM59800%') and/or site, in use during [start, end]
+        '''
+        where   = []
+        args    = []
+
+        if type is not None:
+            where.append('type LIKE ?')
+            args.append(type)
+        if site is not None:
+            where.append('site_id = ?')
+            args.append(site.lower())
+        if end is not None:
+            where.append('installed <= ?')
+            args.append(date_to_db(end))
+        if start is not None:
+            where.append('(removed IS NULL OR removed >= ?)')
+            args.append(date_to_db(start))
+
+        sql = 'SELECT site_id, '+', '.join(columns)+', installed, removed FROM '+table
+        if where:
+            sql += ' WHERE '+' AND '.join(where)
+        sql += ' ORDER BY site_id, seq'
+
+        return [row[:-2] + (date_from_db(row[-2]), date_from_db(row[-1])) for row in self.db.execute(sql, args)]
+
+    def antennas(self, type=None, site=None, start=None, end=None):
+        '''
+            (site, type, serial, radome type, up, north, east, installed, removed)
+        '''
+        return self.equipment('antennas', ('type', 'serial', 'radome_type', 'arp_up', 'arp_north', 'arp_east'),
+                              type, site, start, end)
+
+    def receivers(self, type=None, site=None, start=None, end=None):
+        '''
+            (site, type, serial, firmware, installed, removed)
+        '''
+        return self.equipment('receivers', ('type', 'serial', 'firmware'), type, site, start, end)
+
+    def sites(self):
+        '''
+            (site, name, city, state, country, x, y, z) of all sites
+        '''
+        return list(self.db.execute('''SELECT s.site_id, s.site_name, s.city, s.state, s.country, p.x, p.y, p.z
+                                       FROM sites s JOIN positions p ON s.site_id = p.site_id
+                                       ORDER BY s.site_id'''))
+
+    def failures(self):
+        '''
+            (site, xml file, error) of logs that couldn't be indexed
+        '''
+        return list(self.db.execute('SELECT site_id, xml_file, error FROM failures ORDER BY site_id'))
+
+    def position(self, site):
+        '''
+            (x, y, z) of the site, None if it's not in the catalog
+        '''
+        return self.db.execute('SELECT x, y, z FROM positions WHERE site_id = ?', (site.lower(),)).fetchone()
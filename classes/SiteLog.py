@@ -0,0 +1,386 @@
+#####################################################################################
+# SiteLog.py part of GPStools
+#
+# Compact, typed representation of the parts of an IGS site log that processing
+# needs: site identification, location, receivers and antennas. Converts from and
+# to the XML written by IGSLog, and to a JSON sidecar file that loads much faster
+# than the XML.
+#
+# author:   Ronni Grapenthin
+#           Dept. Earth and Environmental Science
+#           New Mexico Tech
+#           801 Leroy Place
+#           Socorro, NM-87801
+#
+# email:    rg@nmt.edu
+#
+#####################################################################################
+
+import xml.etree.ElementTree as ET
+import datetime as DT
+import collections
+import json
+
+from plog.plog import Logger
+
+DATE_FORMAT = '%Y-%m-%dT%H:%MZ'
+FORM_DATE_FORMAT = '%Y-%m-%d'
+
+#(tag, text) of non-numeric values warned about already, see to_float()
+not_numbers = set()
+
+def to_text(elem):
+    #empty elements give None, just like their text in parsed XML
+    return (elem.text or None) if elem is not None else ''
+
+def to_float(elem):
+    x = elem.text if elem is not None else None
+
+    #empty nodes are None in parsed XML, trees built in memory may have ''
+    if x is None or not x.strip():
+        return 0.0
+
+    #logs contain all sorts of things in numeric fields ('(F8.4)', '30 m', ...),
+    #these are 0.0 like empty fields, but shouldn't go unnoticed. Once per
+    #field and value, most logs have `0 deg' in every antenna record.
+    try:
+        return float(x)
+    except ValueError:
+        if (elem.tag, x) not in not_numbers:
+            not_numbers.add((elem.tag, x))
+            Logger.warning("Not a number in <%s>: `%s', using 0.0" % (elem.tag, x))
+        return 0.0
+
+def to_date(elem, date_format=DATE_FORMAT):
+    x = elem.text if elem is not None else None
+
+    try:
+        return DT.datetime.strptime(x.strip(), date_format)
+    except (AttributeError, ValueError):
+        return None
+
+def from_text(value):
+    return value
+
+def from_float(value):
+    return repr(value)
+
+def from_date(value, date_format=DATE_FORMAT):
+    return value.strftime(date_format) if value is not None else None
+
+#dates go into JSON as [year, month, day, hour, minute], which is much
+#cheaper to turn back into a datetime than a formatted string
+def date_to_json(value):
+    return [value.year, value.month, value.day, value.hour, value.minute] if value is not None else None
+
+def date_from_json(value):
+    return DT.datetime(*value) if value is not None else None
+
+def path_index(root):
+    '''
+        maps the path of every node below root (e.g., `location/city-town') to
+        the text of the first node on that path, which is what findall(...)[0]
+        chains would find
+    '''
+    index = {}
+    nodes = [(child, '') for child in reversed(list(root))]
+
+    #depth first in document order: children go on the stack last one first
+    while nodes:
+        (elem, prefix) = nodes.pop()
+        path = prefix+elem.tag
+
+        #empty nodes are None as in parsed XML, trees built in memory may have ''
+        if path not in index:
+            index[path] = elem.text or None
+
+        nodes.extend((child, path+'/') for child in reversed(list(elem)))
+
+    return index
+
+def json_name(xml_file):
+    '''
+        name of the JSON sidecar of an XML log: site.xml -> site.json
+    '''
+    if xml_file.endswith('.xml'):
+        return xml_file[:-4]+'.json'
+
+    return xml_file+'.json'
+
+def write_sidecar(xml_file, root=None):
+    '''
+        writes the JSON sidecar of xml_file: its SiteLog plus the path index
+        of the whole log (see path_index()), so that XML_LogReader can answer 
+        any path without the XML. root is the root node of the log if it is 
+        at hand already, the XML is parsed otherwise.
+    '''
+    if root is None:
+        root = ET.parse(xml_file).getroot()
+
+    d = SiteLog.from_xml(root).to_json()
+    d['index'] = path_index(root)
+
+    with open(json_name(xml_file), 'w') as f:
+        json.dump(d, f, separators=(',', ':'))
+
+def read_sidecar(json_file):
+    '''
+        returns (SiteLog, path index) from a sidecar written by write_sidecar()
+    '''
+    with open(json_file, 'r') as f:
+        d = json.load(f)
+
+    return (SiteLog.from_json(d), d['index'])
+
+class Record(object):
+    '''
+        Base for the slotted records below. `fields' lists
+        (attribute, XML tag, parse function, format function) for each slot.
+        Records are read-only mappings of attribute name to value like the 
+        dicts XML_LogReader used to return, e.g., antenna['arp_vec_up'] or 
+        antenna['radome-type']. collections.Mapping has no __slots__, so the 
+        mapping methods are spelled out here and Record is registered instead.
+    '''
+    __slots__   = ()
+    fields      = ()
+    tag         = None
+
+    def __init__(self, **kwargs):
+        for (attr, tag, parse, fmt) in self.fields:
+            setattr(self, attr, kwargs.get(attr))
+
+    def __getitem__(self, key):
+        try:
+            attr = key.replace('-', '_')
+
+            if attr not in self.__slots__:
+                raise KeyError(key)
+
+            return getattr(self, attr)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __iter__(self):
+        return (attr for (attr, tag, parse, fmt) in self.fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [getattr(self, attr) for attr in self]
+
+    def items(self):
+        return [(attr, getattr(self, attr)) for attr in self]
+
+    @classmethod
+    def from_xml(cls, elem):
+        rec = cls.__new__(cls)
+        for (attr, tag, parse, fmt) in cls.fields:
+            setattr(rec, attr, parse(elem.find(tag)))
+        return rec
+
+    def to_xml(self, parent):
+        elem = ET.SubElement(parent, self.tag)
+        for (attr, tag, parse, fmt) in self.fields:
+            ET.SubElement(elem, tag).text = fmt(getattr(self, attr))
+        return elem
+
+    def to_json(self):
+        '''
+            list of the field values in the order of `fields'
+        '''
+        return [date_to_json(getattr(self, attr)) if parse is to_date else getattr(self, attr)
+                    for (attr, tag, parse, fmt) in self.fields]
+
+    @classmethod
+    def from_json(cls, values):
+        rec = cls.__new__(cls)
+        for ((attr, tag, parse, fmt), value) in zip(cls.fields, values):
+            setattr(rec, attr, date_from_json(value) if parse is to_date else value)
+        return rec
+
+collections.Mapping.register(Record)
+
+class Receiver(Record):
+    __slots__   = ('type', 'satellite_system', 'serial', 'firmware', 'elevation_cutoff', 'installed', 'removed')
+    tag         = 'receiver'
+    fields      = ( ('type',             'receiver-type',    to_text, from_text),
+                    ('satellite_system', 'satellite-system', to_text, from_text),
+                    ('serial',           'serial-number',    to_text, from_text),
+                    ('firmware',         'firmware-version', to_text, from_text),
+                    ('elevation_cutoff', 'elevation-cutoff', to_text, from_text),
+                    ('installed',        'date-installed',   to_date, from_date),
+                    ('removed',          'date-removed',     to_date, from_date) )
+
+class Antenna(Record):
+    __slots__   = ('type', 'serial', 'arp', 'arp_vec_east', 'arp_vec_north', 'arp_vec_up', 'north_deviation',
+                   'radome_type', 'radome_serial', 'cable_type', 'cable_length', 'installed', 'removed')
+    tag         = 'antenna'
+    fields      = ( ('type',            'antenna-type',                  to_text,  from_text),
+                    ('serial',          'serial-number',                 to_text,  from_text),
+                    ('arp',             'antenna-reference-point',       to_text,  from_text),
+                    ('arp_vec_up',      'marker-arp-up-eccentricity',    to_float, from_float),
+                    ('arp_vec_north',   'marker-arp-north-eccentricity', to_float, from_float),
+                    ('arp_vec_east',    'marker-arp-east-eccentricity',  to_float, from_float),
+                    ('north_deviation', 'alignment-from-true-north',     to_float, from_float),
+                    ('radome_type',     'radome-type',                   to_text,  from_text),
+                    ('radome_serial',   'radome-serial-number',          to_text,  from_text),
+                    ('cable_type',      'antenna-cable-type',            to_text,  from_text),
+                    ('cable_length',    'antenna-cable-length',          to_float, from_float),
+                    ('installed',       'date-installed',                to_date,  from_date),
+                    ('removed',         'date-removed',                  to_date,  from_date) )
+
+class SiteLog(object):
+    '''
+        Typed site log. Holds what XML_LogReader and the GIPSY tools use,
+        parsed once: positions are floats, dates are datetimes (None if
+        missing or not set, e.g., `Date Removed' of current equipment).
+        Receivers and antennas are in the order of the log, i.e., oldest first.
+    '''
+    __slots__ = ('site_id', 'site_name', 'prepared', 'city', 'state', 'country',
+                 'x', 'y', 'z', 'agency', 'source', 'receivers', 'antennas')
+
+    #tags of the log-source node (see IGSLog.retrieved_from())
+    source_tags = ('archive', 'url', 'date', 'local-igs-log')
+
+    #bump this when the JSON layout changes, older sidecars are ignored then
+    json_version = 2
+
+    def __init__(self, site_id, site_name='', prepared=None, city='', state='', country='',
+                 x=0.0, y=0.0, z=0.0, agency='', source=None, receivers=None, antennas=None):
+        self.site_id    = site_id
+        self.site_name  = site_name
+        self.prepared   = prepared
+        self.city       = city
+        self.state      = state
+        self.country    = country
+        self.x          = x
+        self.y          = y
+        self.z          = z
+        self.agency     = agency
+        self.source     = source if source is not None else {}
+        self.receivers  = receivers if receivers is not None else []
+        self.antennas   = antennas if antennas is not None else []
+
+    @classmethod
+    def from_xml(cls, root):
+        '''
+            builds the model from the root node of an IGSLog DOM (or a parsed XML file)
+        '''
+        siteid  = root.find('site-identification')
+        loc     = root.find('location')
+        pos     = loc.find('approx-position-itrf') if loc is not None else None
+        poc     = root.find('poc')
+        src     = root.find('log-source')
+        recs    = root.find('receivers')
+        ants    = root.find('antennas')
+
+        return cls(site_id    = to_text(siteid.find('site-id')) if siteid is not None else root.get('site-id', ''),
+                   site_name  = to_text(siteid.find('site-name')) if siteid is not None else '',
+                   prepared   = to_date(root.find('form/date'), FORM_DATE_FORMAT),
+                   city       = to_text(loc.find('city-town')) if loc is not None else '',
+                   state      = to_text(loc.find('state-province')) if loc is not None else '',
+                   country    = to_text(loc.find('country')) if loc is not None else '',
+                   x          = to_float(pos.find('x-coord')) if pos is not None else 0.0,
+                   y          = to_float(pos.find('y-coord')) if pos is not None else 0.0,
+                   z          = to_float(pos.find('z-coord')) if pos is not None else 0.0,
+                   agency     = to_text(poc.find('agency')) if poc is not None else '',
+                   source     = dict((t, to_text(src.find(t))) for t in cls.source_tags) if src is not None else {},
+                   receivers  = [Receiver.from_xml(r) for r in recs.findall('receiver')] if recs is not None else [],
+                   antennas   = [Antenna.from_xml(a) for a in ants.findall('antenna')] if ants is not None else [])
+
+    @classmethod
+    def from_file(cls, xml_file):
+        return cls.from_xml(ET.parse(xml_file).getroot())
+
+    def to_json(self):
+        return {'version':   self.json_version,
+                'site_id':   self.site_id,
+                'site_name': self.site_name,
+                'prepared':  date_to_json(self.prepared),
+                'city':      self.city,
+                'state':     self.state,
+                'country':   self.country,
+                'position':  [self.x, self.y, self.z],
+                'agency':    self.agency,
+                'source':    self.source,
+                'receivers': [r.to_json() for r in self.receivers],
+                'antennas':  [a.to_json() for a in self.antennas]}
+
+    @classmethod
+    def from_json(cls, d):
+        if d.get('version') != cls.json_version:
+            raise ValueError("JSON site log version %s, expected %d" % (d.get('version'), cls.json_version))
+
+        (x, y, z) = d['position']
+
+        return cls(site_id    = d['site_id'],
+                   site_name  = d['site_name'],
+                   prepared   = date_from_json(d['prepared']),
+                   city       = d['city'],
+                   state      = d['state'],
+                   country    = d['country'],
+                   x          = x,
+                   y          = y,
+                   z          = z,
+                   agency     = d['agency'],
+                   source     = d['source'],
+                   receivers  = [Receiver.from_json(r) for r in d['receivers']],
+                   antennas   = [Antenna.from_json(a) for a in d['antennas']])
+
+    def to_xml(self):
+        '''
+            returns an igs-log root node in the schema IGSLog writes, containing
+            the sections held by the model
+        '''
+        root = ET.Element('igs-log', attrib={'site-id': self.site_id.lower()})
+
+        form = ET.SubElement(root, 'form')
+        ET.SubElement(form, 'date').text = from_date(self.prepared, FORM_DATE_FORMAT)
+
+        siteid = ET.SubElement(root, 'site-identification')
+        ET.SubElement(siteid, 'site-name').text = self.site_name
+        ET.SubElement(siteid, 'site-id').text   = self.site_id
+
+        loc = ET.SubElement(root, 'location')
+        ET.SubElement(loc, 'city-town').text      = self.city
+        ET.SubElement(loc, 'state-province').text = self.state
+        ET.SubElement(loc, 'country').text        = self.country
+        pos = ET.SubElement(loc, 'approx-position-itrf')
+        ET.SubElement(pos, 'x-coord').text = from_float(self.x)
+        ET.SubElement(pos, 'y-coord').text = from_float(self.y)
+        ET.SubElement(pos, 'z-coord').text = from_float(self.z)
+
+        recs = ET.SubElement(root, 'receivers')
+        for r in self.receivers:
+            r.to_xml(recs)
+
+        ants = ET.SubElement(root, 'antennas')
+        for a in self.antennas:
+            a.to_xml(ants)
+
+        poc = ET.SubElement(root, 'poc')
+        ET.SubElement(poc, 'agency').text = self.agency
+
+        if self.source:
+            src = ET.SubElement(root, 'log-source')
+            for t in self.source_tags:
+                ET.SubElement(src, t).text = self.source.get(t)
+
+        return root
@@ -1,7 +1,8 @@
 #####################################################################################
-# Teqc.py part of GPStools 
+# StationDB.py part of GPStools 
 #
-# Defines Interface to teqc binary
+# Looks up station records (session dates, antenna and receiver, antenna height) 
+# of a site in GIPSY's station.info
 #
 # author:   Ronni Grapenthin
 #           Dept. Earth and Environmental Science
@@ -21,86 +22,136 @@ sys.path.append(
 
 import subprocess
 import datetime
+import bisect
+import mmap
+import marshal
+import tempfile
+import threading
 import util.constants as const
 
 from plog.plog import Logger
+from classes.AntennaHeight import AntennaHeights, script_vertical_height
+
+#end of sessions that are still going on ("9999 999  0  0  0"), shared by all records
+OPEN_END = datetime.datetime(9999, 12, 31, 23, 59, 59)
+
+def to_datetime(field):
+    '''
+    `YYYY DDD HH MM SS' to datetime, a lot cheaper than strptime
+    '''
+    (year, doy, hour, minute, second) = [int(x) for x in field.split()]
+
+    if not (1 <= doy <= 366 and 0 <= hour < 24 and 0 <= minute < 60 and 0 <= second < 61):
+        raise ValueError("Not a date: `%s'" % field)
+
+    return datetime.datetime(year, 1, 1, hour, minute, second) + datetime.timedelta(days=doy-1)
+
+class Field(object):
+    '''
+    column of a StationRecord line. The first access to any of them decodes
+    all of them into the record's slots (see StationRecord.decode()).
+    '''
+    def __init__(self, slot):
+        self.slot       = slot
+
+    def __get__(self, rec, cls):
+        if rec is None:
+            return self
+
+        try:
+            return getattr(rec, self.slot)
+        except AttributeError:
+            rec.decode()
+            return getattr(rec, self.slot)
+
+    def __set__(self, rec, value):
+        if not rec.decoded():
+            rec.decode()
+        setattr(rec, self.slot, value)
 
 class StationRecord(object):
+    '''
+    One line of station.info. Session dates are decoded right away, as they
+    are what lookups need; all other fields when one of them is first used.
+    '''
 
-    line        = None
-    site_id     = None
-    site_name   = None
-    sess_start  = None
-    sess_end    = None
-    ant_ht      = None
-    vert_ht     = None
-    ant_north   = None
-    ant_east    = None
-    ht_code     = None
-    rcx_type    = None
-    rcx_sn      = None
-    ant_type    = None
-    ant_sn      = None
-    operator    = ""
-    agency      = ""
+    __slots__   = ('line', 'sess_start', 'sess_end', 'vert_ht',
+                   '_site_id', '_site_name', '_ant_ht', '_ht_code', '_ant_north', '_ant_east', 
+                   '_rcx_type', '_rcx_sn', '_ant_type', '_ant_dome', '_ant_sn', '_operator', '_agency')
+
+    site_id     = Field('_site_id')
+    site_name   = Field('_site_name')
+    ant_ht      = Field('_ant_ht')
+    ht_code     = Field('_ht_code')
+    ant_north   = Field('_ant_north')
+    ant_east    = Field('_ant_east')
+    rcx_type    = Field('_rcx_type')
+    rcx_sn      = Field('_rcx_sn')
+    ant_type    = Field('_ant_type')
+    ant_dome    = Field('_ant_dome')
+    ant_sn      = Field('_ant_sn')
+    operator    = Field('_operator')
+    agency      = Field('_agency')
 
     def __init__(self, line):
     
         self.line        = line
-        self.site_id     = line[1:5].strip()
-        self.site_name   = line[7:25].strip()
-        self.sess_start  = datetime.datetime.strptime(line[25:44].strip(), '%Y %j %H %M %S')
+        self.vert_ht     = None
+        self.sess_start  = to_datetime(line[25:44])
 
         #the end data requires some attention as continuous sites are markes as
         #"9999 999 00 00 00" for open ending periods
         try:
-            self.sess_end    = datetime.datetime.strptime(line[44:63].strip(), '%Y %j %H %M %S')
+            self.sess_end    = to_datetime(line[44:63])
         except ValueError:
-            if line[44:63].strip().startswith('9999'):
-                self.sess_end    = datetime.datetime.utcnow()
-                    
-        self.ant_ht      = float(line[65:72])
-        self.ht_code     = line[72:79].strip()
-        self.ant_north   = float(line[79:88])
-        self.ant_east    = float(line[88:97])
-        self.rcx_type    = line[97:119].strip()
-        self.rcx_sn      = line[148:170].strip()
-        self.ant_type    = line[170:187].strip()
-        self.ant_dome    = line[187:194].strip()
+            self.sess_end    = OPEN_END if line[44:63].strip().startswith('9999') else None
 
-        try:
-            self.ant_sn      = line[194:216].strip()
-        except Error:
-            self.ant_sn      = line[194:].strip()
+    def decoded(self):
+        return hasattr(self, '_site_id')
 
-        try:
-            self.operator    = line[216:240].strip()
-        except Error:
-            self.operator    = line[216:].strip()
-
-        try:
-          self.agency        = line[240:].strip()
-        except Error:
-            pass
-
-    def calculate_vertical_antenna_height(self):
-        if (self.ht_code != "DHARP"):
-            p1 = subprocess.Popen([ "slant2vert_height.sh", "%s" % (self.ant_ht), 
-                                    "%s" % (self.ant_type), "%s" % (self.ht_code)], 
-                                    stdout=subprocess.PIPE)
-            output,err = p1.communicate()
+    def decode(self):
+        line = self.line
 
-            #Error Checking
-            if len(output) == 0:
-                Logger.error("Couldn't calculate vertical height for %s with \
-                              antenna type %s and height code %s " % 
-                              (self.site_id, self.ant_type, self.ht_code), 4)
+        self._site_id     = line[1:5].strip()
+        self._site_name   = line[7:25].strip()
+        self._ant_ht      = float(line[65:72])
+        self._ht_code     = line[72:79].strip()
+        self._ant_north   = float(line[79:88])
+        self._ant_east    = float(line[88:97])
+        self._rcx_type    = line[97:119].strip()
+        self._rcx_sn      = line[148:170].strip()
+        self._ant_type    = line[170:187].strip()
+        self._ant_dome    = line[187:194].strip()
+        self._ant_sn      = line[194:216].strip()
+        self._operator    = line[216:240].strip()
+        self._agency      = line[240:].strip()
 
-            if err != None:
-                Logger.error(err, 3)
+    def calculate_vertical_antenna_height(self, heights=None):
+        '''
+        vertical height to the ARP from the measured height, using the conversion
+        table (see AntennaHeight.py) or slant2vert_height.sh if there is none, 
+        it is malformed, or it has no entry for the antenna and height code.
+        DHARP heights are vertical to the ARP already and taken as they are 
+        (vert_ht used to stay None for them, which teqc's -O.pe can't take).
+        '''
+        if heights is None:
+            try:
+                heights = AntennaHeights.default()
+            except IOError:
+                heights = None
+            except ValueError as e:
+                Logger.warning("Ignoring antenna height table: %s" % e)
+                heights = None
 
-            #done!            
-            self.vert_ht = float(output)
+        try:
+            if heights is not None and heights.covers(self.ant_type, self.ht_code):
+                self.vert_ht = heights.vertical(self.ant_ht, self.ant_type, self.ht_code)
+            elif self.ht_code == "DHARP":
+                self.vert_ht = self.ant_ht
+            else:
+                self.vert_ht = script_vertical_height(self.ant_ht, self.ant_type, self.ht_code)
+        except ValueError as e:
+            Logger.error("Couldn't calculate vertical height for %s: %s" % (self.site_id, e), 4)
 
     def __str__(self):
         ret_str = "%4s  %17s %17s %17s  %1.4f %6s %5s %1.4f %1.4f %22s %22s %17s %5s  %22s" % (   
@@ -144,45 +195,378 @@ class StationDB(object):
         the second value for the dates is the day-of-year.
         
         The actual parsing of a record, i.e. a line, is done in StationRecord.
+        The file is parsed once and kept in a compiled sidecar (station.info.idx)
+        that later instances load instead; lookups bisect the per-site records
+        sorted by session start.
     '''
     
-    sta_db = './station.info'
-    record = {}
+    sta_db  = './station.info'
+    lines   = {}                #site_id -> record lines sorted by session start
+    records = {}                #site_id -> records of these lines, built on first lookup
+    starts  = {}                #site_id -> sess_start of these records
+
+    #bump this when the layout of station.info.idx changes
+    idx_version = 1
 
-    def __init__(self):
+    def __init__(self, sta_db=None):
         '''
             Attempts to set station.info location to directory in the 
-            environment variable GIPSY_STA_INFO. If it can't find the file, 
-            logs error, which throws CleanShutDownRequest.
+            environment variable GIPSY_STA_INFO, unless sta_db is given. If it
+            can't find the file, logs error, which throws CleanShutDownRequest.
         '''
-        if os.environ['GIPSY_STA_INFO']:
+        if sta_db:
+            self.sta_db = sta_db
+        elif os.environ.get('GIPSY_STA_INFO'):
             self.sta_db = os.environ['GIPSY_STA_INFO']+'/station.info'
         
         if not os.path.isfile(self.sta_db):
             Logger.error("  Can't find station database at `%s'. Please check and adjust code / links accordingly.\n\
-            Note that this is a fixed-width formatted file!", 23)
+            Note that this is a fixed-width formatted file!" % self.sta_db, 23)
+
+        self.load()
+
+    def load(self):
+        '''
+        Reads the record lines of each site, sorted by session start, from the
+        compiled sidecar station.info.idx. If that is missing or outdated (size
+        or mtime of station.info changed), station.info is parsed and the 
+        sidecar rewritten. StationRecords of a site are built when it is first
+        looked up: records[site_id] holds them, starts[site_id] the session 
+        starts to bisect on.
+        '''
+        self.records = {}
+        self.starts  = {}
+        self.lines   = self.read_idx()
+
+        if self.lines is None:
+            self.lines = self.compile()
+            self.write_idx()
+
+    def compile(self):
+        '''
+        parses station.info, returns site_id -> record lines sorted by session start
+        '''
+        records = {}
+
+        with open(self.sta_db, 'r') as f:
+            for l in f:
+                rec = self.parse_line(l)
+                if rec is not None:
+                    records.setdefault(rec.line[1:5], []).append(rec)
+
+        lines = {}
+        for (site_id, recs) in records.items():
+            recs.sort(key=lambda rec: rec.sess_start)
+            lines[site_id] = [rec.line for rec in recs]
+
+        return lines
+
+    def idx_file(self):
+        return self.sta_db+'.idx'
+
+    def read_idx(self):
+        '''
+        lines from the sidecar, None if it's missing, broken or outdated
+        '''
+        try:
+            st = os.stat(self.sta_db)
+            with open(self.idx_file(), 'rb') as f:
+                (version, size, mtime, lines) = marshal.load(f)
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            return None
+
+        if version != self.idx_version or size != st.st_size or mtime != st.st_mtime:
+            return None
+
+        return lines
+
+    def write_idx(self):
+        '''
+        writes the sidecar, renamed into place so that concurrent readers never
+        see a partial file. Not being able to write it isn't an error.
+        '''
+        try:
+            st = os.stat(self.sta_db)
+            (fd, tmp_file) = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.sta_db)), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                marshal.dump((self.idx_version, st.st_size, st.st_mtime, self.lines), f, 2)
+            os.chmod(tmp_file, 0644)
+            os.rename(tmp_file, self.idx_file())
+        except (IOError, OSError):
+            Logger.warning("Couldn't write station db index `%s'" % self.idx_file())
+
+    def parse_line(self, l):
+        '''
+        StationRecord of a line, None for comments and malformed lines
+        '''
+        #records start with a blank, comments with `*'
+        if not l.startswith(' ') or not l.strip():
+            return None
+
+        l = l.rstrip('\r\n')
+
+        try:
+            return StationRecord(l)
+        except ValueError:
+            Logger.warning("Skipping malformed line in %s: `%s'" % (self.sta_db, l))
+            return None
+
+    def site_index(self, site_id):
+        '''
+        (starts, record) of a site: the sorted session starts and a function 
+        that returns the record of the i-th session. None if the site isn't
+        in station.info.
+        '''
+        if site_id not in self.records:
+            if site_id not in self.lines:
+                return None
+
+            recs = [StationRecord(l) for l in self.lines[site_id]]
+            self.records[site_id] = recs
+            self.starts[site_id]  = [rec.sess_start for rec in recs]
+
+        return (self.starts[site_id], self.records[site_id].__getitem__)
+
+    def start_key(self, start_time):
+        '''
+        start_time in the form of the session starts of site_index()
+        '''
+        return start_time
+
+    def covering(self, record, i, end_time):
+        '''
+        the record of the sessions before the i-th that lasts until end_time, 
+        older ones only matter if sessions overlap. Of overlapping sessions 
+        that cover the time span the one that started last wins, not the first
+        in station.info as with the grep this replaced.
+        '''
+        while i > 0:
+            i   -= 1
+            rec  = record(i)
+
+            if rec is not None and end_time <= rec.sess_end:
+                return rec
+
+        return None
 
     def get_record(self, site_id, start_time, end_time):
         '''
-        Reads station.info file, finds site, creates record
+        Finds the record of site that covers start_time to end_time
         '''
-        p1          = subprocess.Popen(["grep", "^ "+site_id, self.sta_db], stdout=subprocess.PIPE)
-        output,err  = p1.communicate()
+        index = self.site_index(site_id)
 
-        #Error Checking
-        if len(output) == 0:
+        if index is None:
             Logger.error("Couldn't find %s in %s" % (site_id, self.sta_db), 4)
 
-        if err != None:
-            Logger.error(err, 3)
+        (starts, record) = index
 
-        for l in output.splitlines():
-            rec  = StationRecord(l)
+        #last session that started before start_time
+        rec = self.covering(record, bisect.bisect_right(starts, self.start_key(start_time)), end_time)
 
-            #return the record that covers the current start time
-            if start_time >= rec.sess_start and end_time <= rec.sess_end:
-                return rec
-        
-        Logger.warning("Could not find an entry for site %s between %s - %s in station db %s ." % (site_id, start_time, end_time, self.sta_db))
-        
+        if rec is None:
+            Logger.warning("Could not find an entry for site %s between %s - %s in station db %s ." % (site_id, start_time, end_time, self.sta_db))
+
+        return rec
+
+    def get_records(self, queries):
+        '''
+        Records for a list of (site_id, start_time, end_time) queries, in the
+        order of the queries, None for those without a record. Queries are 
+        grouped by site and answered in order of start time in one pass over
+        the site's sessions. All misses are reported in one warning.
+        '''
+        found   = [None]*len(queries)
+        misses  = []
+        by_site = {}
+
+        for (i, (site_id, start_time, end_time)) in enumerate(queries):
+            by_site.setdefault(site_id, []).append(i)
+
+        for (site_id, idx) in sorted(by_site.items()):
+            index = self.site_index(site_id)
+
+            if index is None:
+                misses.extend(idx)
+                continue
+
+            (starts, record) = index
+            n = 0
+
+            for i in sorted(idx, key=lambda i: queries[i][1]):
+                (site_id, start_time, end_time) = queries[i]
+
+                #count sessions that started before start_time
+                key = self.start_key(start_time)
+                while n < len(starts) and starts[n] <= key:
+                    n += 1
+
+                found[i] = self.covering(record, n, end_time)
+
+                if found[i] is None:
+                    misses.append(i)
+
+        if misses:
+            Logger.warning("Could not find entries in station db %s for %d of %d queries:\n%s" % 
+                            (self.sta_db, len(misses), len(queries), 
+                             "\n".join("  %s %s - %s" % tuple(queries[i]) for i in sorted(misses))))
+
+        return found
+
+class MappedStationDB(StationDB):
+    '''
+        StationDB that memory-maps station.info rather than parsing all of it.
+        load() only records where each site's lines are: offsets[site_id] is a 
+        list of (start, end) byte ranges, one per block of consecutive lines. 
+        Lookups bisect the raw session starts of a site and build StationRecords
+        only for the lines they check.
+        Worker processes using this share the file through the page cache.
+    '''
+
+    mm      = None
+    offsets = {}                #site_id -> [(start, end), ...] byte ranges of its lines
+    indexes = {}                #site_id -> (starts, lines, built records), see site_index()
+
+    def load(self):
+        self.offsets = {}
+        self.indexes = {}
+
+        #can't map an empty file
+        if os.path.getsize(self.sta_db) == 0:
+            self.mm = ''
+            return
+
+        with open(self.sta_db, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        mm      = self.mm
+        size    = len(mm)
+        start   = 0
+
+        while start < size:
+            end = mm.find('\n', start)
+            end = size if end < 0 else end+1
+
+            if mm[start] == ' ':
+                ranges = self.offsets.setdefault(mm[start+1:start+5], [])
+
+                #extend the block if the site's previous line was the line before
+                if ranges and ranges[-1][1] == start:
+                    ranges[-1] = (ranges[-1][0], end)
+                else:
+                    ranges.append((start, end))
+
+            start = end
+
+    def site_index(self, site_id):
+        '''
+        session starts of the site as (year, doy, hour, minute, second), which is
+        cheaper than a datetime. Records are only built for the lines asked for.
+        The sorted lines and built records are kept for later lookups of the site.
+        '''
+        if site_id not in self.indexes:
+            if site_id not in self.offsets:
+                return None
+
+            lines = []
+            for (start, end) in self.offsets[site_id]:
+                for l in self.mm[start:end].splitlines():
+                    try:
+                        lines.append((tuple(int(x) for x in l[25:44].split()), l))
+                    except ValueError:
+                        Logger.warning("Skipping malformed line in %s: `%s'" % (self.sta_db, l))
+
+            lines.sort()
+
+            self.indexes[site_id] = ([key for (key, l) in lines], [l for (key, l) in lines], {})
+
+        (starts, lines, built) = self.indexes[site_id]
+
+        def record(i):
+            if i not in built:
+                built[i] = self.parse_line(lines[i])
+            return built[i]
+
+        return (starts, record)
+
+    def start_key(self, start_time):
+        t = start_time.timetuple()
+        return (t.tm_year, t.tm_yday, t.tm_hour, t.tm_min, t.tm_sec)
+
+    def close(self):
+        if self.mm:
+            self.mm.close()
+        self.mm = None
+
+class ReloadingStationDB(StationDB):
+    '''
+        StationDB for long-running processes. A background thread checks size 
+        and mtime of station.info every `interval' seconds. If they changed, it
+        loads a fresh StationDB and swaps it in with a single assignment. 
+        Lookups use the index that was current when they started and never wait
+        for a reload. reloads and last_reload (UTC) tell how often and when the
+        index was replaced.
+    '''
+
+    interval    = 60
+    db          = None          #the current index, a StationDB
+    stamp       = None          #(size, mtime) of station.info when db was loaded
+    reloads     = 0
+    last_reload = None
+
+    def __init__(self, interval=60, sta_db=None):
+        self.interval       = interval
+        self.reloads        = 0
+        self.last_reload    = None
+        self.stopped        = threading.Event()
+
+        StationDB.__init__(self, sta_db)
+
+        self.thread         = threading.Thread(target=self.watch)
+        self.thread.daemon  = True
+        self.thread.start()
+
+    def load(self):
+        self.stamp  = self.file_stamp()
+        self.db     = StationDB(self.sta_db)
+
+    def file_stamp(self):
+        st = os.stat(self.sta_db)
+        return (st.st_size, st.st_mtime)
+
+    def watch(self):
+        while not self.stopped.wait(self.interval):
+            self.check()
+
+    def check(self):
+        '''
+        reloads if station.info changed, returns True if it did. A file that
+        can't be read or parsed keeps the current index.
+        '''
+        try:
+            stamp = self.file_stamp()
+            if stamp == self.stamp:
+                return False
+
+            db = StationDB(self.sta_db)
+        except Exception as e:
+            Logger.warning("Reloading station db %s failed, keeping the current one: %s" % (self.sta_db, e))
+            return False
+
+        self.db             = db
+        self.stamp          = stamp
+        self.reloads       += 1
+        self.last_reload    = datetime.datetime.utcnow()
+
+        return True
+
+    def stop(self):
+        self.stopped.set()
+
+    def site_index(self, site_id):
+        return self.db.site_index(site_id)
+
+    def get_record(self, site_id, start_time, end_time):
+        return self.db.get_record(site_id, start_time, end_time)
 
+    def get_records(self, queries):
+        return self.db.get_records(queries)
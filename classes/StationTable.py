@@ -0,0 +1,182 @@
+#####################################################################################
+# StationTable.py part of GPStools
+#
+# Bulk loader for station.info. Parses the whole fixed-width file into one NumPy
+# structured array (one row per session) and runs queries over all sessions at
+# once. Needs numpy; StationDB does not.
+#
+# author:   Ronni Grapenthin
+#           Dept. Earth and Environmental Science
+#           New Mexico Tech
+#           801 Leroy Place
+#           Socorro, NM-87801
+#
+# email:    rg@nmt.edu
+#
+#####################################################################################
+
+import os
+import numpy as np
+
+from plog.plog import Logger
+
+#sessions that are still going on ("9999 999  0  0  0") end here
+OPEN_END = np.datetime64('9999-12-31T23:59:59', 's')
+
+class StationTable(object):
+    '''
+        station.info as a structured array `sessions' with the fields in `columns'.
+        Columns are cut where the StationDB docstring says they start:
+
+*SITE  Station Name      Session Start      Session Stop       Ant Ht   HtCod  Ant N    Ant E    Receiver Type         Vers                  SwVer  Receiver SN           Antenna Type     Dome   Antenna SN            [ Observer     ]         [Agency
+*2     8                 26                 45                 64       73     80       89       98                    120                   142    149                   171              188    195                   217                     241
+
+        Strings are stripped, session dates are datetime64[s] (`9999 999' ends
+        become OPEN_END), heights and eccentricities float64 (NaN if empty).
+        Lines with dates or numbers that don't parse are skipped with a
+        warning, just like StationDB does.
+    '''
+
+    #field, first and last+1 column (0-based), kind
+    columns = ( ('site_id',    1,   5,   'S4'),
+                ('site_name',  7,   25,  'S18'),
+                ('sess_start', 25,  44,  'date'),
+                ('sess_end',   44,  63,  'date'),
+                ('ant_ht',     63,  72,  'f8'),
+                ('ht_code',    72,  79,  'S7'),
+                ('ant_north',  79,  88,  'f8'),
+                ('ant_east',   88,  97,  'f8'),
+                ('rcx_type',   97,  119, 'S22'),
+                ('rcx_vers',   119, 141, 'S22'),
+                ('rcx_swver',  141, 148, 'S7'),
+                ('rcx_sn',     148, 170, 'S22'),
+                ('ant_type',   170, 187, 'S17'),
+                ('ant_dome',   187, 194, 'S7'),
+                ('ant_sn',     194, 216, 'S22'),
+                ('operator',   216, 240, 'S24'),
+                ('agency',     240, 300, 'S60') )
+
+    width       = 300
+    sta_db      = None
+    sessions    = None
+
+    def __init__(self, sta_db=None):
+        '''
+            loads station.info from sta_db (default: GIPSY_STA_INFO/station.info)
+        '''
+        if sta_db is None:
+            sta_db = os.environ.get('GIPSY_STA_INFO', '.')+'/station.info'
+
+        self.sta_db     = sta_db
+        self.sessions   = self.load(sta_db)
+
+    def dtype(self):
+        return np.dtype([(name, 'M8[s]' if kind == 'date' else kind) for (name, first, last, kind) in self.columns])
+
+    def load(self, sta_db):
+        with open(sta_db, 'rb') as f:
+            #records start with a blank, comments with `*'
+            lines = [l.rstrip('\r\n')[:self.width].ljust(self.width) for l in f if l.startswith(' ') and l.strip()]
+
+        sessions = np.zeros(len(lines), dtype=self.dtype())
+
+        if not lines:
+            return sessions
+
+        #one row of characters per line
+        chars = np.frombuffer(''.join(lines), dtype='S1').reshape(len(lines), self.width)
+        bad   = np.zeros(len(lines), dtype=bool)
+
+        for (name, first, last, kind) in self.columns:
+            field = self.cut(chars, first, last)
+
+            if kind == 'date':
+                sessions[name] = self.to_datetime(chars, first, bad)
+            elif kind == 'f8':
+                sessions[name] = self.to_float(field, bad)
+            else:
+                sessions[name] = np.char.strip(field)
+
+        for i in np.flatnonzero(bad):
+            Logger.warning("Skipping malformed line in %s: `%s'" % (sta_db, lines[i].rstrip()))
+
+        return sessions[~bad]
+
+    def cut(self, chars, first, last):
+        '''
+            columns first to last-1 of all lines as fixed-width strings
+        '''
+        return np.ascontiguousarray(chars[:, first:last]).view('S%d' % (last-first)).ravel()
+
+    def convert(self, field, kind, bad, blank):
+        '''
+            field as kind. Entries that don't convert are marked in bad and
+            become blank, only then does this go through them one by one.
+        '''
+        try:
+            return field.astype(kind)
+        except ValueError:
+            pass
+
+        field = field.copy()
+
+        for i in range(len(field)):
+            try:
+                field[i:i+1].astype(kind)
+            except ValueError:
+                bad[i]      = True
+                field[i]    = blank
+
+        return field.astype(kind)
+
+    def to_float(self, field, bad):
+        field = np.char.strip(field)
+        return self.convert(np.where(field == '', 'nan', field), np.float64, bad, 'nan')
+
+    def to_datetime(self, chars, first, bad):
+        '''
+            `YYYY DDD HH MM SS' starting at column first. Out of range fields 
+            are marked in bad (same check as StationDB.to_datetime()), except 
+            for the open end of year 9999.
+        '''
+        (year, doy, hour, minute, second) = [self.convert(self.cut(chars, first+a, first+b), np.int64, bad, '0')
+                                                for (a, b) in ((0, 4), (5, 8), (9, 11), (12, 14), (15, 17))]
+
+        valid = (1 <= doy) & (doy <= 366) & (0 <= hour) & (hour < 24) & \
+                    (0 <= minute) & (minute < 60) & (0 <= second) & (second < 61)
+        bad  |= ~valid & (year != 9999)
+
+        dates = (year-1970).astype('M8[Y]').astype('M8[s]') + \
+                    ((doy-1)*86400 + hour*3600 + minute*60 + second).astype('m8[s]')
+
+        return np.where(year == 9999, OPEN_END, dates)
+
+    def overlapping(self, start, end):
+        '''
+            sessions that overlap the window [start, end] (datetimes)
+        '''
+        start = np.datetime64(start, 's')
+        end   = np.datetime64(end, 's')
+
+        s = self.sessions
+        return s[(s['sess_start'] <= end) & (s['sess_end'] >= start)]
+
+    def with_antenna(self, ant_type):
+        '''
+            sessions with this antenna type
+        '''
+        return self.sessions[self.sessions['ant_type'] == ant_type]
+
+    def sites_with_antenna(self, ant_type, start=None, end=None):
+        '''
+            ids of sites that had this antenna type (during [start, end] if given)
+        '''
+        s = self.overlapping(start, end) if start is not None and end is not None else self.sessions
+        return np.unique(s['site_id'][s['ant_type'] == ant_type])
+
+    def site(self, site_id):
+        '''
+            sessions of one site, sorted by session start
+        '''
+        s = self.sessions[self.sessions['site_id'] == site_id]
+        return s[np.argsort(s['sess_start'], kind='mergesort')]
@@ -23,8 +23,10 @@ sys.path.append(
 
 import subprocess
 import datetime
+import fcntl
 import re
 import util.constants as const
+import classes.RinexHeader as RinexHeader
 
 from plog.plog import Logger
 
@@ -34,40 +36,81 @@ class Teqc(object):
     agency       = "Anonymous"
     sv_string    = "-R -E -S -C -J"  #default: no GLONASS, Galileo, SBAS, Compass, QZSS
     obs_string   = "+P +L2 +L1_2 +C2 +L2_2 +CA_L1 +L2C_L2" 
-    comment      = []
-    meta_info    = {}
+    comment      = None             #per instance, see __init__
+    meta_info    = None
+    meta_cached  = False            #meta_info came from a MetaCache
     __raw_file__ = None
+    splice_files = None             #further raw files of the same site-day, see splice()
+    highrate_dir = 'highrate'       #spliced or decimated high-rate rinex, see output_files()
     epoch        = datetime.datetime(1980, 1, 6)
     utcHour2char = [ 'a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i', 'j', 'k', 'l', 
                      'm', 'n', 'o', 'p', 'q', 'r', 's', 't', 'u', 'v', 'w', 'x' ]
 
-    #binaries we'll use
+    #binaries we'll use, looked up once per process
     teqc_bin     = None
     gzip_bin     = None
+    tee_bin      = None
 
-    def __init__(self, raw_file):
+    def __init__(self, raw_file, meta_info=None):
+        '''
+            meta_info may be given if it is known already (e.g., read by another
+            process), meta() won't look for it then
+        '''
         #assign file name        
         if os.path.isfile(raw_file):
             self.__raw_file__ = raw_file
         else:
             Logger.error("File `%s' does not exist." % raw_file, 23)        
 
-        #figure out paths to binaries
+        #state of this file, instances may be used concurrently
+        self.comment        = []
+        self.meta_info      = dict(meta_info) if meta_info else {}
+        self.splice_files   = []
+
+        Teqc.find_binaries()
+
+    @classmethod
+    def find_binaries(cls):
+        '''
+            figure out paths to binaries, unless that has been done before
+        '''
+        if cls.teqc_bin and cls.gzip_bin:
+            return
+
         proc = subprocess.Popen(['which', 'teqc'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        self.teqc_bin, err = proc.communicate()
+        teqc_bin, err = proc.communicate()
         
-        if len(self.teqc_bin) == 0 :
+        if len(teqc_bin) == 0 :
             Logger.error("Can't find teqc binary", 2)
 
         if err != None:
             Logger.error(err, 3)
 
-        proc = subprocess.Popen(['which', 'teqc'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        self.gzip_bin, err = proc.communicate()
+        proc = subprocess.Popen(['which', 'gzip'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        gzip_bin, err = proc.communicate()
         
-        if len(self.gzip_bin) == 0 :
+        if len(gzip_bin) == 0 :
             Logger.error("Can't find gzip binary", 2)
 
+        cls.teqc_bin = teqc_bin.strip()
+        cls.gzip_bin = gzip_bin.strip()
+
+    @classmethod
+    def find_tee(cls):
+        '''
+            tee is only needed when decimating, see start_translate()
+        '''
+        if cls.tee_bin:
+            return
+
+        proc = subprocess.Popen(['which', 'tee'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        tee_bin, err = proc.communicate()
+        
+        if len(tee_bin) == 0 :
+            Logger.error("Can't find tee binary", 2)
+
+        cls.tee_bin  = tee_bin.strip()
+
 
     def __sv_match__(self, sv_string, search=re.compile(r'[^\-\+RESCJG ]').search):
         '''
@@ -82,49 +125,92 @@ class Teqc(object):
         return not bool(search(obs_string))
 
 
-    def meta(self):
+    def meta(self, cache=None):
         '''
         reads teqc meta output into dictionary that can be accessed with the 
-        strings defined in util.const.py
+        strings defined in util.const.py. If a MetaCache is given, teqc only
+        runs for files that aren't in there yet (meta_cached tells which).
+        RINEX files are read without teqc, see native_meta().
         '''
         
         #do this only once!
-        if not self.meta_info:
+        if not self.meta_info and cache is not None:
+            key                 = cache.key(self.__raw_file__)
+            self.meta_info      = cache.lookup(key) or {}
+            self.meta_cached    = bool(self.meta_info)
+
+            if not self.meta_cached:
+                cache.store(key, self.meta())
 
-            teqc_run = subprocess.Popen(['teqc', '+quiet', '+meta', self.__raw_file__], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        if not self.meta_info and not self.native_meta():
+            teqc_run = subprocess.Popen(self.meta_argv(), stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
             out, err = teqc_run.communicate()
 
-            lines=out.split("\n")
-
-            for l in lines:
-                #only split first pair, note that times have ':' too!
-                o = l.split(':',1 )
-                
-                #need exactly 2 elements
-                if len(o) == 2:
-                    #convert dates
-                    if o[0] == const.TEQC_f_start or o[0] == const.TEQC_f_end:
-                        self.meta_info[o[0]] = datetime.datetime.strptime(o[1].strip(), const.TEQC_date_format)
-                    #convert floats
-                    elif o[0] == const.TEQC_sample_int or \
-                         o[0] == const.TEQC_lon or\
-                         o[0] == const.TEQC_lat or\
-                         o[0] == const.TEQC_elev or\
-                         o[0] == const.TEQC_ant_height:
-                        self.meta_info[o[0]] = float(o[1])
-                    #convert ints
-                    elif o[0] == const.TEQC_miss_epochs or\
-                         o[0] == const.TEQC_f_size:
-                        self.meta_info[o[0]] = int(o[1])
-                    #rest remains string
-                    else:
-                       self.meta_info[o[0]] = o[1].strip();
-        
-            #set gpsweek
-            self.meta_info[const.GPSweek] = (int((self.meta_info[const.TEQC_f_start] - self.epoch).days) / 7 )
+            self.parse_meta(out)
             
         return self.meta_info
 
+    def native_meta(self):
+        '''
+            fills meta_info of RINEX files from their header and first and last
+            epoch, False for anything else (and RINEX that wouldn't read), which
+            is left to teqc +meta
+        '''
+        if not RinexHeader.is_rinex(self.__raw_file__):
+            return False
+
+        try:
+            self.meta_info = RinexHeader.read_meta(self.__raw_file__)
+        except (ValueError, IndexError) as e:
+            Logger.warning("Reading RINEX `%s' failed (%s), trying teqc +meta" % (self.__raw_file__, e))
+            self.meta_info = {}
+            return False
+
+        self.meta_info[const.GPSweek] = self.gps_week()
+
+        return True
+
+    def gps_week(self):
+        return int((self.meta_info[const.TEQC_f_start] - self.epoch).days) / 7
+
+    def meta_argv(self):
+        return [self.teqc_bin, '+quiet', '+meta', self.__raw_file__]
+
+    def parse_meta(self, out):
+        '''
+            fills meta_info from the output of teqc +meta
+        '''
+        lines=out.split("\n")
+
+        for l in lines:
+            #only split first pair, note that times have ':' too!
+            o = l.split(':',1 )
+            
+            #need exactly 2 elements
+            if len(o) == 2:
+                #convert dates
+                if o[0] == const.TEQC_f_start or o[0] == const.TEQC_f_end:
+                    self.meta_info[o[0]] = datetime.datetime.strptime(o[1].strip(), const.TEQC_date_format)
+                #convert floats
+                elif o[0] == const.TEQC_sample_int or \
+                     o[0] == const.TEQC_lon or\
+                     o[0] == const.TEQC_lat or\
+                     o[0] == const.TEQC_elev or\
+                     o[0] == const.TEQC_ant_height:
+                    self.meta_info[o[0]] = float(o[1])
+                #convert ints
+                elif o[0] == const.TEQC_miss_epochs or\
+                     o[0] == const.TEQC_f_size:
+                    self.meta_info[o[0]] = int(o[1])
+                #rest remains string
+                else:
+                   self.meta_info[o[0]] = o[1].strip();
+    
+        #set gpsweek
+        self.meta_info[const.GPSweek] = self.gps_week()
+
+        return self.meta_info
+
     def add_commentLine(self, line):
         '''
             each string added here will be included as a 
@@ -132,13 +218,13 @@ class Teqc(object):
         '''
         self.comment.append(line)
         
-    def comment_string(self):
-        the_string = ""
+    def comment_args(self):
+        args = []
         
         for l in self.comment:
-            the_string += "+O.c '%s' " %l
+            args += ['+O.c', l]
             
-        return the_string
+        return args
 
     def add_sv_string(self, sv_string):
         if self.__sv_match__(sv_string):
@@ -152,54 +238,310 @@ class Teqc(object):
         else:
             Logger.warning("`%s' not supported by teqc, check `teqc -help'. Using default `%s' " % (obs_string, self.obs_string))
 
+    def splice(self, raw_files, cache=None, metas=None):
+        '''
+            adds the (hourly) raw files of the rest of the day, which teqc then
+            translates into one rinex file together with this one. meta_info
+            is extended to the span of all files. metas may map raw files to
+            their meta information if that is known already.
+        '''
+        starts = [(self.meta()[const.TEQC_f_start], self.__raw_file__)]
+        metas  = metas or {}
+
+        for raw_file in raw_files:
+            meta = Teqc(raw_file, metas.get(raw_file)).meta(cache)
+
+            if meta[const.TEQC_sample_int] != self.meta_info[const.TEQC_sample_int]:
+                Logger.warning("Splicing `%s' sampled at %s sec to files sampled at %s sec" % \
+                                (raw_file, meta[const.TEQC_sample_int], self.meta_info[const.TEQC_sample_int]))
+
+            starts.append((meta[const.TEQC_f_start], raw_file))
+
+            self.meta_info[const.TEQC_f_start] = min(self.meta_info[const.TEQC_f_start], meta[const.TEQC_f_start])
+            self.meta_info[const.TEQC_f_end]   = max(self.meta_info[const.TEQC_f_end], meta[const.TEQC_f_end])
+
+        #teqc wants them in time order
+        self.splice_files               = [f for (start, f) in sorted(starts)]
+        self.meta_info[const.GPSweek]   = self.gps_week()
+
+        return self.meta_info
+
+    def raw_files(self):
+        '''
+            this raw file, or all spliced files in time order
+        '''
+        return self.splice_files or [self.__raw_file__]
+
+    def high_rate(self):
+        '''
+            True for data sampled at 1 sec or faster, False if that's unknown
+            (see RinexHeader.read_meta())
+        '''
+        sample_int = self.meta_info.get(const.TEQC_sample_int)
+
+        return sample_int is not None and sample_int <= 1.0
+
     def get_hour_logged(self):
-        if self.meta_info[const.TEQC_sample_int] <= 1.0:
+        #a whole day
+        if self.splice_files:
+            return '0'
+
+        if self.high_rate():
             return self.utcHour2char[self.meta_info[const.TEQC_f_start].hour]
         else:
             return '0'
 
-    def translate(self, site_record):
+    def translate(self, site_record, decimate=None):
         '''
             runs the actual translation of the file from some native 
-            format into rinex (output to standard rinex file name)
+            format into rinex (output to standard rinex file name). teqc's
+            output is piped through gzip straight into the final .gz. teqc
+            writes the navigation file until it exits, so that is only
+            compressed afterwards, alongside whatever the observation gzip
+            has left to do.
+            Returns names of the compressed observation and navigation file
+            (and decimated observation file, see start_translate()).
         '''
-        #ensure we have meta info...
-        if not self.meta_info:
-            self.meta()
+        return self.start_translate(site_record, decimate).wait()
 
-        #figure out what receiver we are translating    
-        format_code = const.TEQC_format_translation_map[self.meta_info[const.TEQC_f_format]]
+    def output_files(self, site_id, decimate=None):
+        '''
+            (observation, navigation, decimated observation) rinex file that
+            start_translate() writes, before compression. The navigation file 
+            is None for RINEX input, the decimated one if there's no decimation.
+            Observation and navigation files of spliced days (see splice()) and
+            of decimated data go into highrate_dir, so that they don't take the
+            names of standard rate files. The decimated file gets the standard
+            name in the current directory.
+        '''
+        #there is no navigation data in RINEX observation files, teqc wouldn't write any
+        rinex_input = self.meta_info[const.TEQC_f_format].startswith('RINEX')
 
         #make rinex filenames     
-        file_base = "%s%s%s.%s" % ( site_record.site_id.lower(), 
+        file_base = "%s%s%s.%s" % ( (site_id or self.meta_info[const.TEQC_sta_id]).lower(), 
                                     self.meta_info[const.TEQC_f_start].strftime("%j"),
                                     self.get_hour_logged(),
                                     self.meta_info[const.TEQC_f_start].strftime("%y"))
 
         rnx_file  = file_base + "o"
-        nav_file  = file_base + "n"
-
-
-        subprocess.call("teqc "+
-                            format_code+" "+
-                            self.obs_string+" "+
-                            self.sv_string+" "+
-                            "-week %d " % self.meta_info[const.GPSweek] +
-                            "+nav %s "  % nav_file +
-                            "-O.mo %s " % site_record.site_id.upper() +
-                            "-O.mn %s " % site_record.site_id.upper() +
-                            "-O.rt '%s' " % site_record.rcx_type +
-                            "-O.rn %s " % site_record.rcx_sn +
-                            "-O.at '%s' " % site_record.ant_type +
-                            "-O.an %s " % site_record.ant_sn +
-                            "-O.pe %f %f %f " % (site_record.vert_ht, site_record.ant_east, site_record.ant_north) +
-                            "-O.o  '%s' " % site_record.operator +
-                            "-O.ag '%s' " % site_record.agency +
-                            self.comment_string() +
-                            self.__raw_file__ +" > %s " % rnx_file, shell=True)
-    
-        subprocess.call("gzip -f "+ rnx_file, shell=True)
-        subprocess.call("gzip -f "+ nav_file, shell=True)
+        nav_file  = file_base + "n" if not rinex_input else None
+        dec_file  = None
+        sample_int = self.meta_info.get(const.TEQC_sample_int)
+
+        if decimate and sample_int is not None and sample_int < decimate:
+            dec_file = rnx_file
+
+        if self.splice_files or dec_file is not None:
+            rnx_file = os.path.join(self.highrate_dir, rnx_file)
+            nav_file = os.path.join(self.highrate_dir, nav_file) if nav_file is not None else None
+
+        return (rnx_file, nav_file, dec_file)
+
+    def start_translate(self, site_record, decimate=None):
+        '''
+            starts the translation (see translate()) and returns without
+            waiting for it, the returned Translation tracks the processes.
+            If data are sampled faster than decimate seconds, teqc's output
+            also goes through a second teqc that decimates to this interval
+            in the same pass. The decimated file gets the standard name, see
+            output_files().
+        '''
+        #ensure we have meta info...
+        if not self.meta_info:
+            self.meta()
+
+        #figure out what receiver we are translating    
+        f_format = self.meta_info[const.TEQC_f_format]
+
+        if f_format not in const.TEQC_format_translation_map:
+            Logger.error("Don't know how to translate `%s' files (`%s')" % (f_format, self.__raw_file__), 3)
+
+        format_code = const.TEQC_format_translation_map[f_format]
+
+        (rnx_file, nav_file, dec_file) = self.output_files(site_record.site_id, decimate)
+        dec_argv  = None
+
+        if os.path.dirname(rnx_file):
+            #workers may race to create it
+            try:
+                os.makedirs(os.path.dirname(rnx_file))
+            except OSError:
+                if not os.path.isdir(os.path.dirname(rnx_file)):
+                    raise
+
+        if dec_file is not None:
+            Teqc.find_tee()
+
+            #reads rinex from stdin
+            dec_argv = [self.teqc_bin, '-O.dec', "%g" % decimate, '-O.int', "%g" % decimate]
+
+        #no shell, arguments go to teqc as they are
+        argv = [self.teqc_bin] + format_code.split() + self.obs_string.split() + self.sv_string.split() + \
+               ['-week',  "%d" % self.meta_info[const.GPSweek]] + \
+               (['+nav',  nav_file] if nav_file is not None else []) + \
+               ['-O.mo',  site_record.site_id.upper(),
+                '-O.mn',  site_record.site_id.upper(),
+                '-O.rt',  site_record.rcx_type,
+                '-O.rn',  site_record.rcx_sn,
+                '-O.at',  site_record.ant_type,
+                '-O.an',  site_record.ant_sn,
+                '-O.pe',  "%f" % site_record.vert_ht, "%f" % site_record.ant_east, "%f" % site_record.ant_north,
+                '-O.o',   site_record.operator,
+                '-O.ag',  site_record.agency] + \
+               self.comment_args() + self.raw_files()
+
+        return Translation(self.__raw_file__, argv, rnx_file, nav_file, dec_argv, dec_file)
+
+def inherit_only(keep):
+    '''
+        preexec_fn that closes all inheritable descriptors above stderr but 
+        keep (pass_fds of Python 3). Python 2 only closes fds for close_fds=True
+        after preexec_fn has run, that would take keep along.
+    '''
+    def close():
+        for fd in [int(fd) for fd in os.listdir('/dev/fd')]:
+            try:
+                if fd > 2 and fd != keep and not fcntl.fcntl(fd, fcntl.F_GETFD) & fcntl.FD_CLOEXEC:
+                    os.close(fd)
+            except (IOError, OSError):
+                #the descriptor of the listing itself, gone by now
+                pass
+
+    return close
+
+class Translation(object):
+    '''
+        teqc | gzip > rnx_file.gz of one raw file (or site-day), followed by gzip
+        of the navigation file once teqc has exited (not before, teqc isn't
+        done writing it until then). nav_file is None for RINEX input. When decimating, teqc's output
+        is tee'd into a second teqc (dec_argv): teqc | tee | gzip > rnx_file.gz
+        and tee > teqc -O.dec | gzip > dec_file.gz. poll() advances without
+        blocking, so that many of these can be driven from one loop (see
+        TeqcRunner).
+    '''
+
+    raw_file    = None
+    rnx_file    = None
+    nav_file    = None
+    dec_file    = None
+    outputs     = None          #open outputs of the observation gzips
+    pipeline    = None          #processes writing observation files
+    teqc_run    = None
+    nav_run     = None          #started once teqc has written the navigation file
+
+    def __init__(self, raw_file, argv, rnx_file, nav_file, dec_argv=None, dec_file=None):
+        self.raw_file   = raw_file
+        self.rnx_file   = rnx_file
+        self.nav_file   = nav_file
+        self.dec_file   = dec_file
+        self.outputs    = [open(rnx_file+'.gz', 'wb')]
+
+        #children get only the descriptors they're given, others would keep
+        #pipes of concurrent translations open and their readers waiting for EOF
+        self.teqc_run   = subprocess.Popen(argv, stdout=subprocess.PIPE, close_fds=True)
+
+        if dec_argv is None:
+            gzip_run        = subprocess.Popen([Teqc.gzip_bin, '-c'], stdin=self.teqc_run.stdout, stdout=self.outputs[0], 
+                                               close_fds=True)
+            self.pipeline   = [self.teqc_run, gzip_run]
+        else:
+            self.outputs.append(open(dec_file+'.gz', 'wb'))
+
+            #tee writes the second copy into this pipe, it must be the only one holding it
+            (dec_in, tee_out) = os.pipe()
+
+            tee_run     = subprocess.Popen([Teqc.tee_bin, '/dev/fd/%d' % tee_out], stdin=self.teqc_run.stdout, 
+                                           stdout=subprocess.PIPE, preexec_fn=inherit_only(tee_out))
+            os.close(tee_out)
+            gzip_run    = subprocess.Popen([Teqc.gzip_bin, '-c'], stdin=tee_run.stdout, stdout=self.outputs[0],
+                                           close_fds=True)
+            dec_run     = subprocess.Popen(dec_argv, stdin=dec_in, stdout=subprocess.PIPE, close_fds=True)
+            os.close(dec_in)
+            dec_gzip    = subprocess.Popen([Teqc.gzip_bin, '-c'], stdin=dec_run.stdout, stdout=self.outputs[1],
+                                           close_fds=True)
+
+            tee_run.stdout.close()
+            dec_run.stdout.close()
+
+            self.pipeline = [self.teqc_run, tee_run, gzip_run, dec_run, dec_gzip]
+
+        #the next process holds the pipe now, teqc gets SIGPIPE should it die
+        self.teqc_run.stdout.close()
+
+    def start_nav(self):
+        if self.nav_file is not None and self.nav_run is None and os.path.isfile(self.nav_file):
+            self.nav_run = subprocess.Popen([Teqc.gzip_bin, '-f', self.nav_file], close_fds=True)
+
+    def processes(self):
+        return self.pipeline + ([self.nav_run] if self.nav_run is not None else [])
+
+    def poll(self):
+        '''
+            True once all processes are done
+        '''
+        if self.teqc_run.poll() is None:
+            return False
+
+        self.start_nav()
+
+        return all(proc.poll() is not None for proc in self.processes())
+
+    def wait(self):
+        '''
+            blocks until all processes are done, see finish()
+        '''
+        self.teqc_run.wait()
+        self.start_nav()
+
+        for proc in self.processes():
+            proc.wait()
+
+        return self.finish()
+
+    def files(self):
+        return [self.rnx_file+'.gz'] + ([self.dec_file+'.gz'] if self.dec_file else [])
+
+    def finish(self):
+        '''
+            checks the exit status of all processes once they are done, returns
+            names of the compressed observation and navigation file (and the
+            decimated observation file). The navigation file is None for RINEX 
+            input.
+        '''
+        for out in self.outputs:
+            out.close()
+
+        if any(proc.returncode != 0 for proc in self.pipeline):
+            #don't leave truncated files that look like results
+            for f in self.files():
+                os.remove(f)
+
+        if self.teqc_run.returncode != 0:
+            Logger.error("teqc failed on `%s' (exit status %d)" % (self.raw_file, self.teqc_run.returncode), 3)
+
+        if any(proc.returncode != 0 for proc in self.processes()):
+            Logger.error("Compressing or decimating `%s' or compressing `%s' failed" % (self.rnx_file, self.nav_file), 3)
+
+        nav_gz = self.nav_file+'.gz' if self.nav_file is not None else None
+
+        Logger.info("Info: created `%s'" % "', `".join(self.files() + ([nav_gz] if nav_gz else [])))
+
+        return tuple(self.files()[:1] + [nav_gz] + self.files()[1:])
+
+    def kill(self):
+        '''
+            stops all processes and removes what they have written so far
+        '''
+        for proc in self.processes():
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+
+        for out in self.outputs:
+            out.close()
 
-        Logger.info("Info: created `%s.gz' and `%s.gz'" % (rnx_file, nav_file))
+        nav_files = [self.nav_file, self.nav_file+'.gz'] if self.nav_file is not None else []
 
+        for f in self.files() + nav_files:
+            if os.path.isfile(f):
+                os.remove(f)
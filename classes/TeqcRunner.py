@@ -0,0 +1,226 @@
+#####################################################################################
+# TeqcRunner.py part of GPStools
+#
+# Drives the teqc and gzip processes of many raw files from a single loop in
+# one process: a fixed number of files in flight, per-file timeouts, and
+# cancellation.
+#
+# author:   Ronni Grapenthin
+#           Dept. Earth and Environmental Science
+#           New Mexico Tech
+#           801 Leroy Place
+#           Socorro, NM-87801
+#
+# email:    rg@nmt.edu
+#
+#####################################################################################
+
+import time
+import tempfile
+import subprocess
+
+from plog.plog import Logger, CleanShutdownRequest
+from classes.Teqc import Teqc
+from util.util import job_error
+
+class TeqcJob(object):
+    '''
+        state of one raw file: teqc +meta, station.info lookup, translation
+    '''
+
+    raw_file    = None
+    site_id     = None
+    metas       = None          #raw file -> meta information, if read already
+    teqc        = None
+    stage       = None          #'meta', 'lookup', 'translate', see raw2rinex.stages
+    meta_run    = None
+    meta_out    = None          #temporary file teqc +meta writes to
+    translation = None
+    started     = 0.0
+    stage_start = 0.0
+    times       = None          #seconds per stage
+    hit         = False         #meta information came from the cache
+
+    def __init__(self, raw_file, site_id, metas=None):
+        self.raw_file   = raw_file
+        self.site_id    = site_id
+        self.metas      = metas or {}
+        self.times      = {}
+
+    def raw_files(self):
+        return self.raw_file if isinstance(self.raw_file, tuple) else (self.raw_file,)
+
+    def next_stage(self, stage):
+        now = time.time()
+
+        if self.stage is not None:
+            self.times[self.stage] = now - self.stage_start
+
+        self.stage          = stage
+        self.stage_start    = now
+
+    def kill(self):
+        if self.meta_run is not None and self.meta_run.poll() is None:
+            self.meta_run.kill()
+            self.meta_run.wait()
+
+        if self.meta_out is not None:
+            self.meta_out.close()
+
+        if self.translation is not None:
+            self.translation.kill()
+
+class TeqcRunner(object):
+    '''
+        run() starts up to max_files raw files at a time and polls their
+        processes, nothing blocks on a single file. setup(teqc) configures
+        each Teqc (comments, observables, ...), lookup(teqc, site_id) returns
+        the station record to translate with, site_id is None if it is to be
+        taken from the raw file. Files that run longer than timeout seconds
+        are killed, as are files passed to cancel() (all with None). A job's
+        raw file may be a tuple of files to splice (see Teqc.splice()),
+        decimate is passed on to Teqc.start_translate().
+    '''
+
+    lookup          = None
+    setup           = None
+    max_files       = 1
+    timeout         = None
+    cache           = None
+    decimate        = None
+    poll_interval   = 0.01
+    cancelled       = None
+
+    def __init__(self, lookup, setup=None, max_files=4, timeout=None, cache=None, decimate=None, poll_interval=0.01):
+        self.lookup         = lookup
+        self.setup          = setup
+        self.max_files      = max_files
+        self.timeout        = timeout
+        self.cache          = cache
+        self.decimate       = decimate
+        self.poll_interval  = poll_interval
+        self.cancelled      = set()
+
+    def cancel(self, raw_file=None):
+        '''
+            kills raw_file (all files if None) at the next poll, may be called
+            from signal handlers and other threads
+        '''
+        self.cancelled.add(raw_file)
+
+    def start(self, job):
+        job.teqc = Teqc(job.raw_files()[0], job.metas.get(job.raw_files()[0]))
+
+        if self.setup is not None:
+            self.setup(job.teqc)
+
+        job.started = time.time()
+        job.next_stage('meta')
+
+        if job.teqc.meta_info:
+            return
+
+        if self.cache is not None:
+            key                 = self.cache.key(job.raw_files()[0])
+            job.teqc.meta_info  = self.cache.lookup(key) or {}
+            job.hit             = bool(job.teqc.meta_info)
+
+        if not job.hit and not job.teqc.native_meta():
+            job.meta_out = tempfile.TemporaryFile()
+            job.meta_run = subprocess.Popen(job.teqc.meta_argv(), stdout=job.meta_out, stderr=subprocess.STDOUT)
+
+    def advance(self, job):
+        '''
+            moves job on as far as its processes allow, True once it is done
+        '''
+        if job.stage == 'meta':
+            if job.meta_run is not None:
+                if job.meta_run.poll() is None:
+                    return False
+
+                job.meta_out.seek(0)
+                job.teqc.parse_meta(job.meta_out.read())
+                job.meta_out.close()
+                job.meta_out = None
+
+                if self.cache is not None:
+                    self.cache.store(self.cache.key(job.raw_files()[0]), job.teqc.meta_info)
+
+            #the rest of the day, meta information usually cached when the jobs were grouped
+            if len(job.raw_files()) > 1:
+                job.teqc.splice(job.raw_files()[1:], self.cache, job.metas)
+
+            job.next_stage('lookup')
+            rec = self.lookup(job.teqc, job.site_id)
+
+            job.next_stage('translate')
+            job.translation = job.teqc.start_translate(rec, self.decimate)
+
+        if not job.translation.poll():
+            return False
+
+        job.translation.finish()
+        job.next_stage(None)
+
+        return True
+
+    def run(self, jobs):
+        '''
+            translates (raw file, site id[, metas]) jobs, metas maps raw files
+            to meta information read already. Yields (raw file, seconds per 
+            stage, meta cache hit, error) in the order they finish. Errors are
+            returned, see job_error().
+        '''
+        pending = [TeqcJob(*job) for job in reversed(jobs)]
+        running = []
+
+        try:
+            while pending or running:
+                while pending and len(running) < self.max_files and None not in self.cancelled:
+                    job = pending.pop()
+
+                    try:
+                        self.start(job)
+                        running.append(job)
+                    except (Exception, CleanShutdownRequest) as e:
+                        job.kill()
+                        yield (job.raw_file, None, False, job_error(e))
+
+                if None in self.cancelled:
+                    for job in pending:
+                        yield (job.raw_file, None, False, "Cancelled")
+                    pending = []
+
+                now     = time.time()
+                idle    = True
+
+                for job in list(running):
+                    error = None
+
+                    try:
+                        if None in self.cancelled or job.raw_file in self.cancelled:
+                            error = "Cancelled"
+                        elif self.advance(job):
+                            idle = False
+                            running.remove(job)
+                            yield (job.raw_file, job.times, job.hit, None)
+                            continue
+                        elif self.timeout is not None and now - job.started > self.timeout:
+                            error = "Timeout after %.1f s in stage `%s'" % (now - job.started, job.stage)
+                    except (Exception, CleanShutdownRequest) as e:
+                        error = job_error(e)
+
+                    if error is not None:
+                        idle = False
+                        job.kill()
+                        running.remove(job)
+                        Logger.info("Info: stopped `%s': %s" % (job.raw_file, error))
+                        yield (job.raw_file, None, False, error)
+
+                #only wait if none of the files got anywhere
+                if running and idle:
+                    time.sleep(self.poll_interval)
+        finally:
+            #interrupted, or the caller stopped iterating
+            for job in running:
+                job.kill()
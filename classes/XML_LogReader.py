@@ -14,34 +14,146 @@
 #
 #####################################################################################
 
-import xml.etree.ElementTree as ET
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
 import datetime as DT
 import os
 
+from classes.SiteLog import SiteLog, json_name, path_index, read_sidecar
+
 class XML_LogReader(object):
 
     #class variables
     tree            = None              #contains the full IGS log in ASCII format
-    root            = None              #root node of XML-DOM
+    dom             = None              #root node of XML-DOM, use root
     siteid          =''                 #need a flag for that.
     filename        =''
+    model           = None              #typed SiteLog, built on first use
+    index           = None              #path -> text of first node on that path
+    values          = None              #memoized floats and dates, by path
     
-    def __init__(self, xml_file, siteid):
+    #sections the constructor itself needs
+    base_sections   = ('form', 'site-identification')
+
+    def __init__(self, xml_file, siteid, sections=None):
+        '''
+            reads the log for site `siteid' from xml_file. If sections (tags of 
+            top-level nodes, e.g., ['location', 'antennas']) are given, only those 
+            (plus form and site-identification) are loaded and reading stops 
+            once all of them are found. Accessors of other sections raise 
+            IndexError then.
+        '''
         self.filename   = xml_file
         self.siteid     = siteid
 
-        parser = ET.XMLParser(encoding="utf-8")
-
-        with open(self.filename, 'r') as xml_f:
-            self.tree       = ET.parse(xml_f, parser=parser)
+        #the JSON sidecar (see write_sidecar()) loads a lot faster than the XML, use it if
+        #it is up to date. It has the path index of the whole log, the DOM is
+        #only read from the XML if someone asks for it.
+        json_file = json_name(self.filename)
+
+        if os.path.isfile(json_file) and os.path.isfile(self.filename) and \
+           os.path.getmtime(json_file) >= os.path.getmtime(self.filename):
+            try:
+                (self.model, self.index) = read_sidecar(json_file)
+            except (ValueError, KeyError, TypeError):
+                #outdated or broken sidecar, go with the XML
+                self.model = None
+
+        if self.model is None:
+            parser = ET.XMLParser(encoding="utf-8")
+
+            with open(self.filename, 'r') as xml_f:
+                if sections is None:
+                    self.tree   = ET.parse(xml_f, parser=parser)
+                else:
+                    self.tree   = self.parse_sections(xml_f, set(sections) | set(self.base_sections))
             
-        self.root       = self.tree.getroot()
+            self.dom        = self.tree.getroot()
+            self.index      = path_index(self.dom)
+
+        self.values     = {}
+        file_siteid     = self.text('site-identification/site-id')
+        self.prepdate   = self.date_value('form/date', '%Y-%m-%d')
         
         #uups, that'd be an interesting screw-up (given site-id not the one in XML file)
-        if self.root.findall('site-identification')[0].findall('site-id')[0].text.lower() != self.siteid.lower():
-            raise Exception("Site-id in `"+xml_file+"' is `"+self.root.findall('site-identification')[0].findall('site-id')[0].text+"' when we are looking for `"+self.siteid+"'")
-        
-        self.prepdate   = DT.datetime.strptime(self.root.findall('form')[0].findall('date')[0].text, '%Y-%m-%d')
+        if file_siteid.lower() != self.siteid.lower():
+            raise Exception("Site-id in `"+xml_file+"' is `"+file_siteid+"' when we are looking for `"+self.siteid+"'")
+
+    def parse_sections(self, xml_f, sections):
+        '''
+            incremental parse that keeps only the given top-level sections 
+            and stops reading as soon as all of them have been seen
+        '''
+        root    = None
+        depth   = 0
+        found   = set()
+
+        for (event, elem) in ET.iterparse(xml_f, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = elem
+                depth += 1
+                continue
+
+            depth -= 1
+
+            #only complete top-level sections are of interest
+            if depth != 1:
+                continue
+
+            if elem.tag in sections:
+                found.add(elem.tag)
+                if found == sections:
+                    break
+            else:
+                root.remove(elem)
+                elem.clear()
+
+        #the parser reads ahead, drop whatever it has started after the last section we need
+        for elem in [e for e in root if e.tag not in sections]:
+            root.remove(elem)
+
+        return ET.ElementTree(root)
+
+    @property
+    def root(self):
+        '''
+            root node of the XML-DOM. If the log came from the JSON sidecar,
+            the XML is parsed on first use.
+        '''
+        if self.dom is None:
+            with open(self.filename, 'r') as xml_f:
+                self.tree   = ET.parse(xml_f, parser=ET.XMLParser(encoding="utf-8"))
+
+            self.dom    = self.tree.getroot()
+
+        return self.dom
+
+    def text(self, path):
+        '''
+            text of the first node on path (e.g., `location/city-town'), 
+            IndexError if there is none
+        '''
+        try:
+            return self.index[path]
+        except KeyError:
+            raise IndexError("No `%s' in `%s'" % (path, self.filename))
+
+    def float_value(self, path):
+        try:
+            return self.values[path]
+        except KeyError:
+            x = self.values[path] = float(self.text(path))
+            return x
+
+    def date_value(self, path, date_format='%Y-%m-%dT%H:%MZ'):
+        try:
+            return self.values[path]
+        except KeyError:
+            x = self.values[path] = DT.datetime.strptime(self.text(path), date_format)
+            return x
 
     def site(self):
         return self.siteid.upper()
@@ -73,13 +185,13 @@ class XML_LogReader(object):
         return 1000001.00
 
     def XPos(self):
-        return float(self.root.findall('location')[0].findall('approx-position-itrf')[0].findall('x-coord')[0].text)
+        return self.float_value('location/approx-position-itrf/x-coord')
 
     def YPos(self):
-        return float(self.root.findall('location')[0].findall('approx-position-itrf')[0].findall('y-coord')[0].text)
+        return self.float_value('location/approx-position-itrf/y-coord')
 
     def ZPos(self):
-        return float(self.root.findall('location')[0].findall('approx-position-itrf')[0].findall('z-coord')[0].text)
+        return self.float_value('location/approx-position-itrf/z-coord')
 
     def XVel(self):
         #no place for velocities in IGS Log
@@ -94,7 +206,7 @@ class XML_LogReader(object):
         return 0.0
 
     def comment(self):
-        agency = self.root.findall('poc')[0].findall('agency')[0].text
+        agency = self.text('poc/agency')
         
         if len(agency)+len(self.filename) < 30 :
             return agency + " " + self.filename
@@ -102,10 +214,10 @@ class XML_LogReader(object):
         return agency
 
     def site_name(self):
-        return self.root.findall('site-identification')[0].findall('site-name')[0].text
+        return self.text('site-identification/site-name')
 
     def site_full_name(self):
-        return self.root.findall('site-identification')[0].findall('site-name')[0].text+", "+self.log_city()+", "+self.log_country
+        return self.site_name()+", "+self.loc_city()+", "+self.loc_country()
 
     def site_number(self):
         #official GPS stataion numbers do not yet exist
@@ -122,10 +234,10 @@ class XML_LogReader(object):
         return self.log_source(which='local-igs-log')
 
     def date(self):
-        return DT.datetime.strptime(self.log_source(which='date'), '%Y-%m-%dT%H:%MZ')
+        return self.date_value('log-source/date')
 
     def log_source(self, which='archive'):
-        return self.root.findall('log-source')[0].findall(which)[0].text
+        return self.text('log-source/'+which)
 
 ###LOCATION
     def loc_city(self):
@@ -138,25 +250,17 @@ class XML_LogReader(object):
         return self.location(which='country')
         
     def location(self, which='city-town'):
-        return self.root.findall('location')[0].findall(which)[0].text
+        return self.text('location/'+which)
 
 ###ARP
     def arp_vector(self, direction="east"):
-        tag = 'marker-arp-up-eccentricity'
-
-        if direction == "east":
-            tag = "marker-arp-east-eccentricity"
-        elif direction == "north":
-            tag = "marker-arp-north-eccentricity"
-        elif direction == "up":
-            tag = "marker-arp-up-eccentricity"
-        else:
+        if direction not in ("east", "north", "up"):
             raise Exception("Direction `"+direction+"' in arp_vector is not valid. Choose `east', `north', or `up'.")
             
-        try:
-            return float(self.root.findall('antennas')[0].findall('antenna')[-1].findall(tag)[0].text)
-        except TypeError:
-            return 0.0
+        #the current antenna is the last one in the log. Empty eccentricities
+        #are 0.0 in the model, so are non-numeric ones, with a warning when
+        #the log is parsed (see SiteLog.to_float())
+        return self.antennas()[-1]['arp_vec_'+direction]
     
     def to_text(self, elem):
         return elem.text if elem is not None else ''
@@ -179,23 +283,21 @@ class XML_LogReader(object):
         except ValueError:
             return None
 
+    def site_log(self):
+        '''
+            typed model of the log (see SiteLog), built once
+        '''
+        if self.model is None:
+            self.model = SiteLog.from_xml(self.root)
+
+        return self.model
+
     def antennas(self):
-        ants = []
-        for ant in self.root.findall('antennas')[0].findall('antenna'):
-                ants.append({
-                    'type':             self.to_text(ant.findall('antenna-type')[0]), 
-                    'serial':           self.to_text(ant.findall('serial-number')[0]), 
-                    'arp':              self.to_text(ant.findall('antenna-reference-point')[0]), 
-                    'arp_vec_east':     self.to_float(ant.findall('marker-arp-east-eccentricity')[0]),
-                    'arp_vec_north':    self.to_float(ant.findall('marker-arp-north-eccentricity')[0]),
-                    'arp_vec_up':       self.to_float(ant.findall('marker-arp-up-eccentricity')[0]),
-                    'north-deviation':  self.to_float(ant.findall('alignment-from-true-north')[0]),
-                    'radome-type':      self.to_text(ant.findall('radome-type')[0]),
-                    'radome-serial':    self.to_text(ant.findall('radome-serial-number')[0]), 
-                    'cable-type':       self.to_text(ant.findall('antenna-cable-type')[0]), 
-                    'cable-length':     self.to_float(ant.findall('antenna-cable-length')[0]), 
-                    'installed':        self.to_date(ant.findall('date-installed')[0]),
-                    'removed':          self.to_date(ant.findall('date-removed')[0])
-                    })
-
-        return ants
+        '''
+            antenna records, oldest first. These can be indexed like dicts, 
+            e.g., antenna['installed'] or antenna['arp_vec_up'].
+        '''
+        return self.site_log().antennas
+
+    def receivers(self):
+        return self.site_log().receivers
@@ -14,21 +14,45 @@
 ##DETAILS
 # The IGS log file can either be given via the -f 
 #
+# In batch mode (-b) all logs in a directory (*.log) or matching a glob pattern
+# are converted on a pool of worker processes (-j). Output names and collision
+# handling are the same as for a single file.
+#
+# A stream of concatenated logs (-d, plain or gzip'ed file, or `-' for stdin)
+# is parsed lazily and each site's XML is written section by section, so 
+# neither the dump nor a full log is held in memory.
+#
+# Unless --no-cache is given, the XML of logs that have been converted before
+# is taken from the parse cache in GPS_SITE_DOC (see classes/LogCache.py).
+#
+# Next to each XML file a JSON sidecar (site.json) is written that XML_LogReader
+# loads instead of the XML as long as it is newer (see classes/SiteLog.py).
+#
 ##CHANGELOG
 #
 ###########################################################################
 
-import sys, getopt, os, shutil
-from classes.IGSLog import IGSLog
+import sys, getopt, os, shutil, glob, time, uuid, gzip
+import multiprocessing
+from classes.IGSLog import IGSLog, split_logs
+from classes.LogCache import LogCache
+from classes.SiteLog import json_name, write_sidecar
+from util.util import job_error
 
 def usage():
     print "Usage: igslog2xml -i <site-id | filename> [-o <outfile>] [-h]\n\
+       igslog2xml -b <directory | glob> [-j <workers>] [-h]\n\
+       igslog2xml -d <dump file | -> [-h]\n\
 igslog2xml, GPStools\n\n\
 Author: rn grapenthin, New Mexico Tech\n\n\
 OPTIONS:\n\
    -h, --help\t\tprint this help\n\
    -i, --input\t\teither 4-char site-id (file looked up under $GPS_SITE_DOC or filename.\n\
-   -o, --output\t\toutput file (default: $GPS_SITE_DOC/site.xml)\n\n\
+   -o, --output\t\toutput file (default: $GPS_SITE_DOC/site.xml)\n\
+   -b, --batch\t\tconvert all logs in directory (*.log) or matching glob pattern (quote it!)\n\
+   -j, --jobs\t\tnumber of worker processes in batch mode (default: number of CPUs)\n\
+   -d, --dump\t\tconvert all logs in a stream of concatenated logs (*.gz or `-' for stdin work too)\n\
+       --no-cache\t\tparse every log, don't use the parse cache in $GPS_SITE_DOC\n\n\
 Report bugs to rg@nmt.edu\n\
 "
 
@@ -40,13 +64,169 @@ def contains_path(filename):
 
     return False
 
+def unique_xml_name(xmlfile, gps_site_doc, taken=()):
+    '''
+        appends a uuid to xmlfile if it exists in the current directory, 
+        the site doc archive, or has already been taken by another log 
+        in this batch
+    '''
+    if os.path.isfile(xmlfile) or (gps_site_doc and os.path.isfile(gps_site_doc+"/"+xmlfile)) or xmlfile in taken:
+        f_expansion = str(uuid.uuid4())    
+        sys.stderr.write("\nWarning: `"+xmlfile+"' already exists. I'll write to `"+xmlfile+"."+f_expansion+"\n")
+        xmlfile = xmlfile+"."+f_expansion
+
+    return xmlfile
+
+def convert(logfile, site, xmlfile, gps_site_doc, cache=None):
+    '''
+        read, parse, write XML and its JSON sidecar. Moves the results into the
+        site doc archive if set. Logs found in the cache aren't parsed, the cached
+        XML is used instead. Returns True for a cache hit.
+    '''
+    hit = False
+    log = None
+
+    if cache is not None and cache.enabled():
+        key = cache.key(logfile)
+        cached = cache.lookup(site, key)
+
+        if cached:
+            try:
+                shutil.copyfile(cached, xmlfile)
+                hit = True
+            except IOError:
+                #evicted by another process since the lookup, parse then
+                pass
+
+        if not hit:
+            log = IGSLog(logfile, site)
+            log.parse()
+            log.write(xmlfile)
+            cache.store(site, key, xmlfile)
+    else:
+        log = IGSLog(logfile, site)
+        log.parse()
+        log.write(xmlfile)
+
+    write_sidecar(xmlfile, log.root if log is not None else None)
+
+    move_to_archive(xmlfile, gps_site_doc)
+
+    return hit
+
+def move_to_archive(xmlfile, gps_site_doc):
+    '''
+        moves XML file and its JSON sidecar into the site doc archive, if set
+    '''
+    if gps_site_doc:
+        #os.rename won't copy across partitions, the JSON goes last so that
+        #it stays newer than the XML
+        shutil.move(xmlfile, gps_site_doc+"/"+xmlfile)
+        shutil.move(json_name(xmlfile), gps_site_doc+"/"+json_name(xmlfile))
+
+def convert_job(job):
+    '''
+        runs convert() in a worker process, errors are returned (see job_error())
+    '''
+    (logfile, site, xmlfile, gps_site_doc, cache) = job
+
+    try:
+        hit = convert(logfile, site, xmlfile, gps_site_doc, cache)
+    except Exception as e:
+        return (logfile, xmlfile, False, job_error(e))
+
+    return (logfile, xmlfile, hit, None)
+
+def batch_logs(batch):
+    if os.path.isdir(batch):
+        batch = os.path.join(batch, '*.log')
+
+    return sorted(f for f in glob.glob(batch) if os.path.isfile(f))
+
+def run_batch(batch, workers, gps_site_doc, cache=None):
+    logfiles = batch_logs(batch)
+
+    if not logfiles:
+        sys.stderr.write("\nError: no log files found for `"+batch+"'.\n")
+        sys.exit(2)
+
+    #output names are decided up front, so that workers don't race for the same name
+    jobs  = []
+    taken = set()
+    for logfile in logfiles:
+        site    = os.path.basename(logfile)[:4].lower()
+        xmlfile = unique_xml_name(site+".xml", gps_site_doc, taken)
+        taken.add(xmlfile)
+        jobs.append((logfile, site, xmlfile, gps_site_doc, cache))
+
+    start   = time.time()
+    pool    = multiprocessing.Pool(workers)
+    failed  = []
+
+    try:
+        for (logfile, xmlfile, hit, error) in pool.imap_unordered(convert_job, jobs):
+            if error:
+                failed.append(logfile)
+                sys.stderr.write("Error: converting `"+logfile+"' failed: "+error+"\n")
+            elif cache is not None:
+                cache.record(hit)
+    finally:
+        pool.close()
+        pool.join()
+
+    elapsed = time.time() - start
+
+    print "Converted %d of %d logs in %.2f s (%.1f files/sec) with %d workers, %d failed." % \
+            (len(jobs)-len(failed), len(jobs), elapsed, len(jobs)/elapsed if elapsed > 0 else 0.0, workers, len(failed))
+
+    if cache is not None and cache.enabled():
+        cache.evict()
+        print cache.summary()
+
+    if gps_site_doc:
+        print "XML files are in site-log archive '"+gps_site_doc+"'"
+    else:
+        print "Environment variable 'GPS_SITE_DOC' not set. XML files remain in current directory."
+
+    return len(failed)
+
+def run_dump(dump, gps_site_doc):
+    if dump == '-':
+        f = sys.stdin
+    elif dump.endswith('.gz'):
+        f = gzip.open(dump, 'rb')
+    else:
+        f = open(dump, 'r')
+
+    taken = set()
+    for log in split_logs(f):
+        xmlfile = unique_xml_name(log.site_id+".xml", gps_site_doc, taken)
+        taken.add(xmlfile)
+
+        with open(xmlfile, 'w') as out:
+            log.stream(out)
+
+        #the DOM is gone after streaming, the sidecar comes from the (single site) XML
+        write_sidecar(xmlfile)
+
+        move_to_archive(xmlfile, gps_site_doc)
+
+        print "Wrote `"+xmlfile+"'"
+
+    f.close()
+
+    if gps_site_doc:
+        print "XML files are in site-log archive '"+gps_site_doc+"'"
+    else:
+        print "Environment variable 'GPS_SITE_DOC' not set. XML files remain in current directory."
+
 ############# ############# ############# 
 ############# MAIN STUFF
 ############# ############# ############# 
 if __name__ == '__main__':
     try:
         #":" and "=" indicate that these parameters take arguments! Do not simply delete these!
-        opts, args = getopt.getopt(sys.argv[1:], "hi:o:",["help", "input=", "output="])
+        opts, args = getopt.getopt(sys.argv[1:], "hi:o:b:j:d:",["help", "input=", "output=", "batch=", "jobs=", "dump=", "no-cache"])
     except getopt.GetoptError as e:
         sys.stderr.write("Error: {0} \n\n".format(e.msg))
         usage()
@@ -56,6 +236,10 @@ if __name__ == '__main__':
     in_name             = ''
     out_name            = ''
     input_is_site_id    = False
+    batch               = ''
+    dump                = ''
+    use_cache           = True
+    workers             = multiprocessing.cpu_count()
     gps_site_doc        = os.environ.get('GPS_SITE_DOC')
 
 ##interpret command line
@@ -72,10 +256,44 @@ if __name__ == '__main__':
 #output
         elif opt in ("-o", "--output"):
             out_name = arg.lower()
+#batch
+        elif opt in ("-b", "--batch"):
+            batch = arg
+#workers
+        elif opt in ("-j", "--jobs"):
+            workers = int(arg)
+#dump
+        elif opt in ("-d", "--dump"):
+            dump = arg
+#cache
+        elif opt in ("--no-cache",):
+            use_cache = False
 #unknown
         else:
             assert False, "unhandled option: `%s'" % opt
 
+##batch and dump mode
+if batch and dump:
+    sys.stderr.write("\nError: `batch' can't be combined with `dump'.\n\n" )
+    usage()
+    sys.exit(2)
+
+if batch or dump:
+    if in_name or out_name:
+        sys.stderr.write("\nError: `batch' and `dump' can't be combined with `input' or `output'.\n\n" )
+        usage()
+        sys.exit(2)
+
+    if dump:
+        run_dump(dump, gps_site_doc)
+        sys.exit(0)
+
+    if workers < 1:
+        sys.stderr.write("\nError: need at least 1 worker.\n\n" )
+        sys.exit(2)
+
+    sys.exit(1 if run_batch(batch, workers, gps_site_doc, LogCache() if use_cache else None) else 0)
+
 ##consistency checks 
 if not in_name:
     sys.stderr.write("\nError: `input' not specified. Use `-i' option.\n\n" )
@@ -119,21 +337,19 @@ try:
 except OSError:
     pass
 
-if os.path.isfile(xmlfile) or os.path.isfile(gps_site_doc+"/"+xmlfile):
-    import uuid
-    f_expansion = str(uuid.uuid4())    
-    sys.stderr.write("\nWarning: `"+xmlfile+"' already exists. I'll write to `"+xmlfile+"."+f_expansion+"\n")
-    xmlfile = xmlfile+"."+f_expansion
+xmlfile = unique_xml_name(xmlfile, gps_site_doc)
 
 #read, pase, write.
-log = IGSLog.IGSLog(logfile, site)
-log.parse()
-log.write(xmlfile)
+cache = LogCache() if use_cache else None
+
+if convert(logfile, site, xmlfile, gps_site_doc, cache):
+    print "Unchanged log `"+logfile+"', using cached XML"
+
+if cache is not None:
+    cache.evict()
 
 if gps_site_doc:
-    print "Moving xml file to site-log archive '"+gps_site_doc+"'"
-    #os.rename won't copy across partitions
-    shutil.move(xmlfile, gps_site_doc+"/"+xmlfile)
+    print "Moved xml file to site-log archive '"+gps_site_doc+"'"
 else:
     print "Environment variable 'GPS_SITE_DOC' not set. XML file remains in current directory."
 
@@ -117,8 +117,19 @@ if not os.path.isfile(xmlfile):
 ###----------------------
 #+#READ XML log
 ###----------------------
+#only load the sections the requested output needs
+sections = set()
+if pos or gipsy_pos or gipsy_sta_id:
+    sections.add('location')
+if arp_vector or gipsy_svec:
+    sections.add('antennas')
+if gipsy_pos:
+    sections.add('poc')
+if gipsy_svec:
+    sections.add('log-source')
+
 try:
-    log = XML_LogReader(xmlfile, site)
+    log = XML_LogReader(xmlfile, site, sections=sections)
 except Exception as e:
     sys.stderr.write("\nSomething went wrong ... \n\n")
     sys.stderr.write("%s\n\n" % e)
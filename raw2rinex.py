@@ -8,32 +8,413 @@ import sys,os
 import datetime, getopt
 import util.constants as const
 import subprocess
+import glob, time
+import multiprocessing
+import signal
 
 from plog.plog import Logger, CleanShutdownRequest
 from classes.Teqc import Teqc
-from classes.StationDB import StationDB
+from classes.StationDB import StationDB, MappedStationDB
+from classes.MetaCache import MetaCache
+from classes.TeqcRunner import TeqcRunner
+from util.util import job_error
 
-############# ############# ############# 
+############# ############# #############
 ############# AUX STUFF
-############# ############# ############# 
+############# ############# #############
 
 def usage():
-    print "Usage: raw2rinex.py --site <4-char-id> --file <e.g., trimble .dat file>\n\
+    print "Usage: raw2rinex.py --site <4-char-id> --file <e.g., trimble .dat file> [--decimate <sec>]\n\
+       raw2rinex.py [--site <4-char-id>] --batch <directory | glob> [--jobs <N>] [--single [--timeout <sec>]]\n\
+                    [--splice] [--decimate <sec>]\n\
+       raw2rinex.py --manifest <file> [--jobs <N>] [--single [--timeout <sec>]] [--splice] [--decimate <sec>]\n\n\
+In batch mode the site id is taken from --site, the second column of the\n\
+manifest (one raw file per line, optionally followed by the site id), or\n\
+the receiver file, in this order. With --single all teqc and gzip processes\n\
+are run from this process, --jobs files at a time, files taking longer than\n\
+--timeout seconds are killed, SIGTERM kills all running files. Files that\n\
+would be translated to the same rinex file as an earlier one are skipped.\n\n\
+--splice translates the high-rate (1 sec or faster) files of a site and day\n\
+into one daily rinex file in ./highrate with a single teqc run. With\n\
+--decimate (e.g., 30) data sampled faster than that are also written at that\n\
+interval in the same pass, to the standard file name, the high-rate file\n\
+then goes to ./highrate.\n\n\
+teqc +meta output is cached in $TEQC_META_CACHE (default: ~/.teqc_meta_cache)\n\
+for files with unchanged path, size and mtime (content with --content-hash).\n\
+--no-cache runs teqc +meta on every file.\n\
 Author: rn grapenthin, NMT"
 
-############# ############# ############# 
+#stages of a translation, in order
+stages = ('meta', 'lookup', 'translate')
+
+#station.info and meta cache of a batch worker, opened once per process
+worker_sta_db   = None
+worker_error    = None          #why the worker couldn't open station.info
+worker_cache    = None
+worker_decimate = None
+
+def setup_teqc(teqc):
+    teqc.operator   = "Ronni Grapenthin"
+    teqc.agency     = "New Mexico Tech"
+
+    teqc.add_commentLine("")
+    teqc.add_commentLine("For more information about these data contact:")
+    teqc.add_commentLine("")
+    teqc.add_commentLine("Ronni Grapenthin (rg@nmt.edu)")
+    teqc.add_commentLine("         Dept. Earth and Environmental Scienes")
+    teqc.add_commentLine("         New Mexico Tech")
+    teqc.add_commentLine("         801 Leroy Pl")
+    teqc.add_commentLine("         Socorro, NM-87801")
+    teqc.add_commentLine("")
+
+    teqc.add_sv_string("-R -E -S -C -J")
+    teqc.add_observables_string("+P +L2 +L1_2 +C2 +L2_2 +CA_L1 +L2C_L2")
+
+def raw2rinex(raw_file, site_id, sta_db, cache=None, decimate=None, metas=None):
+    '''
+        translates raw_file to gzip'ed rinex, returns seconds spent per stage
+        and whether the meta information came from the cache. If site_id is 
+        None, the one in the receiver file is used. raw_file may be a tuple
+        of the files of a site-day (see splice_jobs()), which are translated
+        into one rinex file. Data sampled faster than decimate seconds are
+        also written decimated to that interval (see Teqc.start_translate()).
+        metas maps raw files to their meta information if that is known.
+    '''
+    times   = {}
+    start   = time.time()
+    files   = raw_file if isinstance(raw_file, tuple) else (raw_file,)
+    metas   = metas or {}
+
+    teqc    = Teqc(files[0], metas.get(files[0]))
+    setup_teqc(teqc)
+
+    #get meta information from raw file
+    teqc.meta(cache)
+
+    if len(files) > 1:
+        teqc.splice(files[1:], cache, metas)
+
+    times['meta'] = time.time() - start
+    start         = time.time()
+
+    rec = site_record(teqc, site_id, sta_db)
+
+    times['lookup'] = time.time() - start
+    start           = time.time()
+
+    #includes compression, teqc's output goes straight into gzip
+    teqc.translate(rec, decimate)
+
+    times['translate'] = time.time() - start
+
+    return (times, teqc.meta_cached)
+
+def site_record(teqc, site_id, sta_db):
+    '''
+        the station.info record that spans the raw file, with vertical antenna
+        height, operator and agency filled in. If site_id is None, the one in
+        the receiver file is used.
+    '''
+    meta = teqc.meta()
+
+    if site_id is None:
+        site_id = meta[const.TEQC_sta_id].upper()
+
+    #some info for the user...
+    if meta.get(const.TEQC_sample_int) is None:
+        Logger.info("Info: Unknown sampling rate, single epoch")
+    elif teqc.high_rate():
+        Logger.info("Info: High rate sampling (%s sec)" % (meta[const.TEQC_sample_int]) )
+    else:
+        Logger.info("Info: Standard rate sampling (%s sec)" % (meta[const.TEQC_sample_int]) )
+
+    if meta[const.TEQC_sta_id] != site_id:
+        Logger.info("Info: Given site-id `%s' overrides site-id in receiver file `%s' " % (site_id, meta[const.TEQC_sta_id]))
+
+    #extract the record that spans the correct time from station.info
+    rec = sta_db.get_record(site_id=site_id, start_time=meta[const.TEQC_f_start], end_time=meta[const.TEQC_f_end])
+
+    if rec is None:
+        raise Exception("No station.info record for `%s' between %s - %s" % (site_id, meta[const.TEQC_f_start], meta[const.TEQC_f_end]))
+
+    rec.calculate_vertical_antenna_height()
+
+    if not rec.operator:
+        rec.operator = teqc.operator
+    if not rec.agency:
+        rec.agency   = teqc.agency
+
+    Logger.info("Info: Using site-record `%s'" % rec)
+
+    return rec
+
+def batch_files(batch):
+    '''
+        (raw file, None) for all files in a directory or matching a glob pattern
+    '''
+    if os.path.isdir(batch):
+        batch = os.path.join(batch, '*')
+
+    return [(f, None) for f in sorted(glob.glob(batch)) if os.path.isfile(f)]
+
+def manifest_files(manifest):
+    '''
+        (raw file, site id or None) for each line of the manifest
+    '''
+    files = []
+
+    with open(manifest, 'r') as f:
+        for l in f:
+            cols = l.split()
+
+            if not cols or cols[0].startswith('#'):
+                continue
+
+            files.append((cols[0], cols[1].upper() if len(cols) > 1 else None))
+
+    return files
+
+def splice_jobs(jobs, metas):
+    '''
+        merges jobs of high-rate (1 sec or faster) files of the same site and
+        day into one job with a tuple of these raw files, so that each day is
+        translated by a single teqc run. Other files stay jobs of their own.
+        metas maps raw files to their meta information (see read_metas()).
+    '''
+    days    = {}
+    spliced = []
+
+    for (raw_file, site_id) in jobs:
+        if raw_file not in metas:
+            #left to the translation to report
+            spliced.append((raw_file, site_id))
+            continue
+
+        teqc = Teqc(raw_file, metas[raw_file])
+        meta = teqc.meta_info
+
+        if not teqc.high_rate():
+            spliced.append((raw_file, site_id))
+            continue
+
+        day = (site_id or meta[const.TEQC_sta_id].upper(), meta[const.TEQC_f_start].date())
+        days.setdefault(day, []).append(raw_file)
+
+    for ((site_id, day), files) in sorted(days.items()):
+        spliced.append((tuple(files) if len(files) > 1 else files[0], site_id))
+
+    return spliced
+
+def job_name(raw_file):
+    if isinstance(raw_file, tuple):
+        return "%s .. %s (%d files)" % (raw_file[0], raw_file[-1], len(raw_file))
+
+    return raw_file
+
+def init_worker(quiet, sta_db_file, use_cache, content_hash, decimate):
+    global worker_sta_db, worker_error, worker_cache, worker_decimate
+
+    if quiet:
+        Logger.off()
+
+    #workers share station.info through the page cache. The pool respawns
+    #workers that fail here over and over, the jobs report it instead.
+    try:
+        worker_sta_db   = MappedStationDB(sta_db_file)
+    except (Exception, CleanShutdownRequest) as e:
+        worker_error    = job_error(e)
+
+    worker_cache    = MetaCache(content_hash=content_hash) if use_cache else None
+    worker_decimate = decimate
+
+def meta_job(raw_file):
+    '''
+        meta information of a raw file in a worker process: (raw file, meta 
+        information, cache hit, seconds). Meta information is None if it can't
+        be read, that's left to the translation to report.
+    '''
+    start = time.time()
+
+    try:
+        teqc = Teqc(raw_file)
+        meta = teqc.meta(worker_cache)
+    except (Exception, CleanShutdownRequest):
+        return (raw_file, None, False, time.time() - start)
+
+    return (raw_file, meta, teqc.meta_cached, time.time() - start)
+
+def read_metas(jobs, pool, cache=None):
+    '''
+        meta information of the raw files of all jobs, read on the pool. 
+        Returns (raw file -> meta information, seconds spent).
+    '''
+    raw_files   = [f for (raw_file, site_id) in jobs for f in (raw_file if isinstance(raw_file, tuple) else (raw_file,))]
+    metas       = {}
+    seconds     = 0.0
+
+    for (raw_file, meta, hit, t) in pool.imap_unordered(meta_job, raw_files):
+        seconds += t
+
+        if meta is not None:
+            metas[raw_file] = meta
+
+            if cache is not None:
+                cache.record(hit)
+
+    return (metas, seconds)
+
+def claim_outputs(jobs, metas, decimate=None):
+    '''
+        claims the rinex files each job writes (see Teqc.output_files()), in 
+        order, so that no two jobs write the same file. Returns the jobs with
+        their meta information, (raw file, site id, metas), and (raw file, 
+        error) of jobs that would write files claimed already.
+    '''
+    claimed = {}
+    keep    = []
+    skipped = []
+
+    for (raw_file, site_id) in jobs:
+        files       = raw_file if isinstance(raw_file, tuple) else (raw_file,)
+        job_metas   = dict((f, metas[f]) for f in files if f in metas)
+
+        #no meta information, translation will fail and report why
+        if len(job_metas) < len(files):
+            keep.append((raw_file, site_id, job_metas))
+            continue
+
+        teqc = Teqc(files[0], job_metas[files[0]])
+
+        if len(files) > 1:
+            teqc.splice(files[1:], metas=job_metas)
+
+        outputs = [os.path.normpath(f) for f in teqc.output_files(site_id, decimate) if f is not None]
+        taken   = [f for f in outputs if f in claimed]
+
+        if taken:
+            skipped.append((raw_file, "`%s' is written by `%s' already" % (taken[0], job_name(claimed[taken[0]]))))
+            continue
+
+        for f in outputs:
+            claimed[f] = raw_file
+
+        keep.append((raw_file, site_id, job_metas))
+
+    return (keep, skipped)
+
+def raw2rinex_job(job):
+    '''
+        runs raw2rinex() in a worker process, errors are returned (see job_error())
+    '''
+    (raw_file, site_id, metas) = job
+
+    if worker_error is not None:
+        return (raw_file, None, False, worker_error)
+
+    Logger.info("-"*80)
+    Logger.info("Info: Working on file `%s' for site `%s'" % (job_name(raw_file), site_id))
+
+    try:
+        (times, hit) = raw2rinex(raw_file, site_id, worker_sta_db, worker_cache, worker_decimate, metas)
+    except (Exception, CleanShutdownRequest) as e:
+        return (raw_file, None, False, job_error(e))
+
+    return (raw_file, times, hit, None)
+
+def run_batch(jobs, workers, quiet, sta_db, cache=None, single=False, timeout=None, decimate=None, splice=False):
+    '''
+        translates jobs with station.info sta_db on a pool of worker processes
+        (which open sta_db's file themselves), or with single from
+        this process, which then keeps teqc and gzip of up to workers files
+        running (see TeqcRunner), killing files after timeout seconds. The
+        meta information of all files is read first (on the pool), to claim
+        the output files of each job. Jobs that would write the files of an
+        earlier job are skipped and count as failed. With splice, files of 
+        the same site-day are translated together (see splice_jobs()).
+    '''
+    start   = time.time()
+    failed  = []
+    totals  = dict((s, 0.0) for s in stages)
+    done    = 0
+    pool    = multiprocessing.Pool(workers, init_worker, 
+                                   (quiet, sta_db.sta_db, cache is not None, cache is not None and cache.content_hash, decimate))
+
+    try:
+        (metas, totals['meta']) = read_metas(jobs, pool, cache)
+
+        if splice:
+            jobs = splice_jobs(jobs, metas)
+
+        (planned, skipped)      = claim_outputs(jobs, metas, decimate)
+
+        for (raw_file, error) in skipped:
+            failed.append(raw_file)
+            sys.stderr.write("Error: skipping `"+job_name(raw_file)+"': "+error+"\n")
+
+        if single:
+            pool.close()
+            pool.join()
+            pool    = None
+
+            runner  = TeqcRunner(lambda teqc, site_id: site_record(teqc, site_id, sta_db), setup_teqc, workers, timeout, cache, decimate)
+            results = runner.run(planned)
+
+            #kill what is running, skip the rest
+            signal.signal(signal.SIGTERM, lambda signum, frame: runner.cancel())
+        else:
+            results = pool.imap_unordered(raw2rinex_job, planned)
+
+        for (raw_file, times, hit, error) in results:
+            if error:
+                failed.append(raw_file)
+                sys.stderr.write("Error: translating `"+job_name(raw_file)+"' failed: "+error+"\n")
+            else:
+                done += 1
+                for s in stages:
+                    totals[s] += times[s]
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    elapsed = time.time() - start
+
+    print "Translated %d of %d files in %.2f s (%.2f files/sec) with %d workers, %d failed." % \
+            (done, len(jobs), elapsed, done/elapsed if elapsed > 0 else 0.0, workers, len(failed))
+
+    for s in stages:
+        print "  %-10s %9.2f s total %9.3f s/file" % (s, totals[s], totals[s]/done if done else 0.0)
+
+    if cache is not None:
+        cache.evict()
+        print cache.summary()
+
+    return len(failed)
+
+############# ############# #############
 ############# MAIN STUFF
-############# ############# ############# 
+############# ############# #############
 
 if __name__ == '__main__':
 
-    raw_file = None
-    site_id  = None
+    raw_file     = None
+    site_id      = None
+    batch        = None
+    manifest     = None
+    quiet        = False
+    use_cache    = True
+    content_hash = False
+    workers      = multiprocessing.cpu_count()
+    single       = False
+    timeout      = None
+    splice       = False
+    decimate     = None
 
 ##read command line
     try:
         #rg ":" and "=" indicate that these parameters take arguments! Do not simply delete these!
-        opts, args = getopt.getopt(sys.argv[1:], "s:f:hq", ["site=", "file=", "help", "quiet"])
+        opts, args = getopt.getopt(sys.argv[1:], "s:f:hqb:m:j:t:d:", ["site=", "file=", "help", "quiet", "batch=", "manifest=", "jobs=", "no-cache", "content-hash", "single", "timeout=",
+                                                            "splice", "decimate="])
     except getopt.GetoptError as e:
         sys.stderr.write("Error: {0} \n\n".format(e.msg))
         usage()
@@ -53,10 +434,63 @@ if __name__ == '__main__':
 #quite
         elif opt in ("-q", "--quiet"):
             Logger.off()
+            quiet = True
+#batch
+        elif opt in ("-b", "--batch"):
+            batch = arg
+        elif opt in ("-m", "--manifest"):
+            manifest = arg
+        elif opt in ("-j", "--jobs"):
+            workers = int(arg)
+        elif opt in ("--single",):
+            single = True
+        elif opt in ("-t", "--timeout"):
+            timeout = float(arg)
+#high-rate days
+        elif opt in ("--splice",):
+            splice = True
+        elif opt in ("-d", "--decimate"):
+            decimate = float(arg)
+#meta cache
+        elif opt in ("--no-cache",):
+            use_cache = False
+        elif opt in ("--content-hash",):
+            content_hash = True
 #unknown
         else:
             assert False, "unhandled option: `%s'" % opt
 
+##batch mode
+    if batch or manifest:
+        if raw_file or (batch and manifest):
+            sys.stderr.write("\nError: use one of `file', `batch', and `manifest'.\n\n")
+            usage()
+            sys.exit(2)
+
+        if workers < 1:
+            sys.stderr.write("\nError: need at least 1 worker.\n\n" )
+            sys.exit(2)
+
+        if batch:
+            jobs = [(f, site_id) for (f, s) in batch_files(batch)]
+        else:
+            jobs = [(f, s or site_id) for (f, s) in manifest_files(manifest)]
+
+        if not jobs:
+            sys.stderr.write("\nError: no raw files found.\n\n")
+            sys.exit(2)
+
+        #check station.info before starting any workers
+        try:
+            sta_db = StationDB() if single else MappedStationDB()
+        except CleanShutdownRequest:
+            print "Aborting."
+            sys.exit(1)
+
+        cache = MetaCache(content_hash=content_hash) if use_cache else None
+
+        sys.exit(1 if run_batch(jobs, workers, quiet, sta_db, cache, single, timeout, decimate, splice) else 0)
+
     Logger.info("-"*80)
     Logger.info("Info: Working on file `%s' for site `%s'" % (raw_file, site_id))
 
@@ -68,56 +502,10 @@ if __name__ == '__main__':
     except CleanShutdownRequest:
         print "Aborting."
         sys.exit()
-    
-#+# create teqc object
-    teqc    = None 
 
+#+# translate
     try:
-        teqc = Teqc(raw_file)
+        raw2rinex(raw_file, site_id, sta_db, MetaCache(content_hash=content_hash) if use_cache else None, decimate)
     except CleanShutdownRequest:
         print "Aborting."
         sys.exit()
-
-    teqc.operator   = "Ronni Grapenthin"
-    teqc.agency     = "New Mexico Tech"
-
-    teqc.add_commentLine("")
-    teqc.add_commentLine("For more information about these data contact:")
-    teqc.add_commentLine("")
-    teqc.add_commentLine("Ronni Grapenthin (rg@nmt.edu)")
-    teqc.add_commentLine("         Dept. Earth and Environmental Scienes")
-    teqc.add_commentLine("         New Mexico Tech")
-    teqc.add_commentLine("         801 Leroy Pl")
-    teqc.add_commentLine("         Socorro, NM-87801")
-    teqc.add_commentLine("")
-
-    teqc.add_sv_string("-R -E -S -C -J")
-    teqc.add_observables_string("+P +L2 +L1_2 +C2 +L2_2 +CA_L1 +L2C_L2")
-    
-    #get meta information from raw file
-    meta = teqc.meta()
-
-    #some info for the user...
-    if meta[const.TEQC_sample_int] > 1.0:
-        Logger.info("Info: Standard rate sampling (%s sec)" % (meta[const.TEQC_sample_int]) )
-
-    if meta[const.TEQC_sample_int] <= 1.0:
-        Logger.info("Info: High rate sampling (%s sec)" % (meta[const.TEQC_sample_int]) )
-
-    if meta[const.TEQC_sta_id] != site_id:
-        Logger.info("Info: Given site-id `%s' overrides site-id in receiver file `%s' " % (site_id, meta[const.TEQC_sta_id]))
-
-
-    #extract the record that spans the correct time from station.info
-    rec = sta_db.get_record(site_id=site_id, start_time=meta[const.TEQC_f_start], end_time=meta[const.TEQC_f_end])
-    rec.calculate_vertical_antenna_height()
-
-    if not rec.operator:
-        rec.operator = teqc.operator
-    if not rec.agency:
-        rec.agency   = teqc.agency
-
-    Logger.info("Info: Using site-record `%s'" % rec)
-    
-    teqc.translate(rec)
-    
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+#
+#      raw_catalog.py
+#
+##BRIEF
+# raw_catalog.py builds and queries the SQLite catalog of teqc +meta information of a raw data tree
+#
+##AUTHOR
+# Ronni Grapenthin
+#
+##DATE
+# 2026-10-17
+#
+##DETAILS
+# -r runs teqc +meta on all raw files under a directory that are new or changed
+# (by size and mtime) since the last refresh, on a pool of workers, and drops
+# files that are gone. Queries then go to the catalog only, e.g., all 1 Hz files
+# of site P123 for 2015 doy 100 - 120:
+#
+#   raw_catalog.py -s P123 -y 2015 -d 100-120 -i 1
+#
+# or all files whose 4-char code has no station.info record for their time span:
+#
+#   raw_catalog.py -M -y 2015
+#
+##CHANGELOG
+#
+###########################################################################
+
+import sys, getopt, os
+import datetime as DT
+import multiprocessing
+from classes.RawCatalog import RawCatalog
+from classes.MetaCache import MetaCache
+
+def usage():
+    print "Usage: raw_catalog.py [-h | --help] [-r | --refresh <directory>] [-p | --pattern <glob>] [-j | --jobs <N>]\n\
+                      [--no-cache] [--content-hash] [-c | --catalog <file>]\n\
+                      [-s | --site <site-id>] [-y | --year <YYYY> [-d | --doy <DDD[-DDD]>]]\n\
+                      [--from <YYYY-MM-DD>] [--to <YYYY-MM-DD>] [-i | --interval <sec>]\n\
+                      [-M | --mismatch] [-F | --failures]\n\
+raw_catalog.py, GPStools\n\n\
+Author: rn grapenthin, New Mexico Tech\n\n\
+OPTIONS:\n\
+   -h, --help\t\tprint this help\n\
+   -r, --refresh\t\tcatalog new and changed raw files under this directory\n\
+   -p, --pattern\t\tonly files matching this glob pattern (default: *)\n\
+   -j, --jobs\t\tnumber of teqc processes (default: number of cpus)\n\
+       --no-cache\t\tdon't use the teqc +meta cache ($TEQC_META_CACHE)\n\
+       --content-hash\tidentify files in the meta cache by content\n\
+   -c, --catalog\t\tcatalog file (default: raw_catalog.sqlite)\n\
+   -s, --site\t\tonly files of this 4-char site id\n\
+   -y, --year\t\tonly files covering part of this year\n\
+   -d, --doy\t\tonly files covering part of this day or range of days of year\n\
+       --from\t\tonly files ending on or after this date\n\
+       --to\t\tonly files starting on or before this date\n\
+   -i, --interval\tonly files sampled at this interval (sec) or faster\n\
+   -M, --mismatch\tonly files without a station.info record for their 4-char code and time span\n\
+   -F, --failures\tlist files teqc couldn't read\n\n\
+Report bugs to rg@nmt.edu\n\
+"
+
+def to_text(value):
+    if value is None:
+        return '-'
+    if isinstance(value, DT.datetime):
+        return value.strftime('%Y-%m-%dT%H:%M:%S')
+    if isinstance(value, float):
+        return "%g" % value
+    return str(value)
+
+def print_rows(rows):
+    for row in rows:
+        print "\t".join(to_text(v) for v in row)
+
+def doy_window(year, doys):
+    '''
+        [start, end] of a year, a day of that year, or range of days (`DDD-DDD')
+    '''
+    if doys is None:
+        return (DT.datetime(year, 1, 1), DT.datetime(year+1, 1, 1) - DT.timedelta(seconds=1))
+
+    (first, sep, last) = doys.partition('-')
+    first = int(first)
+    last  = int(last) if sep else first
+
+    start = DT.datetime(year, 1, 1) + DT.timedelta(days=first-1)
+    end   = DT.datetime(year, 1, 1) + DT.timedelta(days=last) - DT.timedelta(seconds=1)
+
+    return (start, end)
+
+############# ############# #############
+############# MAIN STUFF
+############# ############# #############
+
+if __name__ == '__main__':
+    try:
+        #":" and "=" indicate that these parameters take arguments! Do not simply delete these!
+        opts, args = getopt.getopt(sys.argv[1:], "hr:p:j:c:s:y:d:i:MF",["help", "refresh=", "pattern=", "jobs=", "no-cache", "content-hash",
+                                                                      "catalog=", "site=", "year=", "doy=", "from=", "to=", "interval=",
+                                                                      "mismatch", "failures"])
+    except getopt.GetoptError as e:
+        sys.stderr.write("Error: {0} \n\n".format(e.msg))
+        usage()
+        sys.exit(2)
+
+    ##variables used here
+    root                = None
+    pattern             = '*'
+    workers             = multiprocessing.cpu_count()
+    use_cache           = True
+    content_hash        = False
+    db_file             = 'raw_catalog.sqlite'
+    site                = None
+    year                = None
+    doys                = None
+    start               = None
+    end                 = None
+    interval            = None
+    mismatch            = False
+    failures            = False
+
+##interpret command line
+    try:
+        for opt, arg in opts:
+#HELP
+            if opt in ("-h", "--help"):
+                usage()
+                sys.exit(2)
+#refresh
+            elif opt in ("-r", "--refresh"):
+                root = arg
+            elif opt in ("-p", "--pattern"):
+                pattern = arg
+            elif opt in ("-j", "--jobs"):
+                workers = int(arg)
+            elif opt in ("--no-cache",):
+                use_cache = False
+            elif opt in ("--content-hash",):
+                content_hash = True
+#catalog file
+            elif opt in ("-c", "--catalog"):
+                db_file = arg
+#queries
+            elif opt in ("-s", "--site"):
+                site = arg.upper()
+            elif opt in ("-y", "--year"):
+                year = int(arg)
+            elif opt in ("-d", "--doy"):
+                doys = arg
+            elif opt in ("--from",):
+                start = DT.datetime.strptime(arg, '%Y-%m-%d')
+            elif opt in ("--to",):
+                #whole day
+                end = DT.datetime.strptime(arg, '%Y-%m-%d') + DT.timedelta(days=1, seconds=-1)
+            elif opt in ("-i", "--interval"):
+                interval = float(arg)
+            elif opt in ("-M", "--mismatch"):
+                mismatch = True
+            elif opt in ("-F", "--failures"):
+                failures = True
+#unknown
+            else:
+                assert False, "unhandled option: `%s'" % opt
+
+        if year is not None:
+            (start, end) = doy_window(year, doys)
+        elif doys is not None:
+            raise ValueError("--doy needs --year")
+    except ValueError as e:
+        sys.stderr.write("\nError: %s\n\n" % e)
+        usage()
+        sys.exit(2)
+
+##consistency checks
+    if root is not None and not os.path.isdir(root):
+        sys.stderr.write("\nError: `%s' is not a directory.\n\n" % root)
+        sys.exit(2)
+
+    if workers < 1:
+        sys.stderr.write("\nError: need at least 1 worker.\n\n" )
+        sys.exit(2)
+
+    catalog = RawCatalog(db_file)
+
+##get going ...
+    if root is not None:
+        cache = MetaCache(content_hash=content_hash) if use_cache else None
+
+        (updated, removed, unchanged, failed) = catalog.refresh(root, pattern, workers, cache)
+        sys.stderr.write("Catalog `%s': %d files cataloged (%d failed), %d removed, %d unchanged.\n" % \
+                            (catalog.db_file, updated, failed, removed, unchanged))
+
+        if cache is not None:
+            cache.evict()
+            sys.stderr.write(cache.summary()+"\n")
+
+    if failures:
+        print_rows(catalog.failures())
+    elif mismatch:
+        from classes.StationDB import StationDB
+        print_rows(catalog.mismatches(StationDB(), site, start, end))
+    elif root is None or site or start or end or interval:
+        print_rows(catalog.files(site, start, end, interval))
+
+    catalog.close()
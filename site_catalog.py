@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+#
+#      site_catalog.py
+#
+##BRIEF
+# site_catalog.py builds and queries the SQLite catalog of all XML site logs in GPS_SITE_DOC
+#
+##AUTHOR
+# Ronni Grapenthin
+#
+##DATE
+# 2026-10-17
+#
+##DETAILS
+# -r (re-)indexes logs that are new or changed since the last refresh (by mtime).
+# Queries then go to the catalog only, e.g., all stations that had a TRM59800.00
+# during 2014:
+#
+#   site_catalog.py -r -a 'TRM59800.00%' --from 2014-01-01 --to 2014-12-31
+#
+##CHANGELOG
+#
+###########################################################################
+
+import sys, getopt, os
+import datetime as DT
+from classes.SiteCatalog import SiteCatalog
+
+def usage():
+    print "Usage: site_catalog.py [-h | --help] [-r | --refresh] [-c | --catalog <file>] [-l | --list]\n\
+                       [-a | --antenna <type>] [-R | --receiver <type>] [-s | --site <site-id>]\n\
+                       [--from <YYYY-MM-DD>] [--to <YYYY-MM-DD>] [-F | --failures]\n\
+site_catalog.py, GPStools\n\n\
+Author: rn grapenthin, New Mexico Tech\n\n\
+OPTIONS:\n\
+   -h, --help\t\tprint this help\n\
+   -r, --refresh\t\tindex new and changed logs in $GPS_SITE_DOC\n\
+   -c, --catalog\t\tcatalog file (default: $GPS_SITE_DOC/site_catalog.sqlite)\n\
+   -l, --list\t\tlist all sites with their positions\n\
+   -a, --antenna\t\tlist antennas of this type (SQL LIKE pattern, `%' matches all)\n\
+   -R, --receiver\tlist receivers of this type (SQL LIKE pattern, `%' matches all)\n\
+   -s, --site\t\trestrict antennas / receivers to this 4-char site id\n\
+       --from\t\tonly equipment in use during this period, starting on this date\n\
+       --to\t\tonly equipment in use during this period, ending on this date\n\
+   -F, --failures\tlist logs that couldn't be indexed\n\n\
+Report bugs to rg@nmt.edu\n\
+"
+
+def to_text(value):
+    if value is None:
+        return '-'
+    if isinstance(value, DT.datetime):
+        return value.strftime('%Y-%m-%dT%H:%M')
+    if isinstance(value, float):
+        return "%.4f" % value
+    return value
+
+def print_rows(rows):
+    for row in rows:
+        print "\t".join(to_text(v) for v in row)
+
+############# ############# #############
+############# MAIN STUFF
+############# ############# #############
+
+if __name__ == '__main__':
+    try:
+        #":" and "=" indicate that these parameters take arguments! Do not simply delete these!
+        opts, args = getopt.getopt(sys.argv[1:], "hrc:la:R:s:F",["help", "refresh", "catalog=", "list", "antenna=", "receiver=", "site=", "from=", "to=", "failures"])
+    except getopt.GetoptError as e:
+        sys.stderr.write("Error: {0} \n\n".format(e.msg))
+        usage()
+        sys.exit(2)
+
+    ##variables used here
+    refresh             = False
+    db_file             = None
+    list_sites          = False
+    antenna             = None
+    receiver            = None
+    site                = None
+    start               = None
+    end                 = None
+    failures            = False
+
+##interpret command line
+    for opt, arg in opts:
+#HELP
+        if opt in ("-h", "--help"):
+            usage()
+            sys.exit(2)
+#refresh
+        elif opt in ("-r", "--refresh"):
+            refresh = True
+#catalog file
+        elif opt in ("-c", "--catalog"):
+            db_file = arg
+#list
+        elif opt in ("-l", "--list"):
+            list_sites = True
+#antenna
+        elif opt in ("-a", "--antenna"):
+            antenna = arg
+#receiver
+        elif opt in ("-R", "--receiver"):
+            receiver = arg
+#site
+        elif opt in ("-s", "--site"):
+            site = arg.lower()
+#time window
+        elif opt in ("--from", "--to"):
+            try:
+                date = DT.datetime.strptime(arg, '%Y-%m-%d')
+            except ValueError:
+                sys.stderr.write("\nError: `"+arg+"' is not a date of format YYYY-MM-DD.\n\n")
+                sys.exit(2)
+
+            if opt == "--from":
+                start = date
+            else:
+                #whole day
+                end = date + DT.timedelta(days=1, minutes=-1)
+#failures
+        elif opt in ("-F", "--failures"):
+            failures = True
+#unknown
+        else:
+            assert False, "unhandled option: `%s'" % opt
+
+##consistency checks
+if not (refresh or list_sites or antenna or receiver or failures):
+    sys.stderr.write("\nError: nothing to do. Refresh the catalog or query it.\n\n")
+    usage()
+    sys.exit(2)
+
+try:
+    catalog = SiteCatalog(db_file)
+except Exception as e:
+    sys.stderr.write("\nError: %s\n\n" % e)
+    sys.exit(2)
+
+##get going ...
+if refresh:
+    (updated, removed, unchanged, failed) = catalog.refresh()
+    sys.stderr.write("Catalog `%s': %d logs indexed (%d failed), %d removed, %d unchanged.\n" % \
+                        (catalog.db_file, updated, failed, removed, unchanged))
+
+if list_sites:
+    print_rows(catalog.sites())
+
+if antenna:
+    print_rows(catalog.antennas(type=antenna, site=site, start=start, end=end))
+
+if receiver:
+    print_rows(catalog.receivers(type=receiver, site=site, start=start, end=end))
+
+if failures:
+    print_rows(catalog.failures())
+
+catalog.close()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+#
+#      slant2vert.py
+#
+##BRIEF
+# slant2vert.py converts measured antenna heights to vertical heights to the ARP
+#
+##AUTHOR
+# Ronni Grapenthin
+#
+##DATE
+# 2026-10-17
+#
+##DETAILS
+# Same arguments and output as slant2vert_height.sh, but the conversion is done
+# with the table in $GIPSY_STA_INFO/antenna_heights.dat (see classes/AntennaHeight.py).
+# With -c every entry of the table is converted for a range of heights by both
+# and the results are compared.
+#
+##CHANGELOG
+#
+###########################################################################
+
+import sys, getopt, os
+from classes.AntennaHeight import AntennaHeights, script_vertical_height
+
+def usage():
+    print "Usage: slant2vert.py [-h | --help] [-t | --table <file>] <height> <antenna type> <height code>\n\
+       slant2vert.py [-h | --help] [-t | --table <file>] -c | --check\n\
+slant2vert.py, GPStools\n\n\
+Author: rn grapenthin, New Mexico Tech\n\n\
+OPTIONS:\n\
+   -h, --help\t\tprint this help\n\
+   -t, --table\t\tconversion table (default: $GIPSY_STA_INFO/antenna_heights.dat)\n\
+   -c, --check\t\tcompare all table entries against slant2vert_height.sh\n\n\
+Report bugs to rg@nmt.edu\n\
+"
+
+#heights the check runs for, in m
+check_heights = [0.5 + 0.0625*i for i in range(25)]
+
+def check(heights, tolerance=0.00005):
+    '''
+        compares the table against slant2vert_height.sh, returns number of mismatches
+    '''
+    failed = 0
+
+    for (ant_type, ht_code) in sorted(heights.table):
+        for h in check_heights:
+            try:
+                vert = heights.vertical(h, ant_type, ht_code)
+            except ValueError:
+                #slant shorter than the radius
+                continue
+
+            ref = script_vertical_height(h, ant_type, ht_code)
+
+            if abs(vert - ref) > tolerance:
+                failed += 1
+                print "%-16s %-6s %8.4f: %9.4f, slant2vert_height.sh: %9.4f" % (ant_type, ht_code, h, vert, ref)
+
+    print "%d table entries, %d heights each, %d mismatches" % (len(heights.table), len(check_heights), failed)
+
+    return failed
+
+############# ############# #############
+############# MAIN STUFF
+############# ############# #############
+
+if __name__ == '__main__':
+    try:
+        #":" and "=" indicate that these parameters take arguments! Do not simply delete these!
+        opts, args = getopt.getopt(sys.argv[1:], "ht:c",["help", "table=", "check"])
+    except getopt.GetoptError as e:
+        sys.stderr.write("Error: {0} \n\n".format(e.msg))
+        usage()
+        sys.exit(2)
+
+    table_file  = None
+    run_check   = False
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage()
+            sys.exit(2)
+        elif opt in ("-t", "--table"):
+            table_file = arg
+        elif opt in ("-c", "--check"):
+            run_check = True
+        else:
+            assert False, "unhandled option: `%s'" % opt
+
+    if not run_check and len(args) != 3:
+        usage()
+        sys.exit(2)
+
+    try:
+        heights = AntennaHeights(table_file)
+    except (IOError, ValueError) as e:
+        sys.stderr.write("\nError: %s\n\n" % e)
+        sys.exit(2)
+
+    if run_check:
+        sys.exit(1 if check(heights) else 0)
+
+    try:
+        print "%.4f" % heights.vertical(float(args[0]), args[1], args[2])
+    except ValueError as e:
+        sys.stderr.write("\nError: %s\n\n" % e)
+        sys.exit(2)
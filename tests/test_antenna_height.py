@@ -0,0 +1,70 @@
+#####################################################################################
+# test_antenna_height.py part of GPStools
+#
+# AntennaHeights has to give the vertical heights slant2vert_height.sh gives for
+# the antennas in its table.
+#
+# run from the top-level directory: python -m unittest discover tests
+#
+#####################################################################################
+
+import os
+import unittest
+from distutils.spawn import find_executable
+
+from classes.AntennaHeight import AntennaHeights, script_vertical_height
+from classes.StationDB import StationRecord
+
+#conversion table of the antennas below
+table_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'antenna_heights.dat')
+
+#(measured height, antenna type, height code, vertical height from slant2vert_height.sh)
+known = [(1.5000, 'TRM29659.00', 'SLBCR', 1.4529),
+         (0.3000, 'TRM29659.00', 'SLBCR', 0.1968),
+         (1.2345, 'TRM29659.00', 'DHBCR', 1.2345),
+         (1.0000, 'TRM41249.00', 'SLBGP', 0.9507),
+         (0.5000, 'TRM41249.00', 'SLBGP', 0.4432),
+         (0.0830, 'TRM41249.00', 'DHARP', 0.0830)]
+
+line = " S001  SITES001          2001 100 12  0  0  9999 999  0  0  0   0.0830  DHARP   0.0000   0.0000  TRIMBLE NETRS         1.1-2 19 Apr 2005      1.15  4545K01234            TRM41249.00      NONE   --------------------\n"
+
+class AntennaHeightTest(unittest.TestCase):
+
+    def setUp(self):
+        self.heights = AntennaHeights(table_file)
+
+    def test_known_heights(self):
+        for (ant_ht, ant_type, ht_code, vert_ht) in known:
+            self.assertAlmostEqual(self.heights.vertical(ant_ht, ant_type, ht_code), vert_ht, places=4)
+
+    def test_array(self):
+        (ant_ht, ant_type, ht_code, vert_ht) = zip(*known)
+
+        for (v, expected) in zip(self.heights.vertical_array(ant_ht, ant_type, ht_code), vert_ht):
+            self.assertAlmostEqual(v, expected, places=4)
+
+    def test_not_in_table(self):
+        self.assertFalse(self.heights.covers('TRM41249.00', 'SLBCR'))
+        self.assertRaises(ValueError, self.heights.vertical, 1.0, 'TRM41249.00', 'SLBCR')
+
+    def test_dharp_record(self):
+        #DHARP heights are vertical to the ARP already, with or without a table entry
+        rec = StationRecord(line)
+        rec.calculate_vertical_antenna_height(self.heights)
+
+        self.assertEqual(rec.vert_ht, 0.083)
+
+    @unittest.skipUnless(find_executable('slant2vert_height.sh'), "slant2vert_height.sh not installed")
+    def test_default_table_matches_script(self):
+        try:
+            heights = AntennaHeights()
+        except IOError:
+            self.skipTest("no antenna_heights.dat in $GIPSY_STA_INFO")
+
+        for (ant_type, ht_code) in heights.table:
+            for ant_ht in (1.0, 1.5):
+                self.assertAlmostEqual(heights.vertical(ant_ht, ant_type, ht_code),
+                                       script_vertical_height(ant_ht, ant_type, ht_code), places=4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+#####################################################################################
+# test_station_table.py part of GPStools
+#
+# StationTable skips malformed station.info lines instead of failing the load.
+#
+# run from the top-level directory: python -m unittest discover tests
+#
+#####################################################################################
+
+import os
+import shutil
+import tempfile
+import datetime
+import unittest
+
+import numpy as np
+
+from classes.StationTable import StationTable, OPEN_END
+
+header  = "*SITE  Station Name      Session Start      Session Stop       Ant Ht   HtCod  Ant N    Ant E    Receiver Type\n"
+good    = [" S000  SITES000          1995  68  0  0  0  1995 301 23 59 59   0.0000  DHARP   0.0000   0.0000  TPS NETG3             3.4 EG3 Jul,02,2010    3.40  --------------------  TRM29659.00      GSI    --------------------\n",
+           " S000  SITES000          1995 302  0  0  0  9999 999  0  0  0   0.0830  DHARP   0.0000   0.0000  TPS NETG3             3.4 EG3 Jul,02,2010    3.40  --------------------  TRM29659.00      GSI    --------------------\n",
+           " S001  SITES001          2001 100 12  0  0  9999 999  0  0  0   1.0000  DHARP   0.0000   0.0000  TRIMBLE NETRS         1.1-2 19 Apr 2005      1.15  4545K01234            TRM41249.00      NONE   --------------------\n"]
+#session start with a letter in the day of year, height that isn't a number,
+#day of year and hour out of range
+corrupt = [" S002  SITES002          2003 1x0  0  0  0  9999 999  0  0  0   0.0000  DHARP   0.0000   0.0000  TPS NETG3             3.4 EG3 Jul,02,2010    3.40  --------------------  TRM29659.00      GSI    --------------------\n",
+           " S003  SITES003          2003 100  0  0  0  9999 999  0  0  0   0.00?0  DHARP   0.0000   0.0000  TPS NETG3             3.4 EG3 Jul,02,2010    3.40  --------------------  TRM29659.00      GSI    --------------------\n",
+           " S004  SITES004          2003 367  0  0  0  9999 999  0  0  0   0.0000  DHARP   0.0000   0.0000  TPS NETG3             3.4 EG3 Jul,02,2010    3.40  --------------------  TRM29659.00      GSI    --------------------\n",
+           " S005  SITES005          2003 100  0  0  0  2003 200 24  0  0   0.0000  DHARP   0.0000   0.0000  TPS NETG3             3.4 EG3 Jul,02,2010    3.40  --------------------  TRM29659.00      GSI    --------------------\n"]
+
+class MalformedLineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def table(self, lines):
+        sta_db = os.path.join(self.tmp_dir, 'station.info')
+
+        with open(sta_db, 'w') as f:
+            f.write(header+''.join(lines))
+
+        return StationTable(sta_db)
+
+    def test_clean(self):
+        s = self.table(good).sessions
+
+        self.assertEqual(list(s['site_id']), ['S000', 'S000', 'S001'])
+        self.assertEqual(s['sess_start'][2], np.datetime64(datetime.datetime(2001, 4, 10, 12), 's'))
+        self.assertEqual(s['sess_end'][1], OPEN_END)
+        self.assertEqual(s['ant_ht'][1], 0.083)
+        self.assertEqual(s['rcx_type'][2], 'TRIMBLE NETRS')
+
+    def test_corrupt_lines_skipped(self):
+        clean = self.table(good).sessions
+
+        for lines in ([corrupt[0]]+good, good[:1]+corrupt+good[1:], good+[corrupt[1]]):
+            self.assertEqual(self.table(lines).sessions.tolist(), clean.tolist())
+
+    def test_only_corrupt_lines(self):
+        self.assertEqual(len(self.table(corrupt).sessions), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+#####################################################################################
+# test_xml_logreader.py part of GPStools
+#
+# XML_LogReader has to give the same answers whether it reads a log from the
+# XML or from its JSON sidecar.
+#
+# run from the top-level directory: python -m unittest discover tests
+#
+#####################################################################################
+
+import os
+import glob
+import shutil
+import tempfile
+import unittest
+
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+from classes.IGSLog import IGSLog
+from classes.SiteLog import json_name, write_sidecar
+from classes.XML_LogReader import XML_LogReader
+
+#sample IGS logs
+log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+accessors = ('site', 'year', 'month', 'day', 'hour', 'minute', 'second', 'first_installed',
+             'XPos', 'YPos', 'ZPos', 'comment', 'site_name', 'site_full_name', 'url',
+             'archive', 'local_log', 'loc_city', 'loc_state', 'loc_country')
+
+class SidecarTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def readers(self, log_file):
+        '''
+            (reader of the sidecar, reader of the XML) of an IGS log
+        '''
+        site        = os.path.basename(log_file)[0:4]
+        xml_file    = os.path.join(self.tmp_dir, site+'.xml')
+
+        log = IGSLog(log_file, site)
+        log.parse()
+        log.write(xml_file)
+        write_sidecar(xml_file, log.root)
+
+        from_json = XML_LogReader(xml_file, site)
+        self.assertTrue(from_json.model is not None and from_json.dom is None)
+
+        os.remove(json_name(xml_file))
+
+        from_xml = XML_LogReader(xml_file, site)
+        self.assertTrue(from_xml.model is None)
+
+        return (from_json, from_xml)
+
+    def call(self, reader, name, *args):
+        try:
+            return getattr(reader, name)(*args)
+        except IndexError:
+            return IndexError
+
+    def test_same_answers(self):
+        log_files = sorted(glob.glob(os.path.join(log_dir, '*.log')))
+        self.assertTrue(log_files)
+
+        for log_file in log_files:
+            (from_json, from_xml) = self.readers(log_file)
+
+            self.assertEqual(from_json.index, from_xml.index)
+
+            for path in from_xml.index:
+                self.assertEqual(from_json.text(path), from_xml.text(path), path)
+
+            for name in accessors:
+                self.assertEqual(self.call(from_json, name), self.call(from_xml, name), "%s: %s" % (log_file, name))
+
+            for which in ('city-town', 'state-province', 'country', 'tectonic-plate'):
+                self.assertEqual(self.call(from_json, 'location', which), self.call(from_xml, 'location', which), which)
+
+            for direction in ('east', 'north', 'up'):
+                self.assertEqual(from_json.arp_vector(direction), from_xml.arp_vector(direction), direction)
+
+            self.assertEqual([dict(a) for a in from_json.antennas()], [dict(a) for a in from_xml.antennas()])
+            self.assertEqual([dict(r) for r in from_json.receivers()], [dict(r) for r in from_xml.receivers()])
+            self.assertEqual(ET.tostring(from_json.root), ET.tostring(from_xml.root))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -20,7 +20,9 @@ TEQC_rcx_firm       = 'receiver firmware'
 
 TEQC_date_format    = '%Y-%m-%d %H:%M:%S.%f'
 
-TEQC_format_translation_map = {'Trimble .dat':'-tr d'}
+#RINEX is read by teqc without format options, file formats as in teqc +meta
+#and RinexHeader.read_meta()
+TEQC_format_translation_map = {'Trimble .dat':'-tr d', 'RINEX':'', 'RINEX 3':''}
 
 GPSweek             = 'gpsweek'
 
@@ -3,6 +3,8 @@ import urllib
 sys.path.append( '../classes' )
 
 from classes.IGSLog import IGSLog
+from classes.LogCache import LogCache
+from classes.SiteLog import json_name, write_sidecar
 
 databases = {}
 
@@ -83,10 +85,29 @@ def get_site_log(archive='', site='', url=''):
     if logfile:
         local_log = site+"."+file_from+".log"
         xml_log   = site+".xml"
-        log = IGSLog(logfile, site)
-        log.parse()
+        log   = IGSLog(logfile, site)
+        cache = LogCache()
+
+        #logs change rarely, don't parse them again if we've seen this one
+        if cache.enabled():
+            key    = cache.key(logfile)
+            cached = cache.lookup(site, key)
+
+            if cached:
+                log.load(cached)
+            else:
+                log.parse()
+                log.write(xml_log)
+                cache.store(site, key, xml_log)
+
+            cache.record(cached is not None)
+            cache.evict()
+        else:
+            log.parse()
+
         log.retrieved_from(file_from, file_url, local_log)
         log.write(xml_log)
+        write_sidecar(xml_log, log.root)
         
         #move files to site doc archive
         dest = os.environ.get('GPS_SITE_DOC')
@@ -96,5 +117,14 @@ def get_site_log(archive='', site='', url=''):
             #os.rename won't copy across partitions
             shutil.move(logfile, dest+"/"+local_log)
             shutil.move(xml_log, dest+"/"+xml_log)
+            shutil.move(json_name(xml_log), dest+"/"+json_name(xml_log))
         else:
             print "Environment variable 'GPS_SITE_DOC' not set. logfiles remain in current directory."
+
+def job_error(e):
+    '''
+        exception e as `Type: message' for the results of batch jobs. Batch jobs
+        return their errors rather than raise them, so that one bad input doesn't 
+        take down the whole batch; the batch reports and counts them at the end.
+    '''
+    return "%s: %s" % (type(e).__name__, e)